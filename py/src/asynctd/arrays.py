@@ -0,0 +1,19 @@
+"""
+Optional NumPy support.
+
+NumPy isn't a dependency: arrays are recognized by type without
+importing NumPy, which is only imported to handle arrays already given.
+"""
+
+from typing import Any
+
+
+def is_ndarray(value:Any):
+    """Check if value is a NumPy array, without importing NumPy."""
+    return type(value).__module__ == 'numpy' and \
+        type(value).__name__ == 'ndarray'
+
+
+def numpy_module():
+    """Return the NumPy module, once an array was seen."""
+    return __import__('numpy')
@@ -0,0 +1,290 @@
+"""
+Content-addressed cache of chunk results.
+
+Results are keyed by the identity of the function (module, qualified
+name, bytecode, defaults and the values its closure captured) and a
+stable hash of the chunk's args, so calls on overlapping inputs reuse
+the results of the chunks they share. Functions whose closure can't be
+hashed stably aren't cached.
+An in-memory tier is bounded in entries (LRU) and age (TTL), an
+optional sqlite file keeps results across processes and runs.
+"""
+
+import array
+import hashlib
+import pickle
+import sqlite3
+import threading
+import time
+import types
+from collections import OrderedDict
+from collections.abc import Mapping, Sequence, Set
+from typing import Any, Callable, Optional
+
+from asynctd.arrays import is_ndarray
+
+DEFAULT_MAX_ENTRIES = 1024
+
+_SCALARS = frozenset((type(None), bool, int, float, complex, str, bytes))
+
+
+def _digest(obj:Any):
+    """Return a stable digest of obj."""
+    hasher = hashlib.blake2b(digest_size=16)
+    _feed(hasher.update, obj)
+    return hasher.digest()
+
+
+def _feed(update:Callable, obj:Any):
+    """
+    Feed a canonical encoding of obj to update.
+
+    Mappings and sets are encoded independently of their iteration
+    order, buffers by content. Objects of other types are pickled,
+    which is only as stable as their pickles.
+    """
+    kind = type(obj)
+    if kind in _SCALARS:
+        update(f'{kind.__name__}:{obj!r};'.encode())
+    elif kind in (list, tuple) and all(type(item) in _SCALARS
+                                       for item in obj):
+        update(f'{kind.__name__}:{obj!r};'.encode())  # fast path
+    elif kind is range:
+        update(f'{obj!r};'.encode())
+    elif is_ndarray(obj):
+        update(f'ndarray:{obj.dtype.str}:{obj.shape};'.encode())
+        update(obj.tobytes())
+    elif isinstance(obj, (bytearray, memoryview, array.array)):
+        view = memoryview(obj)
+        update(f'buffer:{view.format}:{view.shape};'.encode())
+        update(view.tobytes())
+    elif isinstance(obj, Mapping):
+        update(f'{kind.__name__}{{'.encode())
+        for key_digest, value in sorted(
+                (_digest(key), value) for key, value in obj.items()):
+            update(key_digest)
+            _feed(update, value)
+        update(b'};')
+    elif isinstance(obj, Set):
+        update(f'{kind.__name__}{{'.encode())
+        for item_digest in sorted(_digest(item) for item in obj):
+            update(item_digest)
+        update(b'};')
+    elif isinstance(obj, Sequence):
+        update(f'{kind.__name__}['.encode())
+        for item in obj:
+            _feed(update, item)
+        update(b'];')
+    else:
+        update(f'{kind.__module__}.{kind.__qualname__}:'.encode())
+        update(pickle.dumps(obj, protocol=4))
+
+
+def _feed_code(update:Callable, code:types.CodeType):
+    """Feed the bytecode, names and constants of code, nested code too."""
+    update(code.co_code)
+    _feed(update, code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            _feed_code(update, const)
+        else:
+            _feed(update, const)
+
+
+def _feed_closure(update:Callable, func:Callable, seen:frozenset):
+    """
+    Feed the values captured by the closure of func.
+
+    Captured functions are identified like func. Return False if a
+    value can't be hashed stably.
+    """
+    for cell in func.__closure__ or ():
+        try:
+            value = cell.cell_contents
+        except ValueError:  # not bound yet
+            update(b'<empty>;')
+            continue
+        if isinstance(value, types.FunctionType):
+            if value in seen:  # recursion
+                update(f'{value.__qualname__};'.encode())
+                continue
+            identity = _function_identity(value, seen | {func})
+            if identity is None:
+                return False
+            update(identity.encode())
+            continue
+        try:
+            _feed(update, value)
+        except Exception:  # pylint: disable=W0718
+            return False
+    return True
+
+
+def _function_identity(func:Callable, seen:frozenset):
+    """Identify func, None if its closure can't be hashed stably."""
+    code = getattr(func, '__code__', None)
+    if code is None:
+        return f'{func.__module__}.{func.__qualname__}:'
+    hasher = hashlib.blake2b(digest_size=8)
+    _feed_code(hasher.update, code)
+    for defaults in (func.__defaults__, func.__kwdefaults__):
+        try:
+            _feed(hasher.update, defaults)
+        except Exception:  # pylint: disable=W0718
+            hasher.update(repr(defaults).encode())  # can't be pickled
+    if not _feed_closure(hasher.update, func, seen):
+        return None
+    return f'{func.__module__}.{func.__qualname__}:{hasher.hexdigest()}'
+
+
+def function_identity(func:Callable):
+    """
+    Return a string identifying func, its code, its defaults and the
+    values its closure captured (at the time of the call).
+
+    None if a captured value can't be hashed stably (can't be pickled):
+    the results of func can't be told apart then.
+    """
+    return _function_identity(func, frozenset())
+
+
+def call_digest(func:Callable, args:tuple, kwargs:dict):
+    """Return a stable hex digest of func and its args, None if none."""
+    identity = function_identity(func)
+    if identity is None:
+        return None
+    hasher = hashlib.blake2b(digest_size=20)
+    hasher.update(identity.encode())
+    _feed(hasher.update, args)
+    _feed(hasher.update, kwargs)
+    return hasher.hexdigest()
+
+
+class ResultCache:
+    """
+    Cache of chunk results, in memory and optionally on disk.
+
+    Results are stored pickled, so a cached result can't be modified
+    by whoever used it (e.g. a folding result_combiner). Results that
+    can't be pickled aren't cached. Counts hits and misses.
+    Can be shared by decorated functions, calls and threads.
+    """
+
+    def __init__(self, max_entries:int=DEFAULT_MAX_ENTRIES,
+                 ttl:Optional[float]=None, path:Optional[str]=None):
+        """
+        Initialize.
+
+        :param max_entries: results kept in memory, least recently
+         used ones are evicted first
+        :param ttl: seconds a result stays valid for, in both tiers
+        :param path: sqlite file keeping the results on disk, for
+         other processes and later runs
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (stored time, pickle)
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.db = None
+        if path is not None:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            with self.db:
+                self.db.execute(
+                    'CREATE TABLE IF NOT EXISTS chunk_results '
+                    '(key TEXT PRIMARY KEY, stored REAL, value BLOB)')
+
+    def key(self, func:Callable, args:tuple, kwargs:dict):
+        """
+        Return the key of the result of func(*args, **kwargs).
+
+        None if func can't be cached (see function_identity).
+        """
+        return call_digest(func, args, kwargs)
+
+    def part_key(self, call_key:str, part:Any):
+        """
+        Return the key of a chunk, from the key of its call and its part.
+
+        call_key is the key of the call with the mapped argument left
+        out, so that the other arguments are hashed once per call.
+        """
+        hasher = hashlib.blake2b(digest_size=20)
+        hasher.update(call_key.encode())
+        _feed(hasher.update, part)
+        return hasher.hexdigest()
+
+    def get(self, key:str):
+        """Return (True, result) if cached, (False, None) otherwise."""
+        with self.lock:
+            data = self._get(key)
+            if data is None:
+                self.misses += 1
+                return False, None
+            self.hits += 1
+        return True, pickle.loads(data)
+
+    def put(self, key:str, result:Any):
+        """Cache a result."""
+        try:
+            data = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:  # pylint: disable=W0718
+            return
+        stored = time.time()
+        with self.lock:
+            self._remember(key, stored, data)
+            if self.db is not None:
+                with self.db:
+                    self.db.execute(
+                        'INSERT OR REPLACE INTO chunk_results '
+                        'VALUES (?, ?, ?)', (key, stored, data))
+
+    def clear(self):
+        """Drop all the results, reset the counts."""
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.misses = 0
+            if self.db is not None:
+                with self.db:
+                    self.db.execute('DELETE FROM chunk_results')
+
+    def close(self):
+        """Close the disk tier."""
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    def _expired(self, stored:float):
+        """Check if a result stored at that time is too old."""
+        return self.ttl is not None and time.time() - stored > self.ttl
+
+    def _get(self, key:str):
+        """Return the pickled result from memory or disk, None if none."""
+        entry = self.entries.get(key)
+        if entry is not None:
+            if not self._expired(entry[0]):
+                self.entries.move_to_end(key)
+                return entry[1]
+            del self.entries[key]
+        if self.db is None:
+            return None
+        row = self.db.execute(
+            'SELECT stored, value FROM chunk_results WHERE key = ?',
+            (key,)).fetchone()
+        if row is None:
+            return None
+        if self._expired(row[0]):
+            with self.db:
+                self.db.execute(
+                    'DELETE FROM chunk_results WHERE key = ?', (key,))
+            return None
+        self._remember(key, *row)
+        return row[1]
+
+    def _remember(self, key:str, stored:float, data:bytes):
+        """Keep a result in memory, evict the least recently used."""
+        self.entries[key] = stored, data
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
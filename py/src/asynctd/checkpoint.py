@@ -0,0 +1,92 @@
+"""
+Checkpoints of distributed runs, to resume them after a crash.
+
+The result of each successful chunk is written to a sqlite file as
+soon as it completes, keyed by run id and chunk index. A restarted run
+with the same run id (by default: same function, same args) reruns
+only the chunks missing from the checkpoint. The checkpoint of a run
+is discarded once the run succeeds.
+"""
+
+import logging
+import pickle
+import sqlite3
+import threading
+from typing import Any, Callable, Optional
+
+from asynctd.cache import call_digest
+
+logger = logging.getLogger()
+
+
+class CheckpointStore:
+    """
+    Store of chunk results of runs, in a sqlite file.
+
+    Chunk indexes are only meaningful if the arg value divider divides
+    the same args into the same chunks in the same order. Results that
+    can't be pickled aren't checkpointed.
+    """
+
+    def __init__(self, path:str, run_id:Optional[str]=None):
+        """
+        Initialize.
+
+        :param path: sqlite file, created if missing
+        :param run_id: id of the runs, by default a digest of the
+         function and the args of each call
+        """
+        self.path = path
+        self.run_id = run_id
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.db:
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS checkpoints (run_id TEXT, '
+                'chunk INTEGER, result BLOB, PRIMARY KEY (run_id, chunk))')
+
+    def run_id_for(self, func:Callable, args:tuple, kwargs:dict):
+        """
+        Return the run id of a call.
+
+        None (the call isn't checkpointed) if func captured values that
+        can't be hashed stably, unless a run_id was set.
+        """
+        if self.run_id is not None:
+            return self.run_id
+        run_id = call_digest(func, args, kwargs)
+        if run_id is None:
+            logger.warning(
+                'Not checkpointing %s, its closure can\'t be hashed: '
+                'set the run_id of the checkpoint store', func.__name__)
+        return run_id
+
+    def load(self, run_id:str):
+        """Return the checkpointed results of a run, by chunk index."""
+        with self.lock:
+            rows = self.db.execute(
+                'SELECT chunk, result FROM checkpoints WHERE run_id = ?',
+                (run_id,)).fetchall()
+        return {index: pickle.loads(data) for index, data in rows}
+
+    def save(self, run_id:str, index:int, result:Any):
+        """Checkpoint the result of a chunk."""
+        try:
+            data = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:  # pylint: disable=W0718
+            return
+        with self.lock, self.db:
+            self.db.execute(
+                'INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?)',
+                (run_id, index, data))
+
+    def discard(self, run_id:str):
+        """Drop the checkpoint of a run."""
+        with self.lock, self.db:
+            self.db.execute(
+                'DELETE FROM checkpoints WHERE run_id = ?', (run_id,))
+
+    def close(self):
+        """Close the file."""
+        self.db.close()
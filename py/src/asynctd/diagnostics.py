@@ -0,0 +1,121 @@
+"""
+Diagnostics of distributed runs: event loop blocking and profiling.
+
+Chunks running on the event loop only run concurrently if they yield
+to it: a worker awaiting coroutines that never suspend (or calling
+blocking code) holds the loop and serializes the run. Diagnostics
+drives each chunk's coroutine step by step, timing how long every step
+holds the loop; chunks holding it longer than a threshold are logged
+and recorded with their index and function name.
+
+A sample of the chunks can be profiled with cProfile, the profiler
+being enabled only while the chunk holds the loop, so interleaved
+chunks don't pollute each other's profile. The profiles are merged
+into one pstats.Stats. Code running in thread or process pools isn't
+profiled.
+"""
+
+import cProfile
+import logging
+import pstats
+import random
+import threading
+import time
+import types
+from collections import namedtuple
+from typing import Callable, Coroutine, Optional
+
+logger = logging.getLogger()
+
+DEFAULT_BLOCK_THRESHOLD = 0.1
+
+BlockingChunk = namedtuple(
+    'BlockingChunk', ['function', 'index', 'duration'])
+
+
+class Diagnostics:
+    """
+    Detect chunks blocking the event loop, profile a sample of chunks.
+
+    Can be shared by decorated functions and calls.
+    """
+
+    def __init__(self, block_threshold:float=DEFAULT_BLOCK_THRESHOLD,
+                 profile_sample:float=0.0):
+        """
+        Initialize.
+
+        :param block_threshold: seconds a chunk may hold the event loop
+         at once before it's flagged
+        :param profile_sample: fraction of the chunks profiled
+        """
+        if not 0 <= profile_sample <= 1:
+            raise ValueError('profile_sample must be between 0 and 1')
+        self.block_threshold = block_threshold
+        self.profile_sample = profile_sample
+        self.blocking = []  # BlockingChunk of each flagged chunk
+        self.profile = None  # pstats.Stats of the profiled chunks
+        self.num_profiled = 0
+        self.lock = threading.Lock()
+
+    async def watch(self, function:str, index:int, run_chunk:Callable,
+                    *args):
+        """Run the chunk run_chunk(*args) under watch."""
+        profiler = cProfile.Profile() \
+            if self.profile_sample and \
+            random.random() < self.profile_sample else None
+        return await self._steps(function, index, run_chunk(*args), profiler)
+
+    def dump_profile(self, path:str):
+        """Write the aggregated profile, for pstats or snakeviz."""
+        if self.profile is None:
+            raise ValueError('No chunk was profiled')
+        self.profile.dump_stats(path)
+
+    @types.coroutine
+    def _steps(self, function:str, index:int, coro:Coroutine,
+               profiler:Optional[cProfile.Profile]):
+        """Drive coro, timing (and profiling) every step."""
+        longest = 0.0
+        value, error = None, None
+        try:
+            while True:
+                if profiler is not None:
+                    profiler.enable()
+                start_time = time.perf_counter()
+                try:
+                    if error is None:
+                        yielded = coro.send(value)
+                    else:
+                        yielded = coro.throw(error)
+                except StopIteration as stop:
+                    return stop.value
+                finally:
+                    longest = max(longest, time.perf_counter() - start_time)
+                    if profiler is not None:
+                        profiler.disable()
+                try:
+                    value, error = (yield yielded), None
+                except GeneratorExit:
+                    coro.close()
+                    raise
+                except BaseException as ex:  # pylint: disable=W0718
+                    value, error = None, ex
+        finally:
+            self._chunk_done(function, index, longest, profiler)
+
+    def _chunk_done(self, function:str, index:int, longest:float,
+                    profiler:Optional[cProfile.Profile]):
+        """Flag the chunk if it blocked, merge its profile."""
+        with self.lock:
+            if longest > self.block_threshold:
+                self.blocking.append(BlockingChunk(function, index, longest))
+                logger.warning(
+                    'Chunk %d of %s held the event loop for %.3f seconds',
+                    index, function, longest)
+            if profiler is not None:
+                self.num_profiled += 1
+                if self.profile is None:
+                    self.profile = pstats.Stats(profiler)
+                else:
+                    self.profile.add(profiler)
@@ -0,0 +1,261 @@
+"""
+Built-in arg value dividers for run_distributively.
+
+AdaptiveDivider sizes chunks from the measured run time of
+the chunks that already completed.
+SequenceDivider divides into a fixed number or size of chunks that are
+views of the value rather than copies: sub-ranges, memoryview slices,
+NumPy array_split views, SliceView proxies over other sequences.
+"""
+
+import math
+import os
+from collections.abc import Sequence
+from itertools import islice
+from typing import Any, Optional
+
+from asynctd.arrays import is_ndarray, numpy_module
+
+
+class AdaptiveDivider:
+    """
+    Divide a value into chunks sized toward a target chunk duration.
+
+    Starts with small chunks, then grows or shrinks them based on the
+    measured time per item, which trades scheduling overhead per chunk
+    against load balance without hand tuning the chunk size.
+    Sequences are sliced, other iterables are consumed lazily.
+    """
+
+    def __init__(
+            self,
+            target_duration:float=0.1,
+            *,
+            initial_size:int=1,
+            min_size:int=1,
+            max_size:Optional[int]=None,
+            parallelism:Optional[int]=None,
+            growth:float=2.0):
+        """
+        Initialize.
+
+        :param target_duration: desired run time of a chunk, in seconds
+        :param initial_size: number of items in the first chunks
+        :param min_size: lower bound of the chunk size
+        :param max_size: upper bound of the chunk size
+        :param parallelism: number of chunks expected to run in parallel,
+         the remaining items of a sequence are not packed into fewer
+         chunks than that (cpu count by default)
+        :param growth: maximum factor the chunk size changes by at once
+        """
+        self.target_duration = target_duration
+        self.initial_size = max(initial_size, min_size)
+        self.min_size = min_size
+        self.max_size = max_size
+        self.parallelism = parallelism or os.cpu_count() or 1
+        self.growth = growth
+
+    def __call__(self, value:Any):
+        """Divide the value, return an iterator over the chunks."""
+        return _AdaptiveChunks(self, value)
+
+
+class _AdaptiveChunks:
+    """Chunks of a single value, sized by an AdaptiveDivider."""
+
+    def __init__(self, divider:AdaptiveDivider, value:Any):
+        """Initialize."""
+        self.divider = divider
+        self.value = value if isinstance(value, Sequence) else None
+        self.items = None if self.value is not None else iter(value)
+        self.offset = 0
+        self.size = divider.initial_size
+        self.time_per_item = None
+        self.chunk_sizes = {}
+        self.num_chunks = 0
+
+    def __iter__(self):
+        """Return the iterator."""
+        return self
+
+    def __next__(self):
+        """Return the next chunk."""
+        if self.items is not None:
+            chunk = list(islice(self.items, self.size))
+        else:
+            remaining = len(self.value) - self.offset
+            balanced_size = math.ceil(remaining / self.divider.parallelism)
+            size = max(min(self.size, balanced_size), self.divider.min_size)
+            chunk = self.value[self.offset:self.offset + size]
+            self.offset += len(chunk)
+        if not chunk:
+            raise StopIteration
+        self.chunk_sizes[self.num_chunks] = len(chunk)
+        self.num_chunks += 1
+        return chunk
+
+    def chunk_done(self, index:int, elapsed:float):
+        """Adjust the chunk size to the run time of a completed chunk."""
+        num_items = self.chunk_sizes.pop(index, 0)
+        if not num_items or elapsed <= 0:
+            return
+        time_per_item = elapsed / num_items
+        # Smooth out the noise of individual measurements
+        self.time_per_item = time_per_item if self.time_per_item is None \
+            else (self.time_per_item + time_per_item) / 2
+        divider = self.divider
+        ideal_size = divider.target_duration / self.time_per_item
+        size = min(max(ideal_size, self.size / divider.growth),
+                   self.size * divider.growth)
+        if divider.max_size is not None:
+            size = min(size, divider.max_size)
+        self.size = max(int(size), divider.min_size)
+
+
+class SliceView(Sequence):
+    """
+    Read-only view of seq[start:stop] that doesn't copy the items.
+
+    Pickled as a list of its items, so that only the chunk is shipped
+    to worker processes.
+    """
+
+    __slots__ = ('seq', 'start', 'stop')
+
+    def __init__(self, seq:Sequence, start:int=0, stop:Optional[int]=None):
+        """Initialize."""
+        self.seq = seq
+        self.start, self.stop, _ = slice(start, stop).indices(len(seq))
+        self.stop = max(self.stop, self.start)
+
+    def __len__(self):
+        """Return the number of items."""
+        return self.stop - self.start
+
+    def __getitem__(self, index):
+        """Return an item, or a view of a slice (a list if stepped)."""
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self.seq[self.start + i]
+                        for i in range(start, stop, step)]
+            return SliceView(self.seq, self.start + start,
+                             self.start + max(stop, start))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('SliceView index out of range')
+        return self.seq[self.start + index]
+
+    def __iter__(self):
+        """Iterate over the items."""
+        return map(self.seq.__getitem__, range(self.start, self.stop))
+
+    def __eq__(self, other):
+        """Compare items with another SliceView or a list."""
+        if isinstance(other, (SliceView, list)):
+            return len(self) == len(other) and all(
+                a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __reduce__(self):
+        """Pickle the items only."""
+        return list, (list(self),)
+
+    def __repr__(self):
+        """Return a repr that doesn't list the items."""
+        return f'SliceView(<{type(self.seq).__name__}>' \
+            f'[{self.start}:{self.stop}])'
+
+
+class SequenceDivider:
+    """
+    Divide a value into chunks that are views of it, not copies.
+
+    Ranges are divided into sub-ranges, strings into substrings
+    (copies, strings have no views), buffers (bytes, bytearray,
+    array.array, memoryview) into memoryview slices, NumPy arrays with
+    numpy.array_split and other sequences (lists, tuples...) into
+    SliceView proxies. Other iterables are consumed lazily into lists,
+    chunk_size is required then.
+    The chunks of a sequence are built on demand, their number is
+    known upfront. memoryview chunks can't be pickled: divide buffers
+    for process pools with shared_memory=True (see asynctd.transport).
+    """
+
+    def __init__(self, num_chunks:Optional[int]=None,
+                 chunk_size:Optional[int]=None):
+        """
+        Initialize, set either of the arguments.
+
+        :param num_chunks: number of chunks, of sizes differing by
+         at most one item
+        :param chunk_size: maximum number of items per chunk (chunks
+         of sequences are balanced, the last chunk of an iterable
+         may be smaller)
+        """
+        if (num_chunks is None) == (chunk_size is None):
+            raise ValueError('Set either num_chunks or chunk_size')
+        if (chunk_size if num_chunks is None else num_chunks) < 1:
+            raise ValueError('num_chunks and chunk_size must be positive')
+        self.num_chunks = num_chunks
+        self.chunk_size = chunk_size
+
+    def __call__(self, value:Any):
+        """Divide the value."""
+        if is_ndarray(value):
+            numpy = numpy_module()
+            return numpy.array_split(value, self._count(len(value)))
+        if isinstance(value, (range, str)):
+            view = value
+        else:
+            try:
+                view = memoryview(value)
+            except TypeError:
+                view = SliceView(value) if isinstance(value, Sequence) \
+                    else None
+            else:
+                if view.ndim != 1:
+                    raise TypeError('Cannot divide multi-dimensional buffers')
+        if view is None:
+            if self.chunk_size is None:
+                raise TypeError(
+                    f'Cannot divide {type(value).__name__} into '
+                    'num_chunks, set chunk_size')
+            return _batches(iter(value), self.chunk_size)
+        return _ViewChunks(view, self._count(len(view)))
+
+    def _count(self, length:int):
+        """Return the number of chunks of a sequence."""
+        if self.num_chunks is not None:
+            return max(min(self.num_chunks, length), 1)
+        return max(math.ceil(length / self.chunk_size), 1)
+
+
+class _ViewChunks(Sequence):
+    """Chunks of a sequence, as views built on demand."""
+
+    def __init__(self, view:Sequence, count:int):
+        """Initialize."""
+        self.view = view
+        self.count = count
+
+    def __len__(self):
+        """Return the number of chunks."""
+        return self.count
+
+    def __getitem__(self, index:int):
+        """Return a chunk."""
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError('chunk index out of range')
+        length = len(self.view)
+        return self.view[index * length // self.count:
+                         (index + 1) * length // self.count]
+
+
+def _batches(items, size:int):
+    """Yield lists of up to size items."""
+    while batch := list(islice(items, size)):
+        yield batch
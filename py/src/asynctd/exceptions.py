@@ -0,0 +1,191 @@
+"""
+Reporting of the exceptions thrown by the workers of distributed runs.
+
+Each failure is described by a compact ExceptionDescriptor (the stack
+without frame locals, the inputs summarized). Identical errors are
+counted by an ExceptionCollector, which keeps a bounded sample of the
+descriptors; MappedException reports them to the caller.
+"""
+
+import json
+import os
+import reprlib
+import traceback
+from collections import Counter
+from collections.abc import Mapping, Sized
+from typing import Any
+
+DEFAULT_MAX_EX_SAMPLES = 10
+
+_INPUTS_REPR = reprlib.Repr()
+_INPUTS_REPR.maxstring = 80
+_INPUTS_REPR.maxother = 80
+
+
+def _summarize_value(value:Any):
+    """Render a size-limited repr of a value."""
+    if isinstance(value, (str, bytes)) or not isinstance(value, Sized) or \
+            len(value) <= _INPUTS_REPR.maxlist:
+        return _INPUTS_REPR.repr(value)
+    # Don't let reprlib sort large sets and dicts
+    return f'<{type(value).__name__} of {len(value)} items>'
+
+
+def summarize_inputs(args:tuple, kwargs:dict):
+    """
+    Summarize worker inputs for an exception descriptor.
+
+    Renders the call arguments as a size-limited repr, so that
+    descriptors don't hold on to (or copy) the chunk and
+    the shared arguments.
+    """
+    return '(' + ', '.join(
+        [_summarize_value(arg) for arg in args] +
+        [f'{key}={_summarize_value(value)}'
+         for key, value in kwargs.items()]) + ')'
+
+
+class ExceptionDescriptor(Mapping):
+    """
+    Describe an exception thrown by a worker.
+
+    Read-only mapping with keys type, value, tb, function,
+    function_inputs, pid, attempts. The stack is captured without frame locals
+    or source lines; the traceback is only rendered when accessed.
+    Not a dict: convert it with as_dict() e.g. for json.dumps().
+    """
+
+    _KEYS = ('type', 'value', 'tb', 'function', 'function_inputs', 'pid',
+             'attempts')
+
+    def __init__(self, ex_value:BaseException, t_back, function:str,
+                 function_inputs:Any=None, attempts:int=1):
+        """
+        Initialize.
+
+        :param ex_value: the exception
+        :param t_back: its traceback
+        :param function: name of the worker function
+        :param function_inputs: (summary of) the worker inputs
+        :param attempts: number of times the worker was run
+        """
+        self.type = str(type(ex_value))
+        self.value = str(ex_value)
+        self.stack = traceback.StackSummary.extract(
+            traceback.walk_tb(t_back), lookup_lines=False)
+        self.function = function
+        self.function_inputs = function_inputs
+        self.pid = os.getpid()
+        self.attempts = attempts
+        self._tb = None
+
+    @property
+    def tb(self):  # pylint: disable=C0103
+        """Return the formatted traceback."""
+        if self._tb is None:
+            self._tb = self.stack.format()
+        return self._tb
+
+    def __getitem__(self, key):
+        """Return a descriptor field."""
+        if key not in self._KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self):
+        """Iterate over the descriptor keys."""
+        return iter(self._KEYS)
+
+    def __len__(self):
+        """Return the number of descriptor keys."""
+        return len(self._KEYS)
+
+    def as_dict(self):
+        """Return the fields as a dict, the traceback rendered."""
+        return dict(self)
+
+
+class ExceptionCollector:
+    """
+    Collect exception descriptors of the failed workers.
+
+    Identical errors (same type, value and function) are counted,
+    at most max_samples descriptors are kept in full.
+    """
+
+    def __init__(self, max_samples:int=DEFAULT_MAX_EX_SAMPLES):
+        """Initialize."""
+        self.max_samples = max_samples
+        self.samples = []
+        self.counts = Counter()
+
+    def add(self, ex_desc:Mapping):
+        """Add the descriptor of a failed worker."""
+        self.counts[_error_key(ex_desc)] += 1
+        if len(self.samples) < self.max_samples:
+            self.samples.append(ex_desc)
+
+    def __len__(self):
+        """Return the number of failed workers."""
+        return self.counts.total()
+
+    def render(self):
+        """Render the samples, one per distinct error, with counts."""
+        rendered = {}
+        for ex_desc in self.samples:
+            key = _error_key(ex_desc)
+            if key not in rendered:
+                rendered[key] = dict(ex_desc, count=self.counts[key])
+        return list(rendered.values())
+
+
+def _error_key(ex_desc:Mapping):
+    """Identify identical errors."""
+    return ex_desc['type'], ex_desc['value'], ex_desc['function']
+
+
+class MappedException(Exception):
+    """Support exceptions reported by multiple workers."""
+
+    def __init__(self, orig_ex_descriptors, num_cancelled=0, quorum=None):
+        """
+        Initialize.
+
+        :param orig_ex_descriptors: list of error descriptors coming from all the
+         workers that threw an exception, or an ExceptionCollector
+        :param num_cancelled: number of workers cancelled (or never started)
+         once the outcome was known
+        :param quorum: (succeeded, required) numbers of workers if a quorum
+         wasn't reached, required is None if the number of workers is unknown
+        """
+        if isinstance(orig_ex_descriptors, ExceptionCollector):
+            collector = orig_ex_descriptors
+        else:
+            collector = ExceptionCollector(len(orig_ex_descriptors))
+            for ex_desc in orig_ex_descriptors:
+                collector.add(ex_desc)
+        super().__init__(
+            f'{len(collector)} workers threw exception(s)')
+        self.collector = collector
+        self.ex_descriptors = collector.samples
+        self.num_exceptions = len(collector)
+        self.num_cancelled = num_cancelled
+        self.quorum = quorum
+
+    def __str__(self):
+        """Render the distinct errors (tracebacks rendered on demand)."""
+        errors = self.collector.render()
+        message = (json.dumps(errors, indent=4, default=repr) + '\n'
+                   if errors else '') + \
+            f'{self.num_exceptions} workers threw exception(s)'
+        num_distinct = len(self.collector.counts)
+        if num_distinct > len(errors):
+            message += f', {num_distinct - len(errors)} distinct ' \
+                'errors not sampled'
+        if self.num_cancelled:
+            message += f', {self.num_cancelled} workers cancelled'
+        if self.quorum is not None:
+            num_succeeded, num_required = self.quorum
+            message += f', quorum not reached: {num_succeeded} workers ' \
+                f'succeeded, {num_required or "unknown"} required'
+        return message
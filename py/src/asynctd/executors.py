@@ -0,0 +1,192 @@
+"""
+Execution of the chunks of distributed runs outside of the event loop.
+
+Chunks run on the caller's event loop (ExecutionBackend.ASYNC), in a
+thread or process pool created for the call, or in an executor given by
+the caller: a WorkerPool, a long-lived pool, or a remote Coordinator.
+Functions are shipped to worker processes by import path, coroutine
+functions run to completion with their own event loop there.
+"""
+
+import asyncio
+import functools
+import importlib
+import inspect
+from concurrent.futures import (
+    Executor, ProcessPoolExecutor, ThreadPoolExecutor)
+from contextlib import contextmanager, nullcontext
+from enum import Enum
+from typing import Callable, Optional
+
+from asynctd import transport
+from asynctd.pools import WorkerPool
+from asynctd.remote import Coordinator
+
+
+class ExecutionBackend(Enum):
+    """Define where the chunks of a distributed run are executed."""
+
+    ASYNC = 0  # coroutine on the caller's event loop
+    PROCESS = 1  # process pool, for CPU-bound functions
+    THREAD = 2  # thread pool, for sync functions and GIL-releasing code
+
+
+def backend_pool_factory(func:Callable, backend:Optional[ExecutionBackend],
+                         executor:Optional[Executor]):
+    """
+    Return the pool class running the chunks of func with backend.
+
+    None for the event loop. The backend defaults to ASYNC for
+    coroutine functions and THREAD otherwise; plain functions can't run
+    on the event loop.
+    """
+    if backend is None:
+        backend = ExecutionBackend.ASYNC if \
+            inspect.iscoroutinefunction(func) else ExecutionBackend.THREAD
+    if backend == ExecutionBackend.ASYNC and executor is None \
+            and not inspect.iscoroutinefunction(func):
+        raise TypeError(
+            f'{func.__name__} is not a coroutine function, '
+            'it can only run with THREAD or PROCESS backend')
+    return {
+        ExecutionBackend.THREAD: ThreadPoolExecutor,
+        ExecutionBackend.PROCESS: ProcessPoolExecutor
+    }.get(backend)
+
+
+def _resolve_function(module_name, qualname):
+    """
+    Import a function by module and qualified name.
+
+    Decorated functions are only reachable through their wrappers,
+    so the wrappers produced by run_distributively are unwrapped.
+    """
+    obj = importlib.import_module(module_name)
+    for attr in qualname.split('.'):
+        obj = getattr(obj, attr)
+    while getattr(obj, '_asynctd_distributed', False):
+        obj = obj.__wrapped__
+    return obj
+
+
+class _FunctionRef:
+    """
+    Picklable reference to a module-level function.
+
+    The original function of a decorated one can't be pickled by
+    reference (its module attribute is the wrapper), so it's shipped
+    to worker processes (and remote workers) as an import path
+    instead.
+    """
+
+    def __init__(self, func):
+        """Initialize."""
+        self.func = func
+
+    def __call__(self, *args, **kwargs):
+        """Call the referenced function."""
+        return self.func(*args, **kwargs)
+
+    def __reduce__(self):
+        """Pickle as an import path."""
+        if '<locals>' in self.func.__qualname__:
+            return _identity, (self.func,)
+        return _resolve_function, (
+            self.func.__module__, self.func.__qualname__)
+
+
+def _identity(value):
+    """Return the value as is."""
+    return value
+
+
+async def _resolve(awaitable):
+    """Await an awaitable, for asyncio.run()."""
+    return await awaitable
+
+
+def _call_function(func, args, kwargs):
+    """
+    Run a function to completion in an executor thread/process.
+
+    Awaitable results are awaited too: plain functions may return
+    coroutines, e.g. decorators (not using functools.wraps) and lambdas
+    wrapping coroutine functions.
+    """
+    result = func(*args, **kwargs)
+    if inspect.isawaitable(result):
+        return asyncio.run(_resolve(result))
+    return result
+
+
+def _call_function_shared(func, payload, buffer_refs):
+    """Run a function on args shipped by a SharedMemoryTransport."""
+    attached = {}
+    try:
+        args, kwargs = transport.loads(payload, buffer_refs, attached)
+        result = _call_function(func, args, kwargs)
+        del args, kwargs
+        return result
+    finally:
+        transport.release(attached)
+
+
+@contextmanager
+def _call_pool(pool_factory:Callable, max_workers:Optional[int]):
+    """
+    Create a pool for the duration of a call.
+
+    The pool is shut down without waiting for its workers: by the time
+    the call ends the chunks still running were abandoned (timed out,
+    past the deadline, not needed after an early exit), the call and
+    the event loop don't wait for them. Queued chunks are cancelled.
+    """
+    pool = pool_factory(max_workers=max_workers)
+    try:
+        yield pool
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+@contextmanager
+def call_context(executor:Optional[Executor],
+                 pool_factory:Optional[Callable],
+                 max_workers:Optional[int], use_shared_memory:bool):
+    """
+    Open the shared memory transport and the pool of a call.
+
+    Yield (transport or None, executor running the chunks or None).
+    The pool is the given executor, or one created for the call by
+    pool_factory; None runs the chunks on the event loop.
+    """
+    # The segments are released once the pool is shut down
+    with transport.SharedMemoryTransport() if use_shared_memory \
+            else nullcontext() as shared, \
+            nullcontext(executor) if executor is not None or \
+            pool_factory is None else \
+            _call_pool(pool_factory, max_workers) as pool:
+        yield shared, pool
+
+
+def pool_of(executor:Executor):
+    """Return the executor actually running the calls of executor."""
+    return executor.executor if isinstance(executor, WorkerPool) \
+        else executor
+
+
+def in_executor(executor:Executor, func:Callable,
+                shared_memory:Optional[transport.SharedMemoryTransport]=None):
+    """Adapt func to run each call in the executor."""
+    target = _FunctionRef(func) if isinstance(
+        pool_of(executor), (ProcessPoolExecutor, Coordinator)) else func
+
+    @functools.wraps(func)
+    async def run_in_executor(*args, **kwargs):
+        if shared_memory is not None:
+            return await asyncio.get_running_loop().run_in_executor(
+                executor, _call_function_shared, target,
+                *shared_memory.dumps((args, kwargs)))
+        return await asyncio.get_running_loop().run_in_executor(
+            executor, _call_function, target, args, kwargs)
+
+    return run_in_executor
@@ -0,0 +1,84 @@
+"""
+Hedging of straggling chunks.
+
+A LatencyTracker keeps the run times of the chunks of a call that
+succeeded; once it has enough of them, hedged() starts a duplicate of
+a chunk running longer than the chosen percentile of those run times
+and takes whichever attempt succeeds first.
+"""
+
+import asyncio
+import bisect
+import time
+from collections import deque
+from typing import Callable
+
+HEDGE_MIN_SAMPLES = 20  # chunk latencies needed before hedging starts
+HEDGE_MAX_SAMPLES = 1000  # most recent chunk latencies considered
+
+
+class LatencyTracker:
+    """Track run times of the successful chunks of a call for hedging."""
+
+    def __init__(self, percentile:float,
+                 min_samples:int=HEDGE_MIN_SAMPLES,
+                 max_samples:int=HEDGE_MAX_SAMPLES):
+        """Initialize."""
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.max_samples = max_samples
+        self.recent = deque()
+        self.ordered = []
+        self.ready = asyncio.Event()  # set once there are enough samples
+
+    def record(self, latency:float):
+        """Record the run time of a successful chunk."""
+        if len(self.recent) == self.max_samples:
+            del self.ordered[bisect.bisect_left(
+                self.ordered, self.recent.popleft())]
+        self.recent.append(latency)
+        bisect.insort(self.ordered, latency)
+        if len(self.ordered) >= self.min_samples:
+            self.ready.set()
+
+    def hedge_delay(self):
+        """Return the latency percentile (once ready)."""
+        return self.ordered[
+            min(int(self.percentile * len(self.ordered)),
+                len(self.ordered) - 1)]
+
+
+async def hedged(attempt:Callable, latencies:LatencyTracker):
+    """
+    Run attempt, start a duplicate if it's slower than the percentile.
+
+    Return the result of whichever attempt succeeds first, the other
+    one is cancelled. Raise if both fail.
+    """
+    start_time = time.perf_counter()
+    attempts = {asyncio.ensure_future(attempt())}
+    ready = None
+    try:
+        if not latencies.ready.is_set():
+            # Too early to tell a straggler, wait for enough samples
+            ready = asyncio.ensure_future(latencies.ready.wait())
+            await asyncio.wait(
+                attempts | {ready}, return_when=asyncio.FIRST_COMPLETED)
+        if latencies.ready.is_set():
+            delay = latencies.hedge_delay() - (
+                time.perf_counter() - start_time)
+            done, _ = await asyncio.wait(attempts, timeout=max(delay, 0))
+            if not done:
+                attempts.add(asyncio.ensure_future(attempt()))
+        while True:
+            done, _ = await asyncio.wait(
+                attempts, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                attempts.discard(task)
+                if task.exception() is None or not attempts:
+                    return task.result()
+    finally:
+        if ready is not None:
+            ready.cancel()
+        for task in attempts:
+            task.cancel()
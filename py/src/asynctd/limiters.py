@@ -0,0 +1,278 @@
+"""
+Limiters for the dispatch of the chunks of distributed runs.
+
+TokenBucket caps the rate at which chunks start, on top of the
+concurrency cap (max_workers).
+ConcurrencyLimiter caps the number of chunks running at once across
+decorated functions and their calls; limiters can be registered
+by name (named_limiter) to be shared process-wide. Waiting calls get
+slots by priority, then by weighted fair queuing (see Flow).
+"""
+
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+# Innermost slot held by the current task, per limiter
+_HELD_SLOTS = ContextVar('asynctd_held_slots', default={})
+
+# Scheduling options of the calls made in the current context
+_SCHEDULING = ContextVar('asynctd_scheduling', default=None)
+
+_LIMITERS = {}
+_LIMITERS_LOCK = threading.Lock()
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter.
+
+    Allows a sustained rate of acquisitions per second and bursts of up
+    to burst acquisitions. Acquisitions reserve tokens ahead of time,
+    so waiters are served in order without any event-loop bound state:
+    a bucket can be shared by several decorated functions, calls
+    and event loops.
+    """
+
+    def __init__(self, rate:float, burst:int=1):
+        """
+        Initialize.
+
+        :param rate: sustained number of acquisitions per second
+        :param burst: number of acquisitions allowed at once,
+         after a period of inactivity
+        """
+        if rate <= 0 or burst < 1:
+            raise ValueError('rate and burst must be positive')
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token, return seconds to wait until it's available."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return max(-self.tokens / self.rate, 0)
+
+    def release(self):
+        """Give back a token that was reserved but not used."""
+        with self.lock:
+            self.tokens = min(self.burst, self.tokens + 1)
+
+    async def acquire(self):
+        """Wait for a token."""
+        delay = self.reserve()
+        if delay:
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                self.release()
+                raise
+
+
+class Flow:
+    """
+    Scheduling class of the chunks of one call sharing limiters.
+
+    Waiters of higher priority get slots first. Among waiters of the
+    same priority slots are shared by weighted fair queuing: each call
+    gets slots in proportion to its weight, however many chunks it
+    queued, so a small call isn't stuck behind a bulk one.
+    """
+
+    def __init__(self, priority:int=0, weight:float=1.0):
+        """
+        Initialize.
+
+        :param priority: waiters of higher priority are served first
+        :param weight: share of the slots relative to other flows
+         of the same priority
+        """
+        if weight <= 0:
+            raise ValueError('weight must be positive')
+        self.priority = priority
+        self.weight = weight
+
+    @classmethod
+    def current(cls, priority:int=0, weight:float=1.0):
+        """Return a flow for a new call, scheduled() overrides the args."""
+        scheduling = _SCHEDULING.get()
+        if scheduling is not None:
+            priority, weight = scheduling
+        return cls(priority, weight)
+
+
+@contextmanager
+def scheduled(priority:int=0, weight:float=1.0):
+    """Set the priority and weight of the calls made in the context."""
+    token = _SCHEDULING.set((priority, weight))
+    try:
+        yield
+    finally:
+        _SCHEDULING.reset(token)
+
+
+class _Waiter:
+    """Acquisition waiting for a slot."""
+
+    __slots__ = ('loop', 'future', 'flow', 'finish', 'queued')
+
+    def __init__(self, loop, future, flow, finish):
+        """Initialize."""
+        self.loop = loop
+        self.future = future
+        self.flow = flow
+        self.finish = finish
+        self.queued = True
+
+
+_DEFAULT_FLOW = Flow()
+
+
+class ConcurrencyLimiter:
+    """
+    Limit the number of chunks running at once.
+
+    Unlike asyncio.Semaphore it isn't bound to an event loop, so a
+    limiter can be shared by decorated functions and calls in different
+    loops or threads. Waiters are served by the priority of their Flow,
+    then in weighted fair order across flows (virtual finish times,
+    a flow's chunks in order).
+
+    Nested acquisition is deadlock-safe: a task holding a slot (e.g.
+    a chunk calling another distributed function limited by the same
+    limiter) lends it to the nested chunks, one at a time, instead of
+    waiting for a slot of its own. The total load stays within limit.
+    """
+
+    def __init__(self, limit:int):
+        """
+        Initialize.
+
+        :param limit: maximum number of slots held at once
+        """
+        if limit < 1:
+            raise ValueError('limit must be positive')
+        self.limit = limit
+        self.active = 0
+        self.waiters = []  # heap of (-priority, finish, seq, _Waiter)
+        self.num_waiting = 0
+        self.virtual_time = 0.0
+        self.finish_times = {}  # last finish time queued, per flow
+        self.sequence = itertools.count()
+        self.lock = threading.Lock()
+
+    async def acquire(self, flow:Optional[Flow]=None):
+        """Wait for a slot (not reentrant, see slot())."""
+        flow = flow or _DEFAULT_FLOW
+        with self.lock:
+            if self.active < self.limit and not self.num_waiting:
+                self.active += 1
+                return
+            loop = asyncio.get_running_loop()
+            finish = max(self.virtual_time, self.finish_times.get(
+                flow, 0.0)) + 1 / flow.weight
+            self.finish_times[flow] = finish
+            waiter = _Waiter(loop, loop.create_future(), flow, finish)
+            heapq.heappush(self.waiters, (
+                -flow.priority, finish, next(self.sequence), waiter))
+            self.num_waiting += 1
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self.lock:
+                if waiter.queued:
+                    # Left in the heap, skipped when popped
+                    waiter.queued = False
+                    self.num_waiting -= 1
+                    if self.finish_times.get(flow) == waiter.finish:
+                        del self.finish_times[flow]
+                    if not self.num_waiting:
+                        self.waiters.clear()
+                        self.finish_times.clear()
+                    raise
+            if not waiter.future.cancelled():
+                self.release()  # the slot was handed over already
+            raise
+
+    def release(self):
+        """Release a slot, hand it over to the next waiter."""
+        with self.lock:
+            while self.waiters:
+                waiter = heapq.heappop(self.waiters)[-1]
+                if not waiter.queued:
+                    continue
+                waiter.queued = False
+                self.num_waiting -= 1
+                self.virtual_time = max(self.virtual_time, waiter.finish)
+                if self.finish_times.get(waiter.flow) == waiter.finish:
+                    del self.finish_times[waiter.flow]
+                waiter.loop.call_soon_threadsafe(
+                    self._hand_over, waiter.future)
+                return
+            self.active -= 1
+
+    def _hand_over(self, waiter:asyncio.Future):
+        """Give a slot to a waiter, pass it on if the waiter is gone."""
+        if waiter.cancelled():
+            self.release()
+        else:
+            waiter.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, flow:Optional[Flow]=None):
+        """Hold a slot, borrowing it if the task holds one already."""
+        held_slots = _HELD_SLOTS.get()
+        held = held_slots.get(self)
+        source = self if held is None else held.lending
+        await source.acquire(flow)
+        token = _HELD_SLOTS.set({**held_slots, self: _Slot()})
+        try:
+            yield
+        finally:
+            _HELD_SLOTS.reset(token)
+            source.release()
+
+
+class _Slot:
+    """Slot held by a task, lent to nested acquisitions one at a time."""
+
+    def __init__(self):
+        """Initialize."""
+        self._lending = None
+
+    @property
+    def lending(self):
+        """Return the limiter of nested acquisitions of the slot."""
+        if self._lending is None:
+            self._lending = ConcurrencyLimiter(1)
+        return self._lending
+
+
+def named_limiter(name:str, limit:Optional[int]=None):
+    """
+    Return the limiter registered under name.
+
+    Create and register it if absent, limit is required then.
+    """
+    with _LIMITERS_LOCK:
+        limiter = _LIMITERS.get(name)
+        if limiter is None:
+            if limit is None:
+                raise KeyError(f'No limiter named {name}')
+            limiter = _LIMITERS[name] = ConcurrencyLimiter(limit)
+        elif limit is not None and limit != limiter.limit:
+            raise ValueError(
+                f'Limiter {name} is registered with limit {limiter.limit}')
+        return limiter
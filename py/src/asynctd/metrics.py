@@ -0,0 +1,135 @@
+"""
+Metrics of distributed runs.
+
+The calls of a decorated function are measured in CallStats: time spent
+dividing the mapped argument into chunks, time chunks wait for a slot
+(max_workers semaphore, limiter, rate limit) and run, high-water mark
+of the chunks running at once, reduce time, counts of succeeded and
+failed chunks. Stats are reported to a MetricsHook given to
+run_distributively(metrics=...) and gathered by collect_stats().
+Calls nobody looks at aren't measured.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+# Lists collecting the stats of the calls made in the current context
+_COLLECTORS = ContextVar('asynctd_stats_collectors', default=())
+
+
+class CallStats:
+    """
+    Stats of a call of a decorated function.
+
+    Times are in seconds. The wait time of a chunk includes the waits
+    of its retry attempts; its run time is the one of its last attempt.
+    Chunks from a cache or a checkpoint count, with no wait nor run time.
+    """
+
+    def __init__(self, name:str, max_workers:Optional[int]=None,
+                 hook:Optional['MetricsHook']=None):
+        """
+        Initialize.
+
+        :param name: name of the decorated function
+        :param max_workers: max_workers of the call
+        :param hook: MetricsHook the stats are reported to
+        """
+        self.hook = hook
+        self.name = name
+        self.max_workers = max_workers
+        self.num_chunks = 0
+        self.num_succeeded = 0
+        self.num_failed = 0
+        self.chunking_time = 0.0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.run_time = 0.0
+        self.max_run_time = 0.0
+        self.running = 0
+        self.max_running = 0
+        self.reduce_time = 0.0
+        self.elapsed = 0.0
+
+    def attempt_started(self):
+        """Count a chunk attempt starting to run."""
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+
+    def attempt_finished(self):
+        """Count a chunk attempt done running."""
+        self.running -= 1
+
+    def chunk_done(self, succeeded:bool, wait:float, run_time:float):
+        """Account for a completed chunk."""
+        self.num_chunks += 1
+        if succeeded:
+            self.num_succeeded += 1
+        else:
+            self.num_failed += 1
+        self.wait_time += wait
+        self.max_wait_time = max(self.max_wait_time, wait)
+        self.run_time += run_time
+        self.max_run_time = max(self.max_run_time, run_time)
+
+    def as_dict(self):
+        """Return the stats and mean chunk times, e.g. for telemetry."""
+        stats = dict(vars(self))
+        del stats['hook'], stats['running']
+        stats['mean_wait_time'] = \
+            self.wait_time / self.num_chunks if self.num_chunks else 0.0
+        stats['mean_run_time'] = \
+            self.run_time / self.num_chunks if self.num_chunks else 0.0
+        return stats
+
+    def __repr__(self):
+        """Return a representation of the stats."""
+        return f'CallStats({self.as_dict()!r})'
+
+
+class MetricsHook:
+    """
+    Receiver of the metrics of calls, override the methods needed.
+
+    The methods are called on the event loop of the calls.
+    """
+
+    def call_started(self, stats:CallStats):
+        """Handle the start of a call."""
+
+    def chunk_done(self, stats:CallStats, index:int, succeeded:bool,
+                   wait:float, run_time:float):
+        """Handle a completed chunk, stats already account for it."""
+
+    def call_done(self, stats:CallStats):
+        """Handle the end of a call, whether it succeeded or not."""
+
+
+@contextmanager
+def collect_stats():
+    """
+    Collect the stats of the calls made in the context.
+
+    Yields a list, CallStats are appended to it as the calls start.
+    """
+    collected = []
+    token = _COLLECTORS.set(_COLLECTORS.get() + (collected,))
+    try:
+        yield collected
+    finally:
+        _COLLECTORS.reset(token)
+
+
+def start_call(name:str, max_workers:Optional[int]=None,
+               hook:Optional[MetricsHook]=None):
+    """Return the stats of a new call, None if nobody looks at them."""
+    collectors = _COLLECTORS.get()
+    if hook is None and not collectors:
+        return None
+    stats = CallStats(name, max_workers, hook)
+    for collected in collectors:
+        collected.append(stats)
+    if hook is not None:
+        hook.call_started(stats)
+    return stats
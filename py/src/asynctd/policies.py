@@ -0,0 +1,117 @@
+"""
+Success and retry policies of distributed runs.
+
+A success policy decides the outcome of a call from the outcome of its
+chunks; FIRST_SUCCESS and Quorum end the call as soon as enough chunks
+succeeded. A RetryPolicy reruns failed chunks.
+"""
+
+import math
+import random
+from enum import Enum
+from typing import Callable, Optional, Union
+
+
+class SuccessPolicy(Enum):
+    """Define success status of all the worker runs."""
+
+    EXPECT_ALL = 0  # most restrictive, success if all runs are successful
+    EXPECT_ANY = 1  # success if one or more runs are successful
+    SUPER_LAX = 2  # most permissive, success even if everything failed
+    FIRST_SUCCESS = 3  # success once a run is successful, others cancelled
+
+
+class Quorum:
+    """
+    Success policy: success once enough of the runs are successful.
+
+    The distributed call returns as soon as the quorum is reached,
+    the outstanding runs are cancelled. Fails if all the runs are
+    done and the quorum isn't reached.
+    """
+
+    def __init__(self, count:Optional[int]=None,
+                 fraction:Optional[float]=None):
+        """
+        Initialize.
+
+        :param count: number of successful runs required
+        :param fraction: fraction of the runs required to be successful;
+         evaluated once the total number of runs is known, i.e. the
+         divided parts are sized or the divider is exhausted
+        """
+        if (count is None) == (fraction is None):
+            raise ValueError('Exactly one of count and fraction is expected')
+        if count is not None and count < 1:
+            raise ValueError('Quorum count must be positive')
+        if fraction is not None and not 0 < fraction <= 1:
+            raise ValueError('Quorum fraction must be in (0, 1]')
+        self.count = count
+        self.fraction = fraction
+
+    def required(self, num_runs:Optional[int]):
+        """Return the successful runs required, None while unknown."""
+        if self.count is not None:
+            return self.count
+        if num_runs is None:
+            return None
+        return max(1, math.ceil(self.fraction * num_runs))
+
+    def reached(self, num_succeeded:int, num_runs:Optional[int]):
+        """Check the quorum, num_runs is None while unknown."""
+        required = self.required(num_runs)
+        return required is not None and num_succeeded >= required
+
+
+class RetryPolicy:
+    """
+    Retry failed chunks with exponential backoff and jitter.
+
+    Only the failed chunk is rerun, each attempt takes a max_workers
+    slot of its own (the slot is released while backing off).
+    """
+
+    def __init__(
+            self,
+            max_attempts:int=3,
+            *,
+            initial_backoff:float=0.1,
+            max_backoff:float=10.0,
+            multiplier:float=2.0,
+            jitter:bool=True,
+            retry_on:Union[type, tuple, Callable[[Exception], bool]]=\
+                Exception):
+        """
+        Initialize.
+
+        :param max_attempts: maximum number of times a chunk is run
+        :param initial_backoff: seconds to wait before the first retry
+        :param max_backoff: upper bound of the wait between retries
+        :param multiplier: factor the backoff grows by with every retry
+        :param jitter: wait a random time up to the backoff ("full
+         jitter"), so that retries of chunks failed together spread out
+        :param retry_on: exception type(s) worth retrying, or a predicate
+         taking the exception
+        """
+        if max_attempts < 1:
+            raise ValueError('max_attempts must be positive')
+        self.max_attempts = max_attempts
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.retry_on = retry_on
+
+    def should_retry(self, attempt:int, ex:Exception):
+        """Check if a chunk failed on the given attempt is to be rerun."""
+        if attempt >= self.max_attempts:
+            return False
+        if isinstance(self.retry_on, (type, tuple)):
+            return isinstance(ex, self.retry_on)
+        return bool(self.retry_on(ex))
+
+    def backoff(self, attempt:int):
+        """Return seconds to wait after the given failed attempt."""
+        backoff = min(self.max_backoff, self.initial_backoff *
+                      self.multiplier ** (attempt - 1))
+        return random.uniform(0, backoff) if self.jitter else backoff
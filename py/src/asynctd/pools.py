@@ -0,0 +1,136 @@
+"""
+Persistent worker pools, shared by the calls of decorated functions.
+
+Creating a pool per call (backend=THREAD or PROCESS) costs a process or
+thread start per worker and call, which dominates short calls. A
+WorkerPool is created once and given as the executor of
+run_distributively: its workers are started and initialized (e.g. load
+a model or a dictionary) upfront, and reused by every call. It can be
+drained (new calls refused, calls in flight finished) before shutdown.
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import (
+    Executor, ProcessPoolExecutor, ThreadPoolExecutor)
+from typing import Callable, Optional
+
+
+WARM_UP_TIMEOUT = 60
+
+
+def _worker_id(barrier:Optional[threading.Barrier]=None):
+    """Identify the worker running the call, once all the others run."""
+    if barrier is not None:
+        barrier.wait(WARM_UP_TIMEOUT)
+    return os.getpid(), threading.get_ident()
+
+
+class WorkerPool(Executor):
+    """
+    Long-lived pool of warm thread or process workers.
+
+    Tracks the calls in flight so that it can be drained. Process
+    workers get functions and arguments pickled, the initializer too
+    unless processes are forked.
+    """
+
+    def __init__(self, max_workers:Optional[int]=None, *,
+                 processes:bool=False,
+                 initializer:Optional[Callable]=None,
+                 initargs:tuple=(),
+                 warm_up:bool=True,
+                 mp_context:Optional[multiprocessing.context.BaseContext]=\
+                     None):
+        """
+        Initialize.
+
+        :param max_workers: number of workers (os.cpu_count() for
+         processes, the ThreadPoolExecutor default for threads)
+        :param processes: run the calls in worker processes rather than
+         threads
+        :param initializer: called with initargs in each worker as it
+         starts, e.g. to preload data
+        :param initargs: arguments of initializer
+        :param warm_up: start (and initialize) all the workers now
+         instead of on the first calls; fails if the initializer does
+        :param mp_context: multiprocessing context of process workers
+        """
+        if processes:
+            self.executor = ProcessPoolExecutor(
+                max_workers, mp_context, initializer, initargs)
+        else:
+            self.executor = ThreadPoolExecutor(
+                max_workers, 'asynctd-pool', initializer, initargs)
+        # pylint: disable=W0212
+        self.max_workers = self.executor._max_workers
+        self.processes = processes
+        self._condition = threading.Condition()
+        self._in_flight = set()
+        self._draining = False
+        if warm_up:
+            try:
+                self.warm_up()
+            except BaseException:
+                self.executor.shutdown(cancel_futures=True)
+                raise
+
+    def warm_up(self):
+        """
+        Start and initialize the workers, return their number.
+
+        Threads are held until all of them started, since idle ones
+        would be reused. Process workers are all started by the first
+        call of a forking pool; other pools start one per call until
+        one is idle, which few are during the warm-up.
+        """
+        barrier = None if self.processes else \
+            threading.Barrier(self.max_workers)
+        futures = [self.executor.submit(_worker_id, barrier)
+                   for _ in range(self.max_workers)]
+        return len({future.result() for future in futures})
+
+    @property
+    def num_in_flight(self):
+        """Return the number of calls submitted and not done yet."""
+        with self._condition:
+            return len(self._in_flight)
+
+    def submit(self, fn, /, *args, **kwargs):
+        """Submit a call, refused once the pool is draining."""
+        with self._condition:
+            if self._draining:
+                raise RuntimeError(
+                    'cannot schedule new futures on a drained pool')
+            future = self.executor.submit(fn, *args, **kwargs)
+            self._in_flight.add(future)
+        future.add_done_callback(self._call_done)
+        return future
+
+    def drain(self, timeout:Optional[float]=None):
+        """
+        Refuse new calls, wait for the ones in flight to finish.
+
+        Return True if they all did within timeout. Blocks, call it
+        with asyncio.to_thread() from the event loop.
+        """
+        with self._condition:
+            self._draining = True
+            return self._condition.wait_for(
+                lambda: not self._in_flight, timeout)
+
+    def shutdown(self, wait:bool=True, *, cancel_futures:bool=False):
+        """Drain (unless cancelling the pending calls), stop the workers."""
+        with self._condition:
+            self._draining = True
+        if wait and not cancel_futures:
+            self.drain()
+        self.executor.shutdown(wait, cancel_futures=cancel_futures)
+
+    def _call_done(self, future):
+        """Stop tracking a call."""
+        with self._condition:
+            self._in_flight.discard(future)
+            if not self._in_flight:
+                self._condition.notify_all()
@@ -0,0 +1,74 @@
+"""
+Built-in result reducers for run_distributively.
+
+The partial results are combined with C-level loops (or NumPy
+operations) rather than item by item in Python.
+"""
+
+import itertools
+from collections import Counter
+from collections.abc import Iterable, Mapping
+
+from asynctd.arrays import is_ndarray, numpy_module
+
+
+def sum_reducer(partials:Iterable):
+    """
+    Sum the partial results.
+
+    Numbers are summed with sum(), NumPy arrays element-wise,
+    in place in a single output array.
+    """
+    partials = iter(partials)
+    total = next(partials, 0)
+    if not is_ndarray(total):
+        return sum(partials, total)
+    total = total.copy()
+    for partial in partials:
+        total += partial
+    return total
+
+
+def concat_reducer(partials:Iterable):
+    """
+    Concatenate the partial results, in chunk order.
+
+    NumPy arrays are concatenated by numpy.concatenate, bytes-like
+    partials and strings are joined, other iterables are chained
+    into a list.
+    """
+    partials = list(partials)
+    if not partials:
+        return []
+    first = partials[0]
+    if is_ndarray(first):
+        return numpy_module().concatenate(partials)
+    if isinstance(first, str):
+        return ''.join(partials)
+    if isinstance(first, (bytes, bytearray, memoryview)):
+        return b''.join(partials)
+    return list(itertools.chain.from_iterable(partials))
+
+
+def merge_reducer(partials:Iterable):
+    """
+    Merge mapping partial results.
+
+    Counters are added up; for other mappings the partial of the
+    later chunk wins on conflicting keys.
+    """
+    partials = iter(partials)
+    first = next(partials, None)
+    if first is None:
+        return {}
+    if isinstance(first, Counter):
+        merged = Counter(first)
+        for partial in partials:
+            merged.update(partial)
+        return merged
+    if not isinstance(first, Mapping):
+        raise TypeError(f'Cannot merge {type(first).__name__} partials')
+    merged = dict(first)
+    for partial in partials:
+        merged.update(partial)
+    return merged
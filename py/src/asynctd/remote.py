@@ -0,0 +1,377 @@
+"""
+Remote execution of the chunks of distributed runs.
+
+Coordinator is a concurrent.futures.Executor shipping calls to worker
+daemons (serve) connected over TCP or Unix sockets, from this host or
+others; pass it as the executor of run_distributively. LocalCluster runs
+the daemons as local processes, a stand-in for a cluster in tests and
+on a single host. Calls in flight on a lost worker are reassigned.
+
+Calls and results are pickled, functions are sent by import path and
+must be importable by the workers. Connections are authenticated with
+an authkey, random text unless given (coordinator.authkey), since calls
+and results are unpickled: hand it to the workers only.
+
+Run a worker daemon on a host with:
+  ASYNCTD_AUTHKEY=<coordinator.authkey> python -m asynctd.remote HOST:PORT [--max-workers N]
+"""
+
+import argparse
+import concurrent.futures
+import itertools
+import multiprocessing
+import os
+import pickle
+import secrets
+import socket
+import threading
+import traceback
+from collections import deque
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from multiprocessing.connection import Client, Listener
+from typing import Optional, Union
+
+DEFAULT_MAX_ASSIGNMENTS = 3
+
+Address = Union[tuple, str]
+
+
+class WorkerLost(Exception):
+    """Workers were lost while running a call, too many times."""
+
+
+class RemoteTraceback(Exception):
+    """Traceback of an exception raised in a worker daemon."""
+
+    def __init__(self, tb:str):
+        """Initialize."""
+        super().__init__(tb)
+        self.tb = tb
+
+    def __str__(self):
+        """Return the traceback."""
+        return self.tb
+
+
+class _Task:
+    """Call submitted to the coordinator."""
+
+    __slots__ = ('future', 'payload', 'assignments')
+
+    def __init__(self, future:Future, payload:bytes):
+        """Initialize."""
+        self.future = future
+        self.payload = payload
+        self.assignments = 0
+
+
+class _Worker:
+    """Worker daemon connected to the coordinator."""
+
+    def __init__(self, conn, capacity:int, name:str):
+        """Initialize."""
+        self.conn = conn
+        self.capacity = capacity
+        self.name = name
+        self.tasks = {}  # in flight, by task id
+
+
+class Coordinator(Executor):
+    """
+    Executor running calls on the worker daemons connected to it.
+
+    Calls are queued until a worker has room for them (each worker
+    runs up to its max_workers calls at once). When a worker is lost
+    its calls in flight go back to the front of the queue, a call is
+    failed with WorkerLost once it was assigned max_assignments times.
+    """
+
+    def __init__(self, address:Address=('localhost', 0),
+                 authkey:Optional[bytes]=None,
+                 max_assignments:int=DEFAULT_MAX_ASSIGNMENTS):
+        """
+        Initialize, start listening.
+
+        :param address: (host, port) to listen on, port 0 to pick
+         a free one, or the path of a Unix socket
+        :param authkey: secret the workers authenticate with,
+         random hex text unless set, so it fits in ASYNCTD_AUTHKEY
+        :param max_assignments: times a call may be assigned to workers
+         that get lost before it fails
+        """
+        self.authkey = secrets.token_hex(32).encode() if authkey is None else authkey
+        self._listener = Listener(address, authkey=self.authkey)
+        self.address = self._listener.address
+        self.max_assignments = max_assignments
+        self._condition = threading.Condition()
+        self._pending = deque()
+        self._workers = []
+        self._task_ids = itertools.count()
+        self._shutdown = False
+        self._stopped = False
+        self._accepting = None
+        self._start()
+
+    def _start(self):
+        """Start accepting workers."""
+        self._accepting = threading.Thread(
+            target=self._accept, name='asynctd-coordinator', daemon=True)
+        self._accepting.start()
+
+    @property
+    def num_workers(self):
+        """Return the number of connected workers."""
+        with self._condition:
+            return len(self._workers)
+
+    def wait_for_workers(self, num_workers:int,
+                         timeout:Optional[float]=None):
+        """Wait for num_workers workers to connect, return if they did."""
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: len(self._workers) >= num_workers, timeout)
+
+    def submit(self, fn, /, *args, **kwargs):
+        """Queue fn(*args, **kwargs) to run on a worker."""
+        task = _Task(Future(), pickle.dumps(
+            (fn, args, kwargs), protocol=pickle.HIGHEST_PROTOCOL))
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError(
+                    'cannot schedule new futures after shutdown')
+            self._pending.append(task)
+            self._dispatch()
+        return task.future
+
+    def shutdown(self, wait:bool=True, *, cancel_futures:bool=False):
+        """
+        Stop accepting calls and workers, stop the workers.
+
+        Calls submitted already still run, unless cancel_futures;
+        with wait, return once they completed.
+        """
+        with self._condition:
+            self._shutdown = True
+            if cancel_futures:
+                for task in self._pending:
+                    task.future.cancel()
+                self._pending.clear()
+            futures = [task.future for task in self._pending] + [
+                task.future for worker in self._workers
+                for task in worker.tasks.values()]
+        self._wake_listener()
+        if wait:
+            self._stop(futures)
+        else:
+            threading.Thread(
+                target=self._stop, args=(futures,), daemon=True).start()
+
+    def _stop(self, futures:list):
+        """Stop the workers once the futures are done."""
+        concurrent.futures.wait(futures)
+        self._accepting.join()
+        self._listener.close()
+        with self._condition:
+            self._stopped = True
+            for worker in self._workers:
+                try:
+                    worker.conn.send(None)
+                except OSError:
+                    pass
+
+    def _wake_listener(self):
+        """Connect to the listener so that it notices the shutdown."""
+        family = socket.AF_UNIX if isinstance(self.address, str) \
+            else socket.AF_INET
+        try:
+            with socket.socket(family) as sock:
+                sock.connect(self.address)
+        except OSError:
+            pass
+
+    def _accept(self):
+        """Accept worker connections until shutdown."""
+        while True:
+            try:
+                conn = self._listener.accept()
+            except (OSError, EOFError, multiprocessing.AuthenticationError):
+                conn = None
+            with self._condition:
+                if self._shutdown:
+                    if conn is not None:
+                        conn.close()
+                    return
+            if conn is not None:
+                threading.Thread(
+                    target=self._serve_worker, args=(conn,),
+                    name='asynctd-worker-link', daemon=True).start()
+
+    def _serve_worker(self, conn):
+        """Register a worker, collect its results until it's lost."""
+        try:
+            _, capacity, name = conn.recv()
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError):
+            conn.close()
+            return
+        worker = _Worker(conn, capacity, name)
+        with self._condition:
+            if self._stopped:
+                conn.close()
+                return
+            self._workers.append(worker)
+            self._condition.notify_all()
+            self._dispatch()
+        try:
+            while True:
+                task_id, ok, data, tb = conn.recv()
+                with self._condition:
+                    task = worker.tasks.pop(task_id)
+                    self._dispatch()
+                try:
+                    value = pickle.loads(data)
+                except Exception as ex:  # pylint: disable=W0718
+                    ok, value = False, ex
+                if ok:
+                    task.future.set_result(value)
+                    continue
+                if tb is not None:
+                    value.__cause__ = RemoteTraceback(tb)
+                task.future.set_exception(value)
+        except (OSError, EOFError):
+            self._lose(worker)
+
+    def _lose(self, worker:_Worker):
+        """Forget a lost worker, reassign its calls in flight."""
+        worker.conn.close()
+        with self._condition:
+            self._workers.remove(worker)
+            failed = [task for task in worker.tasks.values()
+                      if task.assignments >= self.max_assignments]
+            self._pending.extendleft(reversed([
+                task for task in worker.tasks.values()
+                if task.assignments < self.max_assignments]))
+            worker.tasks.clear()
+            self._dispatch()
+        for task in failed:
+            task.future.set_exception(WorkerLost(
+                f'Worker {worker.name} lost, the call was assigned '
+                f'{task.assignments} times'))
+
+    def _dispatch(self):
+        """Send queued calls to the least busy workers with room."""
+        while self._pending and self._workers:
+            worker = max(self._workers,
+                         key=lambda w: w.capacity - len(w.tasks))
+            if len(worker.tasks) >= worker.capacity:
+                return
+            task = self._pending.popleft()
+            if task.assignments == 0 and \
+                    not task.future.set_running_or_notify_cancel():
+                continue
+            task.assignments += 1
+            task_id = next(self._task_ids)
+            worker.tasks[task_id] = task
+            try:
+                worker.conn.send((task_id, task.payload))
+            except OSError:
+                # The worker link notices the loss and reassigns
+                return
+
+
+class LocalCluster(Coordinator):
+    """Coordinator with worker daemons running as local processes."""
+
+    def __init__(self, num_workers:int=2, max_workers:int=1, *,
+                 address:Address=('localhost', 0),
+                 authkey:Optional[bytes]=None,
+                 max_assignments:int=DEFAULT_MAX_ASSIGNMENTS,
+                 mp_context=None):
+        """
+        Initialize, start the workers.
+
+        :param num_workers: number of worker processes
+        :param max_workers: calls each worker runs at once
+        :param mp_context: multiprocessing context to start
+         the workers with
+        """
+        self.processes = []
+        self._worker_args = (num_workers, max_workers, mp_context)
+        super().__init__(address, authkey, max_assignments)
+
+    def _start(self):
+        """Start the workers, then accepting them (not to fork threads)."""
+        num_workers, max_workers, mp_context = self._worker_args
+        mp_context = mp_context or multiprocessing.get_context()
+        for _ in range(num_workers):
+            process = mp_context.Process(
+                target=serve, args=(self.address, self.authkey, max_workers),
+                daemon=True)
+            process.start()
+            self.processes.append(process)
+        super()._start()
+
+    def shutdown(self, wait:bool=True, *, cancel_futures:bool=False):
+        """Stop the coordinator and the worker processes."""
+        super().shutdown(wait, cancel_futures=cancel_futures)
+        if wait:
+            for process in self.processes:
+                process.join(timeout=5)
+                if process.is_alive():
+                    process.kill()
+                    process.join()
+
+
+def serve(address:Address, authkey:bytes, max_workers:int=1):
+    """Run a worker daemon for the coordinator at address until stopped."""
+    conn = Client(address, authkey=authkey)
+    send_lock = threading.Lock()
+
+    def run(task_id, payload):
+        try:
+            fn, args, kwargs = pickle.loads(payload)
+            reply = (task_id, True, pickle.dumps(
+                fn(*args, **kwargs), protocol=pickle.HIGHEST_PROTOCOL), None)
+        except Exception as ex:  # pylint: disable=W0718
+            try:
+                data = pickle.dumps(ex, protocol=pickle.HIGHEST_PROTOCOL)
+            except Exception:  # pylint: disable=W0718
+                data = pickle.dumps(RuntimeError(repr(ex)))
+            reply = (task_id, False, data, traceback.format_exc())
+        with send_lock:
+            try:
+                conn.send(reply)
+            except OSError:
+                pass
+
+    with conn, ThreadPoolExecutor(max_workers) as pool:
+        conn.send(('hello', max_workers,
+                   f'{socket.gethostname()}:{os.getpid()}'))
+        while True:
+            try:
+                message = conn.recv()
+            except (OSError, EOFError):
+                break
+            if message is None:
+                break
+            pool.submit(run, *message)
+
+
+def main():
+    """Run a worker daemon from the command line."""
+    parser = argparse.ArgumentParser(description='asynctd worker daemon')
+    parser.add_argument(
+        'address', help='HOST:PORT of the coordinator, or a Unix socket path')
+    parser.add_argument('--max-workers', type=int, default=1)
+    cli_args = parser.parse_args()
+    address = cli_args.address
+    if ':' in address:
+        host, port = address.rsplit(':', 1)
+        address = (host, int(port))
+    authkey = os.environ.get('ASYNCTD_AUTHKEY')
+    if not authkey:
+        parser.error('ASYNCTD_AUTHKEY must be set to the coordinator authkey')
+    serve(address, authkey.encode(), cli_args.max_workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -13,88 +13,647 @@ Supported semantics:
   result reducer
   policy for exception handling
   maximum number of concurrent workers controlled via semaphore
+  execution backend (event loop, thread pool or process pool)
+  synchronous functions (run in a thread pool by default)
+  lazy chunk generation, bounded number of chunks in flight
+  incremental (fold-style) reduction as partial results arrive
+  streaming of per-chunk results as they complete
+  fail-fast cancellation of outstanding workers
+  early exit on first success or quorum
+  compact exception descriptors, identical errors counted
+  per-chunk timeouts, deadline of the call, hedging of stragglers
+   (asynctd.hedging)
+  retries of failed chunks with backoff
+  rate limiting (token bucket)
+  concurrency limiters shared across functions and calls, with
+   priority and weighted fair scheduling between calls
+  remote workers over sockets (asynctd.remote.Coordinator as executor)
+  zero-copy shared memory transport of chunks to worker processes
+  built-in view dividers and vectorized reducers (asynctd.dividers,
+   asynctd.reducers)
+  parallel tree reduction for associative reducers
+  content-addressed cache of chunk results (memory LRU/TTL, sqlite)
+  checkpoints of chunk results, resuming calls after a crash
+  per-call metrics (asynctd.metrics): chunking, wait, run and reduce
+   times, concurrency high-water mark, success and failure counts
+  detection of chunks blocking the event loop, sampled cProfile
+   profiling of chunks (asynctd.diagnostics)
+  persistent warm worker pools shared by calls (asynctd.pools)
 """
 
 import asyncio
+import functools
 import inspect
-import json
 import logging
-import os
-import sys
-import traceback
-from copy import deepcopy
-from enum import Enum
-from typing import Any, Callable, Optional, Sequence
+import time
+from collections import namedtuple
+from collections.abc import (
+    AsyncIterable, AsyncIterator, Iterable, Mapping, Sized)
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import aclosing
+from typing import Any, Callable, Optional, Union
+
+from asynctd.limiters import (
+    ConcurrencyLimiter, Flow, TokenBucket, named_limiter)
+from asynctd import transport
+from asynctd.cache import ResultCache
+from asynctd.checkpoint import CheckpointStore
+from asynctd.diagnostics import Diagnostics
+from asynctd.exceptions import (
+    DEFAULT_MAX_EX_SAMPLES, ExceptionCollector, ExceptionDescriptor,
+    MappedException, summarize_inputs)
+from asynctd.executors import (
+    ExecutionBackend, backend_pool_factory, call_context, in_executor,
+    pool_of)
+from asynctd.hedging import HEDGE_MIN_SAMPLES, LatencyTracker, hedged
+from asynctd.metrics import CallStats, MetricsHook, start_call
+from asynctd.policies import Quorum, RetryPolicy, SuccessPolicy
 
 logger = logging.getLogger()
 
 DEFAULT_NUM_WORKERS = 1000
+REDUCE_FAN_IN = 8  # partials per reduction of associative reducers
 
-class SuccessPolicy(Enum):
-    """Define success status of all the worker runs."""
+_NO_RESULT = object()
 
-    EXPECT_ALL = 0  # most restrictive, success if all runs are successful
-    EXPECT_ANY = 1  # success if one or more runs are successful
-    SUPER_LAX = 2  # most permissive, success even if everything failed
 
+ChunkResult = namedtuple('ChunkResult', ['index', 'result', 'ex'])
+ChunkResult.__doc__ = """
+Result of a single chunk: index in input order,
+the worker's result, exception descriptor if the worker failed.
+"""
+
+
+async def _iterate(parts:Union[Iterable, AsyncIterable]):
+    """Iterate over sync and async iterables alike."""
+    if isinstance(parts, AsyncIterable):
+        async for part in parts:
+            yield part
+    else:
+        for part in parts:
+            yield part
+
+
+class _ArgBinding:
+    """
+    Plan for substituting the mapped argument, resolved once per function.
 
-class MappedException(Exception):
-    """Support exceptions reported by multiple workers."""
+    Locates the mapped argument in the args/kwargs of a call (positional,
+    keyword, positional-only, keyword-only, defaulted or caught by
+    **kwargs) and builds args/kwargs of a chunk by replacing it with
+    a part. All the other arguments are shared by the chunks, not copied.
+    """
 
-    def __init__(self, orig_ex_descriptors):
+    def __init__(self, func:Callable, mapped_arg:Optional[str]):
         """
         Initialize.
 
-        :param orig_ex_descriptors: list of error descriptors coming from all the
-         workers that threw an exception
+        :param func: the function to be run distributively
+        :param mapped_arg: name of the argument to be divided
+        """
+        self.mapped_arg = mapped_arg
+        self.position = None
+        self.keyword = True
+        self.default = inspect.Parameter.empty
+        self.position_defaults = ()
+        params = list(inspect.signature(func).parameters.values())
+        param = next((
+            param for param in params if param.name == mapped_arg and
+            param.kind not in (inspect.Parameter.VAR_POSITIONAL,
+                               inspect.Parameter.VAR_KEYWORD)), None)
+        if param is None:
+            return  # may still come through **kwargs
+        self.default = param.default
+        if param.kind in (inspect.Parameter.POSITIONAL_ONLY,
+                          inspect.Parameter.POSITIONAL_OR_KEYWORD):
+            self.position = params.index(param)
+            self.keyword = param.kind != inspect.Parameter.POSITIONAL_ONLY
+            self.position_defaults = tuple(
+                param.default for param in params[:self.position])
+
+    def locate(self, args:tuple, kwargs:dict):
         """
-        super().__init__(
-            json.dumps(orig_ex_descriptors, indent=4) +
-            f'\n{len(orig_ex_descriptors)} workers threw exception(s)')
+        Find the value of the mapped argument in a call.
 
+        Return the value (None if absent) and a function building
+        (args, kwargs) of a chunk from a part of the value.
+        """
+        mapped_arg = self.mapped_arg
+        position = self.position
+        if mapped_arg is None:
+            return None, None
+        if position is not None and position < len(args):
+            return args[position], lambda part: (
+                args[:position] + (part,) + args[position+1:], kwargs)
+        if self.keyword and mapped_arg in kwargs:
+            return kwargs[mapped_arg], lambda part: (
+                args, {**kwargs, mapped_arg: part})
+        if self.default is inspect.Parameter.empty:
+            return None, None
+        if self.keyword:
+            return self.default, lambda part: (
+                args, {**kwargs, mapped_arg: part})
+        # Positional-only with a default, fill in the skipped defaults
+        args = args + self.position_defaults[len(args):]
+        return self.default, lambda part: (args + (part,), kwargs)
+
+
+def _is_empty(value:Any):
+    """Check if a mapped argument is empty (NumPy arrays included)."""
+    return len(value) == 0 if isinstance(value, Sized) else not value
+
+
+def _divide(
+        binding:_ArgBinding, wrapped_args:tuple, wrapped_kwargs:dict,
+        arg_value_divider:Optional[
+            Callable[[Any], Optional[Union[Iterable, AsyncIterable]]]],
+        share:Optional[Callable]=None):
+    """
+    Divide the mapped argument of a call.
 
-def _per_worker_args(
-        func:Callable, wrapped_args:tuple, wrapped_kwargs:dict,
-        mapped_arg:Any, arg_value_divider:Optional[
-            Callable[[Sequence], Optional[Sequence[Sequence]]]]):
-    """Build args per worker from the original args."""
-    func_arg_spec = inspect.getfullargspec(func)
+    Return the parts (None if the argument isn't divided) and
+    a function building (args, kwargs) of a chunk from a part.
+    The argument is replaced by share(argument) before it's divided.
+    """
     if arg_value_divider is None:
         arg_value_divider = lambda l: l  # Default to no splitting
 
-    def build_function_args(divided_arg_subset, orig_args, orig_kwargs):
-        """
-        Build replacement *args, **kwargs.
-
-        Use a subset in place of the original divisible arg
-        """
-        new_args = [orig_args[i] if func_arg_spec.args[i] !=
-                    mapped_arg else divided_arg_subset
-                    for i in range(len(func_arg_spec.args))]
-        new_args.extend(orig_args[len(func_arg_spec.args):])
-        new_kwargs = deepcopy(orig_kwargs)
-        if mapped_arg in new_kwargs:
-            new_kwargs[mapped_arg] = divided_arg_subset
-        return new_args, new_kwargs
-
-    premapped_arg_value = None
-    if mapped_arg in func_arg_spec.args:
-        premapped_arg_value = wrapped_args[
-            func_arg_spec.args.index(mapped_arg)]
-    elif mapped_arg in wrapped_kwargs:
-        premapped_arg_value = wrapped_kwargs[mapped_arg]
+    premapped_arg_value, build_function_args = binding.locate(
+        wrapped_args, wrapped_kwargs)
+    if share is not None and premapped_arg_value is not None:
+        premapped_arg_value = share(premapped_arg_value)
 
     # Use arg_value_divider to control the minimum number of tasks
-    arg_value_parts = arg_value_divider(
-        premapped_arg_value) if premapped_arg_value else []
+    arg_value_parts = None if _is_empty(premapped_arg_value) else \
+        arg_value_divider(premapped_arg_value)
+    return arg_value_parts, build_function_args
 
-    mapped_arg_values = [
-        build_function_args(
-            arg_value_part, wrapped_args, wrapped_kwargs)
-        for arg_value_part in arg_value_parts
-    ] if arg_value_parts else [[wrapped_args, wrapped_kwargs]]
 
-    return mapped_arg_values
+async def _per_worker_args(
+        arg_value_parts:Optional[Union[Iterable, AsyncIterable]],
+        build_function_args:Callable, wrapped_args:tuple,
+        wrapped_kwargs:dict, stats:Optional[CallStats]=None):
+    """
+    Build args per worker from the original args.
+
+    Chunks are produced lazily, as the arg_value_divider yields them,
+    so the divider may be a generator or return an async iterator.
+    The time spent producing them is added to stats.chunking_time.
+    """
+    divided = False
+    if arg_value_parts:
+        start_time = time.perf_counter()
+        async for arg_value_part in _iterate(arg_value_parts):
+            divided = True
+            worker_args = build_function_args(arg_value_part)
+            if stats is not None:
+                stats.chunking_time += time.perf_counter() - start_time
+            yield worker_args
+            start_time = time.perf_counter()
+    if not divided:
+        yield wrapped_args, wrapped_kwargs
+
+
+async def _run_chunks(
+        per_worker_arg_chunks:AsyncIterator, run_chunk:Callable,
+        window:int, *, ordered:bool=False, progress:Optional[dict]=None,
+        completed:Optional[Mapping]=None, watch:Optional[Callable]=None):
+    """
+    Run chunks, keeping at most window of them in flight.
+
+    Chunks are pulled from per_worker_arg_chunks on demand, yields
+    (chunk index, worker result) pairs in completion order, or in
+    input order if ordered. In the latter case results that are done
+    ahead of their turn count against the window.
+    Outstanding chunks are cancelled if the consumer stops early.
+    The number of chunks dispatched so far is kept in progress,
+    as well as the total number once the chunks are exhausted.
+    Chunks whose index is in completed aren't run, their worker result
+    is taken from it. With watch, chunks are run by
+    watch(index, run_chunk, *worker_args).
+    """
+    pending = {}
+    reorder_buffer = {}
+    next_index = 0
+    # Completed tasks are queued by their done callbacks, which keeps
+    # the cost per completion constant (asyncio.wait is O(window))
+    done = asyncio.Queue()
+    exhausted = False
+    num_chunks = 0
+    try:
+        while True:
+            while not exhausted and \
+                    len(pending) + len(reorder_buffer) < window:
+                try:
+                    worker_args = await anext(per_worker_arg_chunks)
+                except StopAsyncIteration:
+                    exhausted = True
+                    if progress is not None:
+                        progress['total'] = num_chunks
+                    break
+                if completed is not None and num_chunks in completed:
+                    task = asyncio.get_running_loop().create_future()
+                    task.set_result(completed[num_chunks])
+                else:
+                    task = asyncio.ensure_future(
+                        run_chunk(*worker_args) if watch is None
+                        else watch(num_chunks, run_chunk, *worker_args))
+                task.add_done_callback(done.put_nowait)
+                pending[task] = num_chunks
+                num_chunks += 1
+                if progress is not None:
+                    progress['dispatched'] = num_chunks
+            if not pending:
+                return
+            task = await done.get()
+            if not ordered:
+                yield pending.pop(task), task.result()
+                continue
+            reorder_buffer[pending.pop(task)] = task.result()
+            while next_index in reorder_buffer:
+                yield next_index, reorder_buffer.pop(next_index)
+                next_index += 1
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def _apply(func:Callable, *args):
+    """Call func, awaiting the result if it's a coroutine function."""
+    if asyncio.iscoroutinefunction(func):
+        return await func(*args)
+    return func(*args)
+
+
+async def _tree_reduce(reducer:Callable, partials:list,
+                       executor:Optional[Executor]=None,
+                       fan_in:int=REDUCE_FAN_IN):
+    """
+    Reduce partials with an associative reducer, in a tree.
+
+    Each level reduces groups of fan_in adjacent partials concurrently
+    (on the executor, the loop's default one if None, unless reducer
+    is a coroutine function), so the order of the partials is kept
+    and the depth is logarithmic.
+    """
+    if inspect.iscoroutinefunction(reducer):
+        reduce_group = reducer
+    else:
+        loop = asyncio.get_running_loop()
+        reduce_group = functools.partial(
+            loop.run_in_executor, executor, reducer)
+    while True:
+        partials = await asyncio.gather(*(
+            reduce_group(partials[i:i + fan_in])
+            for i in range(0, len(partials), fan_in)))
+        if len(partials) <= 1:
+            return partials[0] if partials else await _apply(reducer, [])
+
+
+async def _run_worker(
+        semaphore:Optional[asyncio.Semaphore], func:Callable,
+        args:tuple, kwargs:dict, *,
+        inputs_summarizer:Optional[Callable]=summarize_inputs,
+        timeout:Optional[float]=None,
+        latencies:Optional[LatencyTracker]=None,
+        retry_policy:Optional[RetryPolicy]=None,
+        rate_limit:Optional[TokenBucket]=None,
+        limiter:Optional[ConcurrencyLimiter]=None,
+        flow:Optional[Flow]=None,
+        stats:Optional[CallStats]=None):
+    """
+    Run a single worker async.
+
+    Return the result or the exception descriptor, the time spent
+    running the worker and the time spent waiting for the semaphore,
+    the limiter and the rate limit (over all the attempts).
+    Time out after timeout seconds, hedge if latencies are tracked,
+    retry failed attempts according to retry_policy. Each attempt
+    takes a rate_limit token once it holds the semaphore, then a
+    limiter slot (scheduled as part of flow): waiting for the token
+    doesn't hold a slot other functions share. Running attempts are
+    counted in stats.
+    """
+    async def call():
+        if latencies is None:
+            coro = func(*args, **kwargs)
+        else:
+            coro = hedged(lambda: func(*args, **kwargs), latencies)
+        if timeout is None:
+            return await coro
+        timeout_cm = asyncio.timeout(timeout)
+        try:
+            async with timeout_cm:
+                return await coro
+        except TimeoutError as ex:
+            if not timeout_cm.expired():
+                raise
+            raise TimeoutError(
+                f'Chunk timed out after {timeout} seconds') from ex
+
+    async def run():
+        nonlocal wait
+        start_time = time.perf_counter()
+        wait += start_time - queued_time
+        if stats is not None:
+            stats.attempt_started()
+        try:
+            result = await call()
+        except Exception as ex:  # pylint: disable=W0718
+            return None, ex, time.perf_counter() - start_time
+        finally:
+            if stats is not None:
+                stats.attempt_finished()
+        return result, None, time.perf_counter() - start_time
+
+    attempt = 0
+    wait = 0.0
+    while True:
+        attempt += 1
+        queued_time = time.perf_counter()
+        # Check if a semaphore is provided
+        if semaphore:
+            await semaphore.acquire()
+        try:
+            if rate_limit is not None:
+                await rate_limit.acquire()
+            if limiter is None:
+                result, ex_value, elapsed = await run()
+            else:
+                async with limiter.slot(flow):
+                    result, ex_value, elapsed = await run()
+        finally:
+            if semaphore:
+                semaphore.release()
+        if ex_value is None or retry_policy is None or \
+                not retry_policy.should_retry(attempt, ex_value):
+            break
+        # The semaphore is not held while backing off
+        await asyncio.sleep(retry_policy.backoff(attempt))
+
+    if ex_value is None:
+        if latencies is not None:
+            latencies.record(elapsed)
+        return {'result': result, 'ex': None, 'elapsed': elapsed,
+                'wait': wait}
+    ex_desc = ExceptionDescriptor(
+        ex_value, ex_value.__traceback__, func.__name__,
+        None if inputs_summarizer is None
+        else inputs_summarizer(args, kwargs), attempt)
+    return {'result': None, 'ex': ex_desc, 'elapsed': elapsed, 'wait': wait}
+
+
+def _chunk_keys(cache:ResultCache, func:Callable, binding:_ArgBinding,
+                build_function_args:Optional[Callable]):
+    """
+    Return a function keying the chunks of a call in the cache.
+
+    Keys are None if func can't be cached.
+    """
+    if build_function_args is None:
+        return functools.partial(cache.key, func)  # not divided
+    # The other arguments are the same for all the chunks, hash them once
+    call_key = cache.key(func, *build_function_args(None))
+    if call_key is None:
+        return lambda chunk_args, chunk_kwargs: None
+    return lambda chunk_args, chunk_kwargs: cache.part_key(
+        call_key, binding.locate(chunk_args, chunk_kwargs)[0])
+
+
+def _cached(cache:ResultCache, chunk_key:Callable, run_chunk:Callable):
+    """Adapt run_chunk to skip chunks with a cached result."""
+    async def run_cached(args, kwargs):
+        key = chunk_key(args, kwargs)
+        if key is None:
+            return await run_chunk(args, kwargs)
+        found, result = cache.get(key)
+        if found:
+            return {'result': result, 'ex': None, 'elapsed': 0.0,
+                    'wait': 0.0}
+        result = await run_chunk(args, kwargs)
+        if result['ex'] is None:
+            cache.put(key, result['result'])
+        return result
+
+    return run_cached
+
+
+def _record_chunk(stats:CallStats, index:int, result:dict):
+    """Account for a completed chunk, report it to the metrics hook."""
+    succeeded = result['ex'] is None
+    stats.chunk_done(succeeded, result['wait'], result['elapsed'])
+    if stats.hook is not None:
+        stats.hook.chunk_done(
+            stats, index, succeeded, result['wait'], result['elapsed'])
+
+
+def _finish_call(stats:CallStats, start_time:float):
+    """Record the duration of a call, report its stats."""
+    stats.elapsed = time.perf_counter() - start_time
+    if stats.hook is not None:
+        stats.hook.call_done(stats)
+
+
+def _quorum_of(success_policy:Union[SuccessPolicy, Quorum]):
+    """Return the quorum ending a call early, None if it runs to the end."""
+    if success_policy == SuccessPolicy.FIRST_SUCCESS:
+        return Quorum(1)
+    return success_policy if isinstance(success_policy, Quorum) else None
+
+
+def _chunk_runner(
+        func:Callable, pool:Optional[Executor],
+        shared:Optional[transport.SharedMemoryTransport],
+        stats:Optional[CallStats], *,
+        max_workers:Optional[int]=None,
+        inputs_summarizer:Optional[Callable]=summarize_inputs,
+        chunk_timeout:Optional[float]=None,
+        hedge_percentile:Optional[float]=None,
+        hedge_min_samples:int=HEDGE_MIN_SAMPLES,
+        retry_policy:Optional[RetryPolicy]=None,
+        rate_limit:Optional[TokenBucket]=None,
+        limiter:Optional[Union[str, ConcurrencyLimiter]]=None,
+        priority:int=0,
+        weight:float=1.0):
+    """Return the coroutine function running a chunk of a call."""
+    logger.info(
+        "Max concurrent workers: %s",
+        max_workers if max_workers is not None else 'unset')
+
+    # Semaphore to control maximum concurrency
+    semaphore = None if max_workers is None else \
+        asyncio.Semaphore(max_workers)
+    return functools.partial(
+        _run_worker, semaphore,
+        func if pool is None else in_executor(pool, func, shared),
+        inputs_summarizer=inputs_summarizer,
+        timeout=chunk_timeout,
+        latencies=None if hedge_percentile is None
+        else LatencyTracker(hedge_percentile, hedge_min_samples),
+        retry_policy=retry_policy,
+        rate_limit=rate_limit,
+        limiter=named_limiter(limiter)
+        if isinstance(limiter, str) else limiter,
+        flow=Flow.current(priority, weight),
+        stats=stats)
+
+
+async def _chunk_results(
+        func:Callable, binding:_ArgBinding, chunk_runner:Callable,
+        args:tuple, kwargs:dict, *,
+        shared:Optional[transport.SharedMemoryTransport],
+        pool:Optional[Executor],
+        ordered:bool=False,
+        progress:Optional[dict]=None,
+        run_id:Optional[str]=None,
+        stats:Optional[CallStats]=None,
+        arg_value_divider:Optional[Callable]=None,
+        window:int=DEFAULT_NUM_WORKERS,
+        cache:Optional[ResultCache]=None,
+        checkpoint:Optional[CheckpointStore]=None,
+        diagnostics:Optional[Diagnostics]=None):
+    """
+    Run the chunks of a call, yield (index, worker result).
+
+    Chunks are run by chunk_runner(pool, shared, stats) in pool,
+    their args shipped through shared.
+    """
+    # Generate the args for each worker based on arg_value_divider
+    start_time = time.perf_counter()
+    arg_value_parts, build_function_args = _divide(
+        binding, args, kwargs, arg_value_divider,
+        None if shared is None else shared.share)
+    if stats is not None:
+        stats.chunking_time += time.perf_counter() - start_time
+    per_worker_arg_chunks = _per_worker_args(
+        arg_value_parts, build_function_args, args, kwargs, stats)
+    # Dividers adapting to chunk run times get them reported
+    chunk_done = getattr(arg_value_parts, 'chunk_done', None)
+    if progress is not None and isinstance(arg_value_parts, Sized):
+        progress['total'] = len(arg_value_parts) or 1
+
+    # Run the workers asynchronously, pulling chunks on demand
+    run_chunk = chunk_runner(pool, shared, stats)
+    if cache is not None:
+        run_chunk = _cached(cache, _chunk_keys(
+            cache, func, binding, build_function_args), run_chunk)
+    completed = None
+    if run_id is not None:
+        completed = {
+            index: {'result': result, 'ex': None,
+                    'elapsed': 0.0, 'wait': 0.0}
+            for index, result in checkpoint.load(run_id).items()}
+    async with aclosing(_run_chunks(
+            per_worker_arg_chunks, run_chunk, window,
+            ordered=ordered, progress=progress, completed=completed,
+            watch=None if diagnostics is None else functools.partial(
+                diagnostics.watch, func.__name__))) as results:
+        async for index, result in results:
+            if stats is not None:
+                _record_chunk(stats, index, result)
+            if completed is not None and index in completed:
+                yield index, result
+                continue
+            if chunk_done is not None:
+                chunk_done(index, result['elapsed'])
+            if run_id is not None and result['ex'] is None:
+                checkpoint.save(run_id, index, result['result'])
+            yield index, result
+
+
+class _Collected:
+    """Outcome of the chunks of a call, collected as they complete."""
+
+    def __init__(self, max_ex_samples:int, folded:Any=_NO_RESULT):
+        """
+        Initialize.
+
+        :param max_ex_samples: exception descriptors kept in full
+        :param folded: initial accumulator of result_combiner
+        """
+        self.exceptions = ExceptionCollector(max_ex_samples)
+        self.partials = {}  # successful results by chunk index
+        self.folded = folded
+        self.num_chunks = 0
+        self.num_succeeded = 0
+        self.progress = {'dispatched': 0, 'total': None}
+
+    @property
+    def num_unfinished(self):
+        """Return the number of chunks dispatched (or known) not collected."""
+        return (self.progress['total'] or self.progress['dispatched']) - \
+            self.num_chunks
+
+
+async def _collect(
+        results:AsyncIterator, collected:_Collected, *,
+        fail_on_first:bool=False,
+        quorum:Optional[Quorum]=None,
+        result_combiner:Optional[Callable]=None,
+        stats:Optional[CallStats]=None):
+    """Collect the chunk results of a call until its outcome is known."""
+    async for index, result in results:
+        collected.num_chunks += 1
+        if result['ex']:
+            collected.exceptions.add(result['ex'])
+            if fail_on_first:
+                return
+            continue
+        collected.num_succeeded += 1
+        if _is_empty(result['result']):
+            pass  # falsy results are not reduced
+        elif result_combiner is None:
+            collected.partials[index] = result['result']
+        elif collected.folded is _NO_RESULT:
+            collected.folded = result['result']
+        else:
+            start_time = time.perf_counter()
+            collected.folded = await _apply(
+                result_combiner, collected.folded, result['result'])
+            if stats is not None:
+                stats.reduce_time += time.perf_counter() - start_time
+        if quorum is not None and quorum.reached(
+                collected.num_succeeded, collected.progress['total']):
+            return
+
+
+async def _reduce(
+        collected:_Collected, pool:Optional[Executor], *,
+        result_reducer:Optional[Callable]=None,
+        result_combiner:Optional[Callable]=None,
+        associative_reducer:bool=False,
+        stats:Optional[CallStats]=None):
+    """Build the result of a call from its partials."""
+    start_time = time.perf_counter()
+    partials = [collected.partials[index]
+                for index in sorted(collected.partials)]
+    if result_combiner is not None:
+        result_data = None if collected.folded is _NO_RESULT \
+            else collected.folded
+    elif result_reducer is None:
+        result_data = None
+    elif associative_reducer:
+        result_data = await _tree_reduce(result_reducer, partials, pool)
+    else:
+        result_data = await _apply(result_reducer, partials)
+    if stats is not None:
+        stats.reduce_time += time.perf_counter() - start_time
+    return result_data
+
+
+def _succeeded(success_policy:Union[SuccessPolicy, Quorum],
+               collected:_Collected, result_data:Any):
+    """Apply the success policy to the outcome of a call."""
+    quorum = _quorum_of(success_policy)
+    if quorum is not None:
+        return quorum.reached(
+            collected.num_succeeded, collected.progress['total'])
+    return success_policy == SuccessPolicy.SUPER_LAX or (
+        success_policy == SuccessPolicy.EXPECT_ANY and (
+            result_data or not collected.exceptions)) or (
+        success_policy == SuccessPolicy.EXPECT_ALL and (
+            not collected.exceptions))
 
 
 async def run_worker(
@@ -103,99 +662,274 @@ async def run_worker(
         *args,
         **kwargs):
     """Run a single worker async."""
-    async def run(func, *args, **kwargs):
-        try:
-            result = await func(*args, **kwargs)
-        except Exception:  # pylint: disable=W0718
-            ex_type, ex_value, t_back = sys.exc_info()
-            ex_desc = {
-                'type': str(ex_type),
-                'value': str(ex_value),
-                'tb': traceback.format_tb(t_back),
-                'function': func.__name__,
-                'function_inputs': {'args': args, 'kwargs': kwargs},
-                'pid': os.getpid()
-            }
-            result = None
-        else:
-            ex_desc = None
-        return {'result': result, 'ex': ex_desc}
+    return await _run_worker(semaphore, func, args, kwargs)
 
-        # Check if a semaphore is provided
-    if semaphore:
-        async with semaphore:
-            return await run(func, *args, **kwargs)
-    else:
-        return await run(func, *args, **kwargs)
 
 def run_distributively(
         mapped_arg:Optional[str]=None,
         arg_value_divider:Optional[
-            Callable[[Sequence], Optional[Sequence[Sequence]]]]=None,
+            Callable[[Any], Optional[Union[Iterable, AsyncIterable]]]]=None,
         result_reducer:Optional[Callable]=None,
         max_workers:Optional[int]=None,
-        success_policy:SuccessPolicy=SuccessPolicy.EXPECT_ALL):
+        success_policy:Union[SuccessPolicy, Quorum]=SuccessPolicy.EXPECT_ALL,
+        *,
+        backend:Optional[ExecutionBackend]=None,
+        executor:Optional[Executor]=None,
+        result_combiner:Optional[Callable]=None,
+        result_initializer:Optional[Callable[[], Any]]=None,
+        stream_in_order:bool=False,
+        fail_fast:bool=False,
+        inputs_summarizer:Optional[Callable[[tuple, dict], Any]]=\
+            summarize_inputs,
+        max_ex_samples:int=DEFAULT_MAX_EX_SAMPLES,
+        chunk_timeout:Optional[float]=None,
+        deadline:Optional[float]=None,
+        hedge_percentile:Optional[float]=None,
+        hedge_min_samples:int=HEDGE_MIN_SAMPLES,
+        retry_policy:Optional[RetryPolicy]=None,
+        rate_limit:Optional[TokenBucket]=None,
+        limiter:Optional[Union[str, ConcurrencyLimiter]]=None,
+        priority:int=0,
+        weight:float=1.0,
+        shared_memory:bool=False,
+        associative_reducer:bool=False,
+        cache:Optional[ResultCache]=None,
+        checkpoint:Optional[CheckpointStore]=None,
+        metrics:Optional[MetricsHook]=None,
+        diagnostics:Optional[Diagnostics]=None):
     """
     Run a function in multiple async tasks in parallel.
 
-    :mapped_arg: argument that will be divided across tasks (list, etc.)
+    :mapped_arg: argument that will be divided across tasks (list, etc.);
+      any kind of parameter, if it has a default and isn't passed the
+      default is divided. The other arguments are shared by all
+      the tasks (not copied)
     :arg_value_divider: controls the minimum number of tasks,
-      divides the mapped_arg
+      divides the mapped_arg; may return a generator or an async
+      iterator, parts are pulled on demand. If the returned iterable
+      has a chunk_done(index, elapsed) method it's called as the
+      chunks complete (see asynctd.dividers.AdaptiveDivider)
     :result_reducer: function to combine results from all tasks
     :num_workers: maximum number of concurrent workers
-      (Semaphore controlled)
+      (Semaphore controlled), also bounds the number of chunks
+      in flight (DEFAULT_NUM_WORKERS if unset)
     :success_policy: defines the condition for considering
-      the run successful
+      the run successful; FIRST_SUCCESS and Quorum return as soon as
+      enough runs succeeded (reducing just their results) and cancel
+      the stragglers
+    :backend: where the chunks run; THREAD and PROCESS run them in a
+      pool sized by max_workers, created for the duration of the call.
+      Defaults to ASYNC for coroutine functions and THREAD otherwise
+    :executor: pool to run the chunks in instead of the event loop,
+      e.g. an asynctd.pools.WorkerPool of warm workers reused by the
+      calls, a long-lived ProcessPoolExecutor or an
+      asynctd.remote.Coordinator of remote workers (takes precedence
+      over backend)
+    :result_combiner: alternative to result_reducer, folds partial
+      results as chunks complete: combiner(accumulator, partial)
+      returns the new accumulator. Partials are released right away;
+      they arrive in completion order
+    :result_initializer: builds the initial accumulator for
+      result_combiner; without it the first partial is used
+    :stream_in_order: make the decorated function's stream() yield
+      chunk results in input order rather than completion order;
+      out of order results are buffered, the buffer is bounded
+      by the number of chunks in flight
+    :fail_fast: with EXPECT_ALL, cancel the chunks in flight and don't
+      start the remaining ones on the first failure. The raised
+      MappedException carries the exceptions collected so far and the
+      number of cancelled chunks (counting the ones not started yet
+      only if the divided parts are sized). Chunks already running
+      in a thread or process pool can't be interrupted, they run
+      to completion
+    :inputs_summarizer: builds function_inputs of exception descriptors
+      from the worker args and kwargs; size-limited repr by default,
+      None to leave the inputs out
+    :max_ex_samples: maximum number of exception descriptors kept
+      in full by MappedException, identical errors are counted
+    :chunk_timeout: seconds a chunk may run before it's cancelled
+      and reported as failed with TimeoutError. Chunks running in a
+      thread or process pool can't be interrupted: they're abandoned,
+      the call doesn't wait for them
+    :deadline: seconds the whole call may take; chunks unfinished by
+      then are cancelled and count as failed (TimeoutError), the
+      success policy decides the outcome. Doesn't apply to stream()
+    :hedge_percentile: hedge stragglers: once a chunk runs longer than
+      this percentile (e.g. 0.95) of the run times of the chunks
+      completed so far, a duplicate of it is started and the first
+      one to succeed is taken (it doesn't take another max_workers slot)
+    :hedge_min_samples: completed chunks of a call needed before hedging
+      starts, lower it for calls of few chunks
+    :retry_policy: rerun failed chunks (see RetryPolicy); exception
+      descriptors report the number of attempts
+    :rate_limit: TokenBucket limiting the rate chunks (and their retry
+      attempts) start at; share one bucket between decorated functions
+      hitting the same downstream quota
+    :limiter: ConcurrencyLimiter, or the name of one registered with
+      asynctd.limiters.named_limiter, shared by decorated functions
+      and calls to bound their total concurrency (unlike max_workers,
+      which is per call). Nested calls within the event loop borrow
+      the caller's slot instead of deadlocking
+    :priority: calls of higher priority get the slots of the limiter
+      first; override per call with asynctd.limiters.scheduled()
+    :weight: share of the limiter's slots a call gets relative to the
+      waiting calls of the same priority, regardless of their number
+      of chunks (weighted fair queuing); overridable like priority
+    :shared_memory: ship the chunks to process pools through shared
+      memory (see asynctd.transport): a mapped argument that is a
+      contiguous buffer (bytes, bytearray, array.array, memoryview,
+      NumPy array) is copied to shared memory once and divided as a
+      view of it, so the divider and the function get memoryviews
+      (NumPy arrays stay arrays), read-only in the workers. Large
+      buffers among the other arguments are shared by all the chunks
+      instead of pickled with each. Ignored for other backends
+    :associative_reducer: declare result_reducer associative:
+      reducer(partials) equals reducer of the results of reducer over
+      consecutive groups of partials. The partials are then reduced in
+      a tree of REDUCE_FAN_IN-partial reductions running concurrently
+      on the pool running the chunks (executor, or the pool of backend;
+      the loop's default executor for ASYNC; the reducer must be
+      picklable for a process pool), off the event loop
+    :cache: ResultCache of chunk results, keyed by the function and a
+      hash of the chunk args; chunks found in it don't run at all, the
+      results of successful ones are stored. Its hits and misses
+      are counted
+    :checkpoint: CheckpointStore the results of successful chunks are
+      written to as they complete, keyed by the run id of the call
+      (the function and a hash of its args by default) and the chunk
+      index. A call with the same run id, e.g. after a crash, reruns
+      only the chunks missing from it; the checkpoint is discarded once
+      the call returns. Needs a divider dividing the same args the
+      same way every time (not an AdaptiveDivider). Doesn't apply
+      to stream()
+    :metrics: MetricsHook the CallStats of each call (and stream) are
+      reported to, see asynctd.metrics; asynctd.metrics.collect_stats()
+      gathers them without a hook
+    :diagnostics: Diagnostics flagging the chunks holding the event loop
+      longer than its threshold at once (logged, and recorded with
+      their index and function name) and profiling a sample of the
+      chunks into one aggregated profile; see asynctd.diagnostics
+
+    The decorated function gets a stream() method with the same
+    signature: an async iterator of ChunkResult items, one per chunk.
     """
+    if result_reducer is not None and result_combiner is not None:
+        raise ValueError(
+            'result_reducer and result_combiner are mutually exclusive')
+    if hedge_min_samples < 1:
+        raise ValueError('hedge_min_samples must be positive')
+
+    fail_on_first = fail_fast and success_policy == SuccessPolicy.EXPECT_ALL
+    quorum = _quorum_of(success_policy)
+
     def wrapper(func):
+        pool_factory = backend_pool_factory(func, backend, executor)
+        binding = _ArgBinding(func, mapped_arg)
+        use_shared_memory = shared_memory and (
+            isinstance(pool_of(executor), ProcessPoolExecutor)
+            if executor is not None
+            else pool_factory is ProcessPoolExecutor)
+        chunk_runner = functools.partial(
+            _chunk_runner, func, max_workers=max_workers,
+            inputs_summarizer=inputs_summarizer,
+            chunk_timeout=chunk_timeout, hedge_percentile=hedge_percentile,
+            hedge_min_samples=hedge_min_samples, retry_policy=retry_policy, rate_limit=rate_limit,
+            limiter=limiter, priority=priority, weight=weight)
+        chunk_results = functools.partial(
+            _chunk_results, func, binding, chunk_runner,
+            arg_value_divider=arg_value_divider,
+            window=max_workers or DEFAULT_NUM_WORKERS,
+            cache=cache, checkpoint=checkpoint, diagnostics=diagnostics)
+
+        def open_call():
+            """Open the transport and pool of a call."""
+            return call_context(
+                executor, pool_factory, max_workers, use_shared_memory)
+
+        async def stream(*args, **kwargs):
+            """
+            Run func distributively, yield ChunkResult per chunk.
+
+            Failed chunks are yielded too (with ex set), the success
+            policy and the reducer don't apply.
+            """
+            stats = start_call(func.__name__, max_workers, metrics)
+            start_time = time.perf_counter()
+            try:
+                with open_call() as (shared, pool):
+                    async with aclosing(chunk_results(
+                            args, kwargs, shared=shared, pool=pool,
+                            ordered=stream_in_order,
+                            stats=stats)) as results:
+                        async for index, result in results:
+                            yield ChunkResult(
+                                index, result['result'], result['ex'])
+            finally:
+                if stats is not None:
+                    _finish_call(stats, start_time)
+
+        async def call(args, kwargs, stats):
+            """Run func distributively, reduce, apply the success policy."""
+            collected = _Collected(
+                max_ex_samples, _NO_RESULT if result_initializer is None
+                else result_initializer())
+            run_id = None if checkpoint is None else \
+                checkpoint.run_id_for(func, args, kwargs)
+            # The pool stays open for the tree reduction
+            with open_call() as (shared, pool):
+                deadline_cm = asyncio.timeout(deadline)
+                try:
+                    async with deadline_cm, aclosing(chunk_results(
+                            args, kwargs, shared=shared, pool=pool,
+                            progress=collected.progress, run_id=run_id,
+                            stats=stats)) as results:
+                        await _collect(
+                            results, collected, fail_on_first=fail_on_first,
+                            quorum=quorum, result_combiner=result_combiner,
+                            stats=stats)
+                except TimeoutError:
+                    if not deadline_cm.expired():
+                        raise
+                    # Unfinished chunks count as failed
+                    deadline_desc = ExceptionDescriptor(TimeoutError(
+                        f'Deadline of {deadline} seconds exceeded'),
+                        None, func.__name__)
+                    for _ in range(collected.num_unfinished):
+                        collected.exceptions.add(deadline_desc)
+
+                logger.info(
+                    "Number of per worker arg chunks: %d",
+                    collected.num_chunks)
+                if fail_on_first and collected.exceptions:
+                    raise MappedException(
+                        collected.exceptions, collected.num_unfinished)
+                result_data = await _reduce(
+                    collected, pool, result_reducer=result_reducer,
+                    result_combiner=result_combiner,
+                    associative_reducer=associative_reducer, stats=stats)
+
+            if not _succeeded(success_policy, collected, result_data):
+                raise MappedException(
+                    collected.exceptions, quorum=None if quorum is None
+                    else (collected.num_succeeded,
+                          quorum.required(collected.progress['total'])))
+            if run_id is not None:
+                checkpoint.discard(run_id)
+            return result_data
+
+        @functools.wraps(func)
         async def wrapped(*args, **kwargs):
-            # Generate the args for each worker based on
-            #  arg_value_divider
-            per_worker_arg_chunks = _per_worker_args(
-                func, args, kwargs, mapped_arg, arg_value_divider)
-
-            logger.info(
-                "Number of per worker arg chunks: %d",
-                len(per_worker_arg_chunks))
-            logger.info(
-                "Max concurrent workers: %s",
-                max_workers if max_workers is not None else 'unset')
-
-            # Semaphore to control maximum concurrency
-            semaphore = None if max_workers is None else \
-                asyncio.Semaphore(max_workers)
-
-            # Run all workers asynchronously
-            tasks = [
-                run_worker(
-                    semaphore, func, *worker_args[0], **worker_args[1])
-                for worker_args in per_worker_arg_chunks
-            ]
-            results = await asyncio.gather(*tasks)
-
-            # Collect and reduce the results
-            result_exceptions = [
-                result['ex'] for result in results if result['ex']
-            ]
-            result_data = None if result_reducer is None \
-                else (await result_reducer(
-                [result['result'] for result in results
-                 if result['result']]) if asyncio.iscoroutinefunction(
-                         result_reducer) else result_reducer(
-                [result['result'] for result in results
-                 if result['result']]))
-
-            # Handle success policies
-            if success_policy == SuccessPolicy.SUPER_LAX:
-                return result_data
-            if success_policy == SuccessPolicy.EXPECT_ANY and (
-                    result_data or not result_exceptions):
-                return result_data
-            if success_policy == SuccessPolicy.EXPECT_ALL and (
-                    not result_exceptions):
-                return result_data
-            raise MappedException(result_exceptions)
-
+            stats = start_call(func.__name__, max_workers, metrics)
+            if stats is None:
+                return await call(args, kwargs, None)
+            start_time = time.perf_counter()
+            try:
+                return await call(args, kwargs, stats)
+            finally:
+                _finish_call(stats, start_time)
+
+        wrapped.stream = stream
+        wrapped._asynctd_distributed = True  # pylint: disable=W0212
         return wrapped
 
     return wrapper
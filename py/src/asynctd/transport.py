@@ -0,0 +1,224 @@
+"""
+Shared memory transport of chunks to worker processes.
+
+The mapped argument of a call is copied to shared memory once and
+divided as a view of it (a memoryview, or an array for NumPy arrays).
+Chunks are pickled (protocol 5) with their views into shared memory
+replaced by references, so worker processes map the data instead of
+receiving copies of it. Large buffers among the other arguments (NumPy
+arrays out-of-band, bytes, bytearray) are copied to shared memory once
+per call too, however many chunks they're shipped with.
+
+Workers get read-only views; segments are unlinked when the call ends.
+"""
+
+import ctypes
+import io
+import pickle
+from multiprocessing.shared_memory import SharedMemory
+
+from asynctd.arrays import is_ndarray, numpy_module
+
+DEFAULT_MIN_SHARED_SIZE = 64 * 1024
+
+
+def _address(view:memoryview):
+    """Return the address of a buffer, None if it can't be shared."""
+    try:
+        return ctypes.addressof(ctypes.c_char.from_buffer(view))
+    except (TypeError, ValueError, BufferError):
+        return None
+
+
+def _close(shm:SharedMemory):
+    """Unmap a segment, or leave it to be unmapped with its last view."""
+    try:
+        shm.close()
+    except BufferError:
+        # Views are still in use (e.g. by a traceback), the mmap is
+        # freed with them; keep SharedMemory.__del__ from retrying
+        shm._mmap = None  # pylint: disable=W0212
+
+
+class _Segment:
+    """Shared memory block holding a copy of a buffer."""
+
+    def __init__(self, view:memoryview):
+        """Initialize, copy the contiguous view."""
+        self.shm = SharedMemory(create=True, size=view.nbytes)
+        self.size = view.nbytes
+        self.shm.buf[:view.nbytes] = view.cast('B')
+        self.address = _address(self.shm.buf)
+
+    def ref(self, address:int, nbytes:int):
+        """Return (name, offset, nbytes) if the buffer is in the segment."""
+        offset = address - self.address
+        if 0 <= offset and offset + nbytes <= self.size:
+            return self.shm.name, offset, nbytes
+        return None
+
+    def close(self):
+        """Unmap and unlink."""
+        _close(self.shm)
+        self.shm.unlink()
+
+
+class _Pickler(pickle.Pickler):
+    """Pickler replacing buffers in shared memory with references."""
+
+    def __init__(self, file, transport, buffer_refs:list):
+        """Initialize."""
+        super().__init__(file, protocol=5,
+                         buffer_callback=self.out_of_band)
+        self.transport = transport
+        self.buffer_refs = buffer_refs
+
+    def persistent_id(self, obj):
+        """Return a reference to obj's data if it's in shared memory."""
+        # pylint: disable=W0212
+        if isinstance(obj, memoryview):
+            address = _address(obj)
+            ref = None if address is None else \
+                self.transport._locate(address, obj.nbytes)
+            return None if ref is None else \
+                ('memoryview', *ref, obj.format, obj.shape)
+        if is_ndarray(obj):
+            if not obj.flags.c_contiguous:
+                return None
+            ref = self.transport._locate(
+                obj.__array_interface__['data'][0], obj.nbytes)
+            return None if ref is None else \
+                ('ndarray', *ref, obj.dtype, obj.shape)
+        if type(obj) in (bytes, bytearray) and obj and \
+                len(obj) >= self.transport.min_shared_size:
+            segment = self.transport._shared(obj)
+            return (type(obj).__name__,
+                    *segment.ref(segment.address, len(obj)), None, None)
+        return None
+
+    def out_of_band(self, buffer:pickle.PickleBuffer):
+        """Ship large out-of-band buffers in shared memory."""
+        view = buffer.raw()
+        if view.nbytes < self.transport.min_shared_size:
+            return True
+        # pylint: disable=W0212
+        segment = self.transport._shared(view.obj, view)
+        self.buffer_refs.append(segment.ref(segment.address, view.nbytes))
+        return False
+
+
+class SharedMemoryTransport:
+    """Ship the chunks of a call to worker processes via shared memory."""
+
+    def __init__(self, min_shared_size:int=DEFAULT_MIN_SHARED_SIZE):
+        """
+        Initialize.
+
+        :param min_shared_size: size in bytes from which buffers of the
+         other arguments are placed in shared memory
+        """
+        self.min_shared_size = min_shared_size
+        self.segments = []
+        # Segments of the other arguments' buffers, by buffer id
+        self.by_id = {}
+
+    def __enter__(self):
+        """Enter the call."""
+        return self
+
+    def __exit__(self, *exc_info):
+        """Release the segments at the end of the call."""
+        self.close()
+
+    def share(self, value):
+        """
+        Copy a buffer to shared memory, return a view of the copy.
+
+        A NumPy array is shared as an array, other contiguous buffers
+        (bytes, bytearray, array.array, memoryview) as a memoryview of
+        the same format; other values are returned as is.
+        """
+        try:
+            view = memoryview(value)
+        except TypeError:
+            return value
+        if not view.c_contiguous or not view.nbytes:
+            return value
+        if not is_ndarray(value):
+            try:
+                view.cast('B').cast(view.format, view.shape)
+            except (TypeError, ValueError):
+                return value
+        segment = _Segment(view)
+        self.segments.append(segment)
+        shared = segment.shm.buf[:view.nbytes]
+        if is_ndarray(value):
+            numpy = numpy_module()
+            return numpy.ndarray(value.shape, value.dtype, buffer=shared)
+        return shared.cast(view.format, view.shape)
+
+    def dumps(self, obj):
+        """Pickle obj, return the payload and its out-of-band buffers."""
+        file = io.BytesIO()
+        buffer_refs = []
+        _Pickler(file, self, buffer_refs).dump(obj)
+        return file.getvalue(), buffer_refs
+
+    def close(self):
+        """Unlink the segments."""
+        for segment in self.segments:
+            segment.close()
+        self.segments.clear()
+        self.by_id.clear()
+
+    def _shared(self, obj, view:memoryview=None):
+        """Return the segment holding a copy of obj, copy it once."""
+        if id(obj) not in self.by_id:
+            segment = _Segment(memoryview(obj) if view is None else view)
+            self.segments.append(segment)
+            # obj is kept alive so that its id isn't reused
+            self.by_id[id(obj)] = obj, segment
+        return self.by_id[id(obj)][1]
+
+    def _locate(self, address:int, nbytes:int):
+        """Return the reference of a buffer in one of the segments."""
+        for segment in self.segments:
+            ref = segment.ref(address, nbytes)
+            if ref is not None:
+                return ref
+        return None
+
+
+def loads(payload:bytes, buffer_refs:list, attached:dict):
+    """
+    Unpickle what a transport dumped, in a worker process.
+
+    Segments are attached to (name -> SharedMemory), release() them
+    once the unpickled objects aren't used anymore.
+    """
+    def view(name, offset, nbytes):
+        if name not in attached:
+            attached[name] = SharedMemory(name)
+        return attached[name].buf[offset:offset + nbytes].toreadonly()
+
+    def persistent_load(pid):
+        kind, name, offset, nbytes, layout, shape = pid
+        data = view(name, offset, nbytes)
+        if kind == 'ndarray':
+            numpy = numpy_module()
+            return numpy.ndarray(shape, layout, buffer=data)
+        if kind == 'memoryview':
+            return data.cast(layout, shape)
+        return bytes(data) if kind == 'bytes' else bytearray(data)
+
+    unpickler = pickle.Unpickler(io.BytesIO(payload), buffers=[
+        view(*ref) for ref in buffer_refs])
+    unpickler.persistent_load = persistent_load
+    return unpickler.load()
+
+
+def release(attached:dict):
+    """Detach the segments attached by loads()."""
+    for shm in attached.values():
+        _close(shm)
+    attached.clear()
@@ -0,0 +1,205 @@
+"""
+Benchmark the async task distributor.
+
+Runs the workloads of performance_test_base over a matrix of backends,
+input sizes, chunk sizes and max_workers. Each case is warmed up, then
+timed (time.perf_counter) over repeated calls; its peak memory is
+measured by tracemalloc in a separate, untimed call, so tracing doesn't
+skew the times (worker processes aren't traced).
+
+Results are written as JSON. Given a baseline (the JSON of an earlier
+run), cases whose median throughput dropped or whose peak memory grew
+by more than the threshold are reported as regressions and the exit
+status is 1.
+
+    python -m scripts.benchmark --output before.json
+    python -m scripts.benchmark --baseline before.json --output after.json
+"""
+# pylint: disable=R0801
+
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+from asynctd.metrics import collect_stats
+from scripts import performance_test_base
+
+DEFAULT_THRESHOLD = 0.1
+
+# The distributor logs every call on the root logger, keep it quiet
+logger = logging.getLogger(__name__)
+
+
+async def measure(case, cost, warmups, repeats):
+    """Time a case, return its results."""
+    data = performance_test_base.prepare_data(case.size)
+    func = performance_test_base.distributed(case)
+    for _ in range(warmups):
+        await func(data.valid_keys, data.words, cost)
+
+    times = []
+    with collect_stats() as collected:
+        for _ in range(repeats):
+            start_time = time.perf_counter()
+            await func(data.valid_keys, data.words, cost)
+            times.append(time.perf_counter() - start_time)
+
+    tracemalloc.start()
+    try:
+        await func(data.valid_keys, data.words, cost)
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    median = statistics.median(times)
+    stats = collected[-1]
+    return {
+        'name': case.name,
+        **case._asdict(),
+        'cost': cost,
+        'times': times,
+        'min': min(times),
+        'median': median,
+        'mean': statistics.mean(times),
+        'stdev': statistics.stdev(times) if len(times) > 1 else 0.0,
+        'throughput': case.size / median if median else float('inf'),
+        'peak_memory': peak_memory,
+        'num_chunks': stats.num_chunks,
+        'max_running': stats.max_running,
+        'mean_wait_time': stats.as_dict()['mean_wait_time'],
+    }
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare results with the ones of a baseline run.
+
+    Return descriptions of the regressions: throughput lower, or peak
+    memory higher, than in the baseline by more than threshold
+    (a fraction). Cases missing from either run are skipped.
+    """
+    before = {result['name']: result for result in baseline['results']}
+    regressions = []
+    for result in results['results']:
+        old = before.get(result['name'])
+        if old is None:
+            continue
+        if result['throughput'] < old['throughput'] * (1 - threshold):
+            regressions.append(
+                f"{result['name']}: throughput {result['throughput']:.1f} "
+                f"items/s, was {old['throughput']:.1f}")
+        if result['peak_memory'] > old['peak_memory'] * (1 + threshold):
+            regressions.append(
+                f"{result['name']}: peak memory {result['peak_memory']} "
+                f"bytes, was {old['peak_memory']}")
+    return regressions
+
+
+async def run_benchmarks(args):
+    """Run the cases of the matrix, return the results."""
+    results = []
+    for case in performance_test_base.cases(
+            args.workloads, args.backends, args.sizes, args.chunk_sizes,
+            args.max_workers):
+        cost = args.simulate_activity_coef if case.workload == 'cpu' \
+            else args.io_latency
+        result = await measure(case, cost, args.warmups, args.repeats)
+        logger.info(
+            '%s: median %.4f s (min %.4f, stdev %.4f), %.1f items/s, '
+            'peak memory %d bytes', case.name, result['median'],
+            result['min'], result['stdev'], result['throughput'],
+            result['peak_memory'])
+        results.append(result)
+    return {
+        'meta': {
+            'timestamp': datetime.datetime.now(
+                datetime.timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'warmups': args.warmups,
+            'repeats': args.repeats,
+        },
+        'results': results,
+    }
+
+
+def parse_args(argv=None):
+    """Parse the command line."""
+    parser = argparse.ArgumentParser(
+        description=__doc__.split('\n\n', maxsplit=1)[0])
+    parser.add_argument(
+        '--workloads', nargs='+', default=list(
+            performance_test_base.WORKLOADS),
+        choices=performance_test_base.WORKLOADS,
+        help='cpu: reverse every word, io: sleep once per chunk')
+    parser.add_argument(
+        '--backends', nargs='+', default=list(
+            performance_test_base.BACKENDS),
+        choices=list(performance_test_base.BACKENDS))
+    parser.add_argument(
+        '--sizes', nargs='+', type=int, default=[10000],
+        help='Numbers of input words')
+    parser.add_argument(
+        '--chunk-sizes', nargs='+', type=int, default=[100, 1000],
+        help='Numbers of words per chunk')
+    parser.add_argument(
+        '--max-workers', nargs='+', type=int, default=[4, 16])
+    parser.add_argument(
+        '-s', '--simulate-activity-coef', type=int, default=100,
+        help='Number of times to swap every word, '
+        'to simulate cpu-intensive op')
+    parser.add_argument(
+        '--io-latency', type=float, default=0.01,
+        help='Seconds each chunk of the io workload sleeps')
+    parser.add_argument('--warmups', type=int, default=1)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument(
+        '-o', '--output', help='JSON file to write the results to, '
+        'standard output by default')
+    parser.add_argument(
+        '-b', '--baseline', help='JSON results of an earlier run '
+        'to compare with')
+    parser.add_argument(
+        '-t', '--threshold', type=float, default=DEFAULT_THRESHOLD,
+        help='Relative change flagged as a regression')
+    args = parser.parse_args(argv)
+    if args.repeats < 1:
+        parser.error('--repeats must be positive')
+    return args
+
+
+def main(argv=None):
+    """Run the benchmarks, return the exit status."""
+    logging.basicConfig(level=logging.WARNING)
+    logger.setLevel(logging.INFO)
+    args = parse_args(argv)
+    results = asyncio.run(run_benchmarks(args))
+
+    if args.output is None:
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    else:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            json.dump(results, output, indent=2)
+
+    if args.baseline is None:
+        return 0
+    with open(args.baseline, encoding='utf-8') as baseline_file:
+        baseline = json.load(baseline_file)
+    regressions = compare(results, baseline, args.threshold)
+    for regression in regressions:
+        logger.warning('Regression: %s', regression)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
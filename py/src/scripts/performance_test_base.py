@@ -1,126 +1,105 @@
-"""Test the performance of async task distributor under different conditions."""
+"""Workloads and cases for the benchmarks of the async task distributor."""
 
-from collections import defaultdict, namedtuple
-from functools import reduce
-import logging
-import os
+import asyncio
+import itertools
+import string
 import time
+from collections import defaultdict, namedtuple
 
-from asynctd.task_distributor import run_distributively
+from asynctd.dividers import SequenceDivider
+from asynctd.reducers import merge_reducer
+from asynctd.task_distributor import ExecutionBackend, run_distributively
 
 
 Data = namedtuple('Data', ['valid_keys', 'words'])
 
+BACKENDS = {
+    'async': ExecutionBackend.ASYNC,
+    'thread': ExecutionBackend.THREAD,
+    'process': ExecutionBackend.PROCESS,
+}
 
-def prepare_data():
-    """
-    Prepare test data.
+WORKLOADS = ('cpu', 'io')
 
-    Build a list of strings
-    'aaaa', 'aaab', ..., 'aaaz', ...., 'zzzz'
-    """
-    chars = [chr(c) for c in range(ord('a'), ord('z')+1)]
 
-    result = reduce(
-        lambda acc, el: acc+[el+c for el in el for c in reduce(
-            lambda acc, el: acc+[el+c for el in el for c in reduce(
-                lambda acc, el: acc+[el+c for el in el for c in chars],
-                chars, [])],
-            chars, [])], chars, [])
-    return Data(valid_keys=set(result[:len(result)//2]), words=result)
+class Case(namedtuple(
+        'Case', ['workload', 'backend', 'size', 'chunk_size',
+                 'max_workers'])):
+    """A point of the benchmark matrix."""
 
+    __slots__ = ()
 
-def list_arg_divider(words):
-    """Divide collection of arguments into chunks."""
-    suggested_num_chunks = os.cpu_count() or 16
-    suggested_chunk_size = len(words) // suggested_num_chunks
-    return [words[i:i+suggested_chunk_size] for i
-            in range(0, len(words), suggested_chunk_size)]
+    @property
+    def name(self):
+        """Return the name identifying the case across runs."""
+        return (f'{self.workload}-{self.backend}-n{self.size}'
+                f'-c{self.chunk_size}-w{self.max_workers}')
 
 
-def occur_reducer(partials):
-    """Reduce the results."""
-    result = {}
-    for partial in partials:
-        result.update(partial)
-    return result
+def prepare_data(size):
+    """
+    Prepare test data.
 
+    Build a list of size strings 'aaaa', 'aaab', ..., 'zzzz' (repeated
+    if size is larger than their number), half of them are valid keys.
+    """
+    words = [''.join(chars) for chars in itertools.islice(itertools.cycle(
+        itertools.product(string.ascii_lowercase, repeat=4)), size)]
+    return Data(valid_keys=set(words[::2]), words=words)
 
-async def calculate(valid_keys, words, simulate_activity_coef):
-    """Perform an action on the given collection of words asynchronously."""
-    async def simulate_activity_on_word(word):
-        """Simulate CPU-intensive activity on the word by reversing it."""
-        for _ in range(simulate_activity_coef):
-            word = word[::-1]
-        return word
 
+def _count_valid(valid_keys, words, simulate_activity_coef):
+    """Count the valid words, reversing each word to burn CPU."""
     result = defaultdict(lambda: 0)
     for word in words:
-        if await simulate_activity_on_word(word) in valid_keys:
+        for _ in range(simulate_activity_coef):
+            word = word[::-1]
+        if word in valid_keys:
             result[word] += 1
     return dict(result)  # Extract regular dict from defaultdict
 
 
-@run_distributively('words', list_arg_divider, occur_reducer)
-async def distribute_w_wide_step(
-        valid_keys, words, simulate_activity_coef):
-    """Run "calculate" with "run_distributively" decorator."""
-    return await calculate(valid_keys, words, simulate_activity_coef)
-
-
-@run_distributively(
-    'words', lambda l: [[el] for el in l], occur_reducer)
-async def distribute_w_small_step(
-        valid_keys, words, simulate_activity_coef):
-    """Run "calculate" with "run_distributively" decorator."""
-    return await calculate(valid_keys, words, simulate_activity_coef)
-
-@run_distributively(
-    'words', lambda l: [[el] for el in l], occur_reducer, max_workers=16)
-async def distribute_w_small_step_max_workers(
-        valid_keys, words, simulate_activity_coef):
-    """Run "calculate" with "run_distributively" decorator."""
-    return await calculate(valid_keys, words, simulate_activity_coef)
-
-
-async def distribute_undecorated(
-        valid_keys, words, simulate_activity_coef):
-    """Run "calculate" without "run_distributively" decorator."""
-    return await calculate(valid_keys, words, simulate_activity_coef)
-
-
-async def run_all_tests(repeat_times, simulate_activity_coef):
-    """Run all async performance tests."""
-    logger = logging.getLogger()
-    logging.basicConfig(level=logging.DEBUG)
-
-    data = prepare_data()
-    valid_keys = data.valid_keys
-    words = data.words * repeat_times
-
-    start_time = time.time()
-    await distribute_w_wide_step(
-        valid_keys, words, simulate_activity_coef)
-    logger.info(
-        'Time to run distribute_w_wide_step: %d seconds',
-        time.time() - start_time)
-
-    start_time = time.time()
-    await distribute_w_small_step(
-        valid_keys, words, simulate_activity_coef)
-    logger.info(
-        'Time to run distribute_w_small_step: '
-        '%d seconds', time.time() - start_time)
-
-    start_time = time.time()
-    await distribute_w_small_step_max_workers(
-        valid_keys, words, simulate_activity_coef)
-    logger.info(
-        'Time to run distribute_w_small_step_max_workers: '
-        '%d seconds', time.time() - start_time)
-
-    start_time = time.time()
-    await distribute_undecorated(
-        valid_keys, words, simulate_activity_coef)
-    logger.info('Time to run distribute_undecorated: %d seconds',
-                time.time() - start_time)
+def cpu_bound(valid_keys, words, cost):
+    """CPU-bound workload: cost reversals of every word."""
+    return _count_valid(valid_keys, words, cost)
+
+
+async def cpu_bound_async(valid_keys, words, cost):
+    """CPU-bound workload, as a coroutine function."""
+    return _count_valid(valid_keys, words, cost)
+
+
+def io_bound(valid_keys, words, cost):
+    """Simulated I/O workload: a request of cost seconds per chunk."""
+    time.sleep(cost)
+    return _count_valid(valid_keys, words, 0)
+
+
+async def io_bound_async(valid_keys, words, cost):
+    """Simulated I/O workload, as a coroutine function."""
+    await asyncio.sleep(cost)
+    return _count_valid(valid_keys, words, 0)
+
+
+_FUNCTIONS = {
+    ('cpu', False): cpu_bound,
+    ('cpu', True): cpu_bound_async,
+    ('io', False): io_bound,
+    ('io', True): io_bound_async,
+}
+
+
+def distributed(case):
+    """Return the workload of the case decorated as the case says."""
+    backend = BACKENDS[case.backend]
+    func = _FUNCTIONS[case.workload, backend == ExecutionBackend.ASYNC]
+    return run_distributively(
+        'words', SequenceDivider(chunk_size=case.chunk_size),
+        merge_reducer, max_workers=case.max_workers,
+        backend=backend)(func)
+
+
+def cases(workloads, backends, sizes, chunk_sizes, max_workers):
+    """Return the cases of the matrix of the given values."""
+    return [Case(*values) for values in itertools.product(
+        workloads, backends, sizes, chunk_sizes, max_workers)]
@@ -0,0 +1,10 @@
+"""Helpers shared by the tests."""
+
+import asyncio
+
+
+def async_test(f):
+    """Decorator to run async test functions."""
+    def wrapper(*args, **kwargs):
+        return asyncio.run(f(*args, **kwargs))
+    return wrapper
@@ -1,14 +1,26 @@
 """Test workload_distributor in async environment."""
 # pylint: disable=R0801
 
+import json
 import logging
 import unittest
 import re
 import os
 import asyncio
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from helpers import async_test
 
 from asynctd.task_distributor import (
+    DEFAULT_MAX_EX_SAMPLES,
+    ChunkResult,
+    ExecutionBackend,
     MappedException,
+    Quorum,
+    RetryPolicy,
+    SuccessPolicy,
     run_distributively,
 )
 
@@ -39,6 +51,29 @@ def num_mapper(nums):
     return [nums[i:i+chunk_size] for i in range(0, len(nums), chunk_size)]
 
 
+def lazy_num_mapper(nums):
+    """
+    Split a collection of numbers into chunks lazily.
+
+    Parameters:
+        nums: list of nums to be split.
+    """
+    for i in range(0, len(nums), 100):
+        yield nums[i:i+100]
+
+
+async def async_num_mapper(nums):
+    """
+    Split a collection of numbers into chunks, as an async iterator.
+
+    Parameters:
+        nums: list of nums to be split.
+    """
+    for i in range(0, len(nums), 100):
+        await asyncio.sleep(0)
+        yield nums[i:i+100]
+
+
 def total_reducer(partials):
     """
     Reduce (i.e. sum up) a list of numbers representing partial results.
@@ -46,6 +81,11 @@ def total_reducer(partials):
     return sum(partials)
 
 
+def total_combiner(total, partial):
+    """Add a partial result to the running total."""
+    return total + partial
+
+
 def count_words(text):
     """Count number of words in text."""
     count = len(re.findall(r'\w+', text))
@@ -125,11 +165,136 @@ async def distributed_sum(sum_me_up):
     return sum(sum_me_up)
 
 
-def async_test(f):
-    """Decorator to run async test functions."""
-    def wrapper(*args, **kwargs):
-        return asyncio.run(f(*args, **kwargs))
-    return wrapper
+@run_distributively(
+    'sum_me_up', num_mapper, total_reducer, max_workers=2,
+    backend=ExecutionBackend.PROCESS)
+async def distributed_sum_in_processes(sum_me_up):
+    """Sum up the numbers in worker processes."""
+    return sum(sum_me_up)
+
+
+@run_distributively(
+    'nums', num_mapper, lambda partials: set().union(*partials),
+    backend=ExecutionBackend.PROCESS)
+async def worker_pids(nums):
+    """Report pids of the processes the chunks ran in."""
+    return {os.getpid()} if nums else set()
+
+
+@run_distributively(
+    'text', text_mapper, total_reducer, max_workers=4)
+def count_num_words_sync(text):
+    """Count number of words in a plain function."""
+    return count_words(text)
+
+
+@run_distributively(
+    'text', text_mapper, lambda partials: set().union(*partials))
+def worker_threads(text):
+    """Report threads the chunks ran in."""
+    return {threading.get_ident()} if text else set()
+
+
+@run_distributively(
+    'sum_me_up', lazy_num_mapper, total_reducer)
+async def distributed_sum_lazy(sum_me_up):
+    """Sum up the numbers, chunks produced by a generator."""
+    return sum(sum_me_up)
+
+
+@run_distributively(
+    'sum_me_up', async_num_mapper, total_reducer)
+async def distributed_sum_async_mapper(sum_me_up):
+    """Sum up the numbers, chunks produced by an async iterator."""
+    return sum(sum_me_up)
+
+
+@run_distributively(
+    'sum_me_up', num_mapper, result_combiner=total_combiner,
+    result_initializer=int)
+async def distributed_sum_fold(sum_me_up):
+    """Sum up the numbers, folding partials as they arrive."""
+    return sum(sum_me_up)
+
+
+@run_distributively('delays', lambda delays: ([d] for d in delays))
+async def sleep_and_report(delays):
+    """Sleep the given number of seconds, report it."""
+    await asyncio.sleep(delays[0])
+    if delays[0] < 0:
+        raise ValueError('negative delay')
+    return delays[0]
+
+
+@run_distributively(
+    'delays', lambda delays: ([d] for d in delays),
+    max_workers=2, stream_in_order=True)
+async def sleep_and_report_in_order(delays):
+    """Sleep the given number of seconds, report it (ordered stream)."""
+    await asyncio.sleep(delays[0])
+    return delays[0]
+
+
+@run_distributively('nums', num_mapper, total_reducer)
+async def sum_keyword_only(*, nums, offset=0):
+    """Sum up the numbers, keyword-only mapped argument."""
+    return sum(nums) + offset
+
+
+@run_distributively('nums', num_mapper, total_reducer)
+async def sum_positional_only(scale=1, nums=range(100), /):
+    """Sum up the numbers, positional-only defaulted mapped argument."""
+    return scale * sum(nums)
+
+
+@run_distributively('nums', num_mapper, total_reducer)
+async def sum_defaulted(nums=range(100), scale=1):
+    """Sum up the numbers, defaulted mapped argument."""
+    return scale * sum(nums)
+
+
+@run_distributively('nums', num_mapper, total_reducer)
+async def sum_var_keyword(**kwargs):
+    """Sum up the numbers, mapped argument caught by **kwargs."""
+    return sum(kwargs['nums'])
+
+
+@run_distributively('nums', lazy_num_mapper, lambda partials: partials)
+async def report_shared(nums, shared):
+    """Report identities of the shared argument seen by the chunks."""
+    return id(shared) if nums else None
+
+
+@run_distributively(
+    'delays', lambda delays: [[d] for d in delays], total_reducer,
+    max_workers=2, fail_fast=True)
+async def sleep_or_fail_fast(delays):
+    """Sleep the given number of seconds, fail on negative delay."""
+    if delays[0] < 0:
+        raise ValueError('negative delay')
+    await asyncio.sleep(delays[0])
+    return delays[0]
+
+
+async def replica_lookup(replicas):
+    """Look up a value in a replica, described by (delay, value)."""
+    delay, value = replicas[0]
+    await asyncio.sleep(delay)
+    if value is None:
+        raise LookupError('replica is down')
+    return value
+
+
+@run_distributively('nums', lambda nums: ([n] for n in nums))
+async def fail_on_odd(nums, shared=None):  # pylint: disable=W0613
+    """
+    Fail on odd numbers, with distinct errors for multiples of 5.
+
+    shared is only there to be summarized in the exception descriptors.
+    """
+    if nums[0] % 2:
+        raise ValueError('multiple of 5' if nums[0] % 5 == 0 else 'odd')
+    return nums[0]
 
 
 class TestAsync(UnitTestCase):
@@ -203,6 +368,622 @@ class TestAsync(UnitTestCase):
         self.assertEqual(sum(self.nums), result)
 
 
+class TestLazyChunks(UnitTestCase):
+    """Pull chunks from the arg divider on demand."""
+
+    @async_test
+    async def test_generator_mapper(self):
+        """Test sum of numbers with chunks coming from a generator."""
+        result = await distributed_sum_lazy(self.nums)
+        self.assertEqual(sum(self.nums), result)
+
+    @async_test
+    async def test_async_iterator_mapper(self):
+        """Test sum of numbers with chunks coming from an async iterator."""
+        result = await distributed_sum_async_mapper(self.nums)
+        self.assertEqual(sum(self.nums), result)
+
+    @async_test
+    async def test_empty_generator(self):
+        """Test that a divider yielding nothing runs a single chunk."""
+        result = await distributed_sum_lazy([])
+        self.assertEqual(result, 0)
+
+    @async_test
+    async def test_chunks_in_flight_bounded(self):
+        """Test that chunks are not pulled ahead of max_workers."""
+        counters = {'pulled': 0, 'done': 0, 'ahead': 0}
+
+        def counting_mapper(nums):
+            for i in range(0, len(nums), 10):
+                counters['pulled'] += 1
+                counters['ahead'] = max(
+                    counters['ahead'], counters['pulled'] - counters['done'])
+                yield nums[i:i+10]
+
+        @run_distributively(
+            'nums', counting_mapper, total_reducer, max_workers=3)
+        async def slow_sum(nums):
+            await asyncio.sleep(0.001)
+            counters['done'] += 1
+            return sum(nums)
+
+        result = await slow_sum(self.nums)
+        self.assertEqual(sum(self.nums), result)
+        self.assertEqual(counters['pulled'], 1000)
+        self.assertLessEqual(counters['ahead'], 3)
+
+
+class TestIncrementalReduction(UnitTestCase):
+    """Fold partial results as chunks complete."""
+
+    @async_test
+    async def test_count_sum(self):
+        """Test sum of numbers folded incrementally."""
+        result = await distributed_sum_fold(self.nums)
+        self.assertEqual(sum(self.nums), result)
+
+    @async_test
+    async def test_count_sum_empty(self):
+        """Test that the initial accumulator is returned for no partials."""
+        result = await distributed_sum_fold([])
+        self.assertEqual(result, 0)
+
+    @async_test
+    async def test_async_combiner_no_initializer(self):
+        """Test an async combiner, first partial used as accumulator."""
+        async def merge(acc, partial):
+            acc.update(partial)
+            return acc
+
+        @run_distributively('text', text_mapper, result_combiner=merge)
+        async def word_lengths(text):
+            return {word: len(word) for word in text.split()}
+
+        result = await word_lengths(self.long_text)
+        self.assertEqual(result['awesome'], 7)
+        self.assertEqual(len(result), 22)
+
+    def test_reducer_and_combiner_rejected(self):
+        """Test that reducer and combiner can't be used together."""
+        with self.assertRaises(ValueError):
+            run_distributively(
+                'text', text_mapper, total_reducer,
+                result_combiner=total_combiner)
+
+
+class TestStream(UnitTestCase):
+    """Stream per-chunk results."""
+
+    @async_test
+    async def test_completion_order(self):
+        """Test that results are yielded as chunks complete."""
+        delays = [0.03, 0.02, 0.01, 0]
+        items = [item async for item in sleep_and_report.stream(delays)]
+        self.assertEqual(
+            items, [ChunkResult(3 - i, delay, None)
+                    for i, delay in enumerate(reversed(delays))])
+
+    @async_test
+    async def test_input_order(self):
+        """Test that results are yielded in input order if requested."""
+        delays = [0.02, 0, 0.01, 0, 0]
+        items = [item.result async for item
+                 in sleep_and_report_in_order.stream(delays)]
+        self.assertEqual(items, delays)
+
+    @async_test
+    async def test_failures_are_items(self):
+        """Test that failed chunks come through the stream."""
+        items = [item async for item in sleep_and_report.stream([0, -1])]
+        self.assertEqual(len(items), 2)
+        failed = [item for item in items if item.ex]
+        self.assertEqual(len(failed), 1)
+        self.assertEqual(failed[0].index, 1)
+        self.assertIsNone(failed[0].result)
+        self.assertIn('negative delay', failed[0].ex['value'])
+
+    @async_test
+    async def test_early_exit(self):
+        """Test that outstanding chunks are cancelled on early exit."""
+        async for item in sleep_and_report.stream([0, 10, 10]):
+            self.assertEqual(item.index, 0)
+            break
+
+
+class TestArgBinding(UnitTestCase):
+    """Locate the mapped argument in any kind of parameter."""
+
+    @async_test
+    async def test_keyword_only(self):
+        """Test keyword-only mapped argument."""
+        result = await sum_keyword_only(nums=self.nums)
+        self.assertEqual(sum(self.nums), result)
+
+    @async_test
+    async def test_positional_only_default(self):
+        """Test positional-only mapped argument, default divided."""
+        self.assertEqual(await sum_positional_only(), sum(range(100)))
+        self.assertEqual(await sum_positional_only(2), 2 * sum(range(100)))
+        self.assertEqual(
+            await sum_positional_only(1, self.nums), sum(self.nums))
+
+    @async_test
+    async def test_default_and_keyword(self):
+        """Test defaulted mapped argument, other args passed by keyword."""
+        self.assertEqual(await sum_defaulted(scale=2), 2 * sum(range(100)))
+        self.assertEqual(
+            await sum_defaulted(self.nums, scale=2), 2 * sum(self.nums))
+
+    @async_test
+    async def test_var_keyword(self):
+        """Test mapped argument passed through **kwargs."""
+        result = await sum_var_keyword(nums=self.nums)
+        self.assertEqual(sum(self.nums), result)
+
+    @async_test
+    async def test_shared_args_not_copied(self):
+        """Test that non-mapped arguments are shared by the chunks."""
+        shared = set(range(1000))
+        result = await report_shared(self.nums, shared=shared)
+        self.assertGreater(len(result), 1)
+        self.assertEqual(set(result), {id(shared)})
+
+
+class TestFailFast(UnitTestCase):
+    """Cancel outstanding workers once the run is known to fail."""
+
+    @async_test
+    async def test_cancels_outstanding(self):
+        """Test that the first failure cancels the other chunks."""
+        loop = asyncio.get_running_loop()
+        start_time = loop.time()
+        with self.assertRaises(MappedException) as context:
+            await sleep_or_fail_fast([10, -1, 10, 10, 10])
+        self.assertLess(loop.time() - start_time, 5)
+        self.assertEqual(len(context.exception.ex_descriptors), 1)
+        self.assertEqual(context.exception.num_cancelled, 4)
+        self.assertIn('4 workers cancelled', str(context.exception))
+
+    @async_test
+    async def test_sync_chunks_not_waited_for(self):
+        """Test that chunks running in a thread pool are abandoned."""
+        def sleep_or_fail(delays):
+            if delays[0] < 0:
+                raise ValueError('negative delay')
+            time.sleep(delays[0])
+            return delays[0]
+
+        fail = run_distributively(
+            'delays', lambda delays: [[d] for d in delays], total_reducer,
+            max_workers=2, fail_fast=True)(sleep_or_fail)
+        loop = asyncio.get_running_loop()
+        start_time = loop.time()
+        with self.assertRaises(MappedException):
+            await fail([2, -1, 2])
+        self.assertLess(loop.time() - start_time, 1)
+
+    @async_test
+    async def test_success(self):
+        """Test that fail_fast doesn't affect successful runs."""
+        result = await sleep_or_fail_fast([0, 0.01, 0])
+        self.assertEqual(result, 0.01)
+
+
+class TestEarlyExit(UnitTestCase):
+    """Return as soon as enough runs succeeded."""
+
+    def lookup(self, success_policy, divider=None):
+        """Decorate replica_lookup with the success policy."""
+        return run_distributively(
+            'replicas', divider or (lambda replicas: [[r] for r in replicas]),
+            lambda partials: partials,
+            success_policy=success_policy)(replica_lookup)
+
+    @async_test
+    async def test_first_success(self):
+        """Test that the fastest successful replica wins."""
+        lookup = self.lookup(SuccessPolicy.FIRST_SUCCESS)
+        loop = asyncio.get_running_loop()
+        start_time = loop.time()
+        result = await lookup([(10, 'slow'), (0, None), (0.01, 'fast')])
+        self.assertLess(loop.time() - start_time, 5)
+        self.assertEqual(result, ['fast'])
+
+    @async_test
+    async def test_first_success_sync_replicas(self):
+        """Test that slow replicas in a thread pool aren't waited for."""
+        def sync_lookup(replicas):
+            time.sleep(replicas[0][0])
+            return replicas[0][1]
+
+        lookup = run_distributively(
+            'replicas', lambda replicas: [[r] for r in replicas],
+            lambda partials: partials,
+            success_policy=SuccessPolicy.FIRST_SUCCESS)(sync_lookup)
+        loop = asyncio.get_running_loop()
+        start_time = loop.time()
+        result = await lookup([(0.1, 'fast'), (2, 'slow'), (2, 'slow'),
+                               (2, 'slow')])
+        self.assertLess(loop.time() - start_time, 1)
+        self.assertEqual(result, ['fast'])
+
+    @async_test
+    async def test_first_success_all_failed(self):
+        """Test that failure is reported if no replica succeeded."""
+        lookup = self.lookup(SuccessPolicy.FIRST_SUCCESS)
+        with self.assertRaises(MappedException) as context:
+            await lookup([(0, None), (0.01, None)])
+        self.assertEqual(len(context.exception.ex_descriptors), 2)
+
+    @async_test
+    async def test_quorum_count(self):
+        """Test that the call returns once the quorum is reached."""
+        lookup = self.lookup(Quorum(2))
+        result = await lookup([(10, 'slow'), (0, 'a'), (0.01, 'b')])
+        self.assertEqual(sorted(result), ['a', 'b'])
+
+    @async_test
+    async def test_quorum_fraction(self):
+        """Test fraction quorum with the total known only when exhausted."""
+        lookup = self.lookup(
+            Quorum(fraction=0.5),
+            lambda replicas: ([r] for r in replicas))
+        result = await lookup([(10, 'slow'), (0, 'a'), (0.01, 'b'),
+                               (10, 'slow')])
+        self.assertEqual(sorted(result), ['a', 'b'])
+        with self.assertRaises(MappedException):
+            await lookup([(0, None), (0, None), (0, 'a')])
+
+    @async_test
+    async def test_quorum_not_reached(self):
+        """Test that an unmet quorum is reported as such."""
+        lookup = self.lookup(Quorum(5))
+        with self.assertRaises(MappedException) as context:
+            await lookup([(0, 'a'), (0, 'b'), (0, None)])
+        self.assertEqual(context.exception.quorum, (2, 5))
+        self.assertEqual(context.exception.num_exceptions, 1)
+        with self.assertRaises(MappedException) as context:
+            await self.lookup(Quorum(5))([(0, 'a'), (0, 'b'), (0, 'c')])
+        self.assertEqual(context.exception.quorum, (3, 5))
+        self.assertEqual(
+            str(context.exception), '0 workers threw exception(s), '
+            'quorum not reached: 3 workers succeeded, 5 required')
+
+    def test_quorum_validation(self):
+        """Test that invalid quora are rejected."""
+        for args, kwargs in [((), {}), ((0,), {}),
+                             ((1,), {'fraction': 0.5}),
+                             ((), {'fraction': 1.5})]:
+            with self.assertRaises(ValueError):
+                Quorum(*args, **kwargs)
+
+
+class TestExceptionDescriptors(UnitTestCase):
+    """Keep exception descriptors compact."""
+
+    @async_test
+    async def test_identical_errors_counted(self):
+        """Test that identical errors are counted, samples capped."""
+        with self.assertRaises(MappedException) as context:
+            await fail_on_odd(range(1000))
+        exception = context.exception
+        self.assertEqual(exception.num_exceptions, 500)
+        self.assertEqual(
+            len(exception.ex_descriptors), DEFAULT_MAX_EX_SAMPLES)
+        message = str(exception)
+        self.assertIn('"count": 400', message)
+        self.assertIn('"count": 100', message)
+        self.assertIn('500 workers threw exception(s)', message)
+
+    @async_test
+    async def test_inputs_summarized(self):
+        """Test that large inputs are not kept in the descriptors."""
+        shared = set(range(100000))
+        items = [item async for item in fail_on_odd.stream(
+            [1], shared=shared)]
+        ex_desc = items[0].ex
+        self.assertIsInstance(ex_desc['function_inputs'], str)
+        self.assertLess(len(ex_desc['function_inputs']), 500)
+        self.assertEqual(ex_desc['function'], 'fail_on_odd')
+        self.assertIn('ValueError', ex_desc['type'])
+
+    @async_test
+    async def test_traceback_rendered_lazily(self):
+        """Test that the traceback is rendered on access."""
+        items = [item async for item in fail_on_odd.stream([1])]
+        ex_desc = items[0].ex
+        self.assertIsNone(ex_desc._tb)  # pylint: disable=W0212
+        self.assertIn('fail_on_odd', ''.join(ex_desc['tb']))
+        self.assertEqual(dict(ex_desc)['value'], 'odd')
+
+    @async_test
+    async def test_as_dict(self):
+        """Test that descriptors convert to JSON-serializable dicts."""
+        items = [item async for item in fail_on_odd.stream([1])]
+        fields = json.loads(json.dumps(items[0].ex.as_dict()))
+        self.assertEqual(fields['value'], 'odd')
+        self.assertEqual(fields['function'], 'fail_on_odd')
+        self.assertEqual(fields['attempts'], 1)
+        self.assertIn('fail_on_odd', ''.join(fields['tb']))
+
+    @async_test
+    async def test_no_inputs(self):
+        """Test leaving the inputs out of the descriptors."""
+        fail = run_distributively(
+            'nums', lambda nums: ([n] for n in nums),
+            inputs_summarizer=None)(fail_on_odd.__wrapped__)
+        items = [item async for item in fail.stream([1])]
+        self.assertIsNone(items[0].ex['function_inputs'])
+
+    def test_descriptor_list(self):
+        """Test MappedException built from a list of descriptors."""
+        exception = MappedException(
+            [{'type': 'ValueError', 'value': 'odd', 'function': 'f'}] * 3)
+        self.assertEqual(len(exception.ex_descriptors), 3)
+        self.assertIn('"count": 3', str(exception))
+
+
+class TestTimeouts(UnitTestCase):
+    """Time out chunks and calls, hedge stragglers."""
+
+    @async_test
+    async def test_chunk_timeout(self):
+        """Test that a hung chunk fails instead of blocking the call."""
+        lookup = run_distributively(
+            'replicas', lambda replicas: [[r] for r in replicas],
+            lambda partials: partials, chunk_timeout=0.05,
+            success_policy=SuccessPolicy.EXPECT_ANY)(replica_lookup)
+        result = await lookup([(10, 'hung'), (0, 'a')])
+        self.assertEqual(result, ['a'])
+        items = [item async for item in lookup.stream([(10, 'hung')])]
+        self.assertIn('TimeoutError', items[0].ex['type'])
+        self.assertIn('timed out after 0.05', items[0].ex['value'])
+
+    @async_test
+    async def test_deadline(self):
+        """Test that unfinished chunks fail once the deadline passes."""
+        lookup = run_distributively(
+            'replicas', lambda replicas: [[r] for r in replicas],
+            lambda partials: partials, deadline=0.05)(replica_lookup)
+        loop = asyncio.get_running_loop()
+        start_time = loop.time()
+        with self.assertRaises(MappedException) as context:
+            await lookup([(10, 'hung'), (0, 'a'), (10, 'hung')])
+        self.assertLess(loop.time() - start_time, 5)
+        self.assertEqual(context.exception.num_exceptions, 2)
+        self.assertIn('Deadline of 0.05 seconds exceeded',
+                      str(context.exception))
+
+    @async_test
+    async def test_deadline_partial_result(self):
+        """Test that the success policy applies after the deadline."""
+        lookup = run_distributively(
+            'replicas', lambda replicas: [[r] for r in replicas],
+            lambda partials: partials, deadline=0.05,
+            success_policy=SuccessPolicy.EXPECT_ANY)(replica_lookup)
+        result = await lookup([(10, 'hung'), (0, 'a')])
+        self.assertEqual(result, ['a'])
+
+    @async_test
+    async def test_hung_sync_chunk(self):
+        """Test that hung chunks in a pool don't hold the call or loop."""
+        def hang(delays):
+            time.sleep(delays[0])
+            return delays[0]
+
+        async def tick(ticks):
+            while True:
+                await asyncio.sleep(0.01)
+                ticks.append(None)
+
+        for kwargs in ({'chunk_timeout': 0.1}, {'deadline': 0.1}):
+            wait = run_distributively(
+                'delays', lambda delays: [[d] for d in delays],
+                total_reducer, **kwargs)(hang)
+            ticks = []
+            ticker = asyncio.create_task(tick(ticks))
+            loop = asyncio.get_running_loop()
+            start_time = loop.time()
+            with self.assertRaises(MappedException):
+                await wait([1, 0])
+            self.assertLess(loop.time() - start_time, 0.5)
+            ticker.cancel()
+            self.assertGreater(len(ticks), 5)
+
+    @async_test
+    async def test_hedging(self):
+        """Test that a straggler is hedged by a duplicate."""
+        attempts = {}
+
+        @run_distributively(
+            'nums', lambda nums: ([n] for n in nums), total_reducer,
+            hedge_percentile=0.9)
+        async def straggle_once(nums):
+            attempts[nums[0]] = attempts.get(nums[0], 0) + 1
+            # The first attempt of the last chunk hangs
+            if nums[0] == 99 and attempts[nums[0]] == 1:
+                await asyncio.sleep(10)
+            await asyncio.sleep(0.001)
+            return nums[0]
+
+        loop = asyncio.get_running_loop()
+        start_time = loop.time()
+        result = await straggle_once(range(100))
+        self.assertLess(loop.time() - start_time, 5)
+        self.assertEqual(result, sum(range(100)))
+        self.assertEqual(attempts[99], 2)
+
+    @async_test
+    async def test_hedging_small_fan_out(self):
+        """Test that a call of few chunks is hedged with fewer samples."""
+        attempts = {}
+
+        @run_distributively(
+            'nums', lambda nums: ([n] for n in nums), total_reducer,
+            hedge_percentile=0.5, hedge_min_samples=2)
+        async def straggle_once(nums):
+            attempts[nums[0]] = attempts.get(nums[0], 0) + 1
+            if nums[0] == 4 and attempts[nums[0]] == 1:
+                await asyncio.sleep(10)
+            await asyncio.sleep(0.001)
+            return nums[0]
+
+        loop = asyncio.get_running_loop()
+        start_time = loop.time()
+        self.assertEqual(await straggle_once(range(5)), 10)
+        self.assertLess(loop.time() - start_time, 5)
+        self.assertEqual(attempts[4], 2)
+        with self.assertRaises(ValueError):
+            run_distributively(
+                'nums', lambda nums: [nums], total_reducer,
+                hedge_percentile=0.5, hedge_min_samples=0)
+
+
+class TestRetries(UnitTestCase):
+    """Rerun failed chunks."""
+
+    @staticmethod
+    def flaky(retry_policy, failures, max_workers=None):
+        """Decorate a function failing the given times per chunk."""
+        attempts = {}
+
+        @run_distributively(
+            'nums', lambda nums: ([n] for n in nums), total_reducer,
+            retry_policy=retry_policy, max_workers=max_workers)
+        async def flaky_identity(nums):
+            attempts[nums[0]] = attempts.get(nums[0], 0) + 1
+            if attempts[nums[0]] <= failures:
+                raise ConnectionError('transient')
+            return nums[0]
+
+        return flaky_identity, attempts
+
+    @async_test
+    async def test_transient_failures(self):
+        """Test that only the failed chunks are rerun."""
+        flaky, attempts = self.flaky(
+            RetryPolicy(max_attempts=3, initial_backoff=0.001), 2)
+        self.assertEqual(await flaky(range(10)), sum(range(10)))
+        self.assertEqual(set(attempts.values()), {3})
+
+    @async_test
+    async def test_attempts_reported(self):
+        """Test that exhausted retries report the attempt count."""
+        flaky, _ = self.flaky(
+            RetryPolicy(max_attempts=2, initial_backoff=0.001), 5,
+            max_workers=2)
+        with self.assertRaises(MappedException) as context:
+            await flaky(range(3))
+        self.assertEqual(context.exception.ex_descriptors[0]['attempts'], 2)
+        self.assertIn('"attempts": 2', str(context.exception))
+
+    @async_test
+    async def test_retry_on(self):
+        """Test that only matching exceptions are retried."""
+        for retry_on in [ValueError, lambda ex: 'permanent' in str(ex)]:
+            flaky, attempts = self.flaky(
+                RetryPolicy(initial_backoff=0.001, retry_on=retry_on), 1)
+            with self.assertRaises(MappedException):
+                await flaky(range(2))
+            self.assertEqual(set(attempts.values()), {1})
+
+    def test_backoff(self):
+        """Test exponential backoff, capped, with and without jitter."""
+        policy = RetryPolicy(
+            initial_backoff=1, max_backoff=5, multiplier=2, jitter=False)
+        self.assertEqual(
+            [policy.backoff(attempt) for attempt in range(1, 5)],
+            [1, 2, 4, 5])
+        policy = RetryPolicy(initial_backoff=1, multiplier=2)
+        self.assertTrue(all(0 <= policy.backoff(3) <= 4 for _ in range(100)))
+
+
+class TestProcessBackend(UnitTestCase):
+    """Run chunks in worker processes."""
+
+    @async_test
+    async def test_count_sum(self):
+        """Test sum of numbers computed in a process pool."""
+        result = await distributed_sum_in_processes(self.nums)
+        self.assertEqual(sum(self.nums), result)
+
+    @async_test
+    async def test_count_sum_none(self):
+        """Test that worker exceptions are reported from processes."""
+        with self.assertRaises(MappedException) as context:
+            await distributed_sum_in_processes(None)
+        self.assertIn('TypeError', str(context.exception))
+
+    @async_test
+    async def test_runs_outside_of_caller_process(self):
+        """Test that chunks don't run in the caller's process."""
+        result = await worker_pids(self.nums)
+        self.assertTrue(result)
+        self.assertNotIn(os.getpid(), result)
+
+    @async_test
+    async def test_provided_executor(self):
+        """Test running the chunks in an executor passed by the caller."""
+        with ProcessPoolExecutor(max_workers=2) as pool:
+            summer = run_distributively(
+                'sum_me_up', num_mapper, total_reducer,
+                executor=pool)(distributed_sum_in_processes.__wrapped__)
+            result = await summer(self.nums)
+        self.assertEqual(sum(self.nums), result)
+
+
+class TestSyncFunctions(UnitTestCase):
+    """Run plain functions in a thread pool."""
+
+    @async_test
+    async def test_count_num_words_long(self):
+        """Test count_num_words_sync with long text."""
+        result = await count_num_words_sync(self.long_text)
+        self.assertEqual(result, 24)
+
+    @async_test
+    async def test_count_num_words_none(self):
+        """Test count_num_words_sync with None for text."""
+        with self.assertRaises(MappedException) as context:
+            await count_num_words_sync(None)
+        self.assertIn('count_num_words_sync', str(context.exception))
+
+    @async_test
+    async def test_runs_outside_of_event_loop_thread(self):
+        """Test that chunks don't block the event loop thread."""
+        result = await worker_threads(self.long_text)
+        self.assertTrue(result)
+        self.assertNotIn(threading.get_ident(), result)
+
+    @async_test
+    async def test_returning_coroutine(self):
+        """Test that coroutines returned by plain functions are awaited."""
+        calls = []
+
+        def logged(func):
+            def log_call(*args, **kwargs):
+                calls.append(args)
+                return func(*args, **kwargs)
+            return log_call
+
+        async def add_up(nums):
+            await asyncio.sleep(0)
+            return sum(nums)
+
+        summer = run_distributively(
+            'nums', lambda nums: [nums[:2], nums[2:]], sum)(logged(add_up))
+        self.assertEqual(await summer(nums=[1, 2, 3, 4]), 10)
+        self.assertEqual(len(calls), 2)
+
+    def test_async_backend_rejected(self):
+        """Test that plain functions can't run on the event loop."""
+        with self.assertRaises(TypeError):
+            run_distributively(
+                'text', text_mapper, total_reducer,
+                backend=ExecutionBackend.ASYNC)(count_words)
+
+
 if __name__ == '__main__':
     logging.basicConfig(level=logging.INFO)
     unittest.main()
@@ -0,0 +1,50 @@
+"""Test the benchmark harness."""
+# pylint: disable=R0801
+
+import json
+import os
+import tempfile
+import unittest
+
+from scripts import benchmark
+
+
+class TestBenchmark(unittest.TestCase):
+    """Time a small matrix, compare with a baseline."""
+
+    def test_run_and_compare(self):
+        """Test JSON results and flagged regressions."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output = os.path.join(tmp_dir, 'results.json')
+            argv = ['--backends', 'async', 'thread', '--sizes', '200',
+                    '--chunk-sizes', '50', '--max-workers', '2',
+                    '-s', '1', '--io-latency', '0.001', '--repeats', '2',
+                    '--output', output]
+            self.assertEqual(benchmark.main(argv), 0)
+            with open(output, encoding='utf-8') as results_file:
+                results = json.load(results_file)
+            self.assertEqual(
+                [result['name'] for result in results['results']],
+                ['cpu-async-n200-c50-w2', 'cpu-thread-n200-c50-w2',
+                 'io-async-n200-c50-w2', 'io-thread-n200-c50-w2'])
+            result = results['results'][0]
+            self.assertEqual(len(result['times']), 2)
+            self.assertEqual(result['num_chunks'], 4)
+            self.assertGreater(result['peak_memory'], 0)
+            self.assertLessEqual(result['min'], result['median'])
+
+            # A faster, leaner baseline makes the same results regress
+            baseline = json.loads(json.dumps(results))
+            baseline['results'][0]['throughput'] *= 2
+            baseline['results'][1]['peak_memory'] //= 2
+            del baseline['results'][2]
+            regressions = benchmark.compare(results, baseline, 0.1)
+            self.assertEqual(len(regressions), 2)
+            self.assertIn('cpu-async-n200-c50-w2: throughput', regressions[0])
+            self.assertIn('cpu-thread-n200-c50-w2: peak memory',
+                          regressions[1])
+            self.assertEqual(benchmark.compare(results, results), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,260 @@
+"""Test the chunk result cache."""
+
+import os
+import tempfile
+import threading
+import time
+import unittest
+from collections import Counter
+
+try:
+    import numpy
+except ImportError:  # optional
+    numpy = None
+
+from helpers import async_test
+
+from asynctd.cache import ResultCache, function_identity
+from asynctd.task_distributor import MappedException, run_distributively
+
+
+class Pickled:
+    """Shared argument counting how many times it's pickled."""
+
+    count = 0
+
+    def __reduce__(self):
+        Pickled.count += 1
+        return Pickled, ()
+
+
+# Chunks run by the word counters (not captured: cache keys depend on
+# the values closures capture)
+RUNS = []
+
+
+def counted_words(cache, **kwargs):
+    """Decorate a word counter recording the chunks it ran in RUNS."""
+    kwargs.setdefault(
+        'result_reducer', lambda partials: sum(partials, Counter()))
+
+    @run_distributively(
+        'words', lambda words: [words[i:i + 2]
+                                for i in range(0, len(words), 2)],
+        cache=cache, **kwargs)
+    async def count(words, case_sensitive=False,
+                    shared=None):  # pylint: disable=W0613
+        RUNS.append(words)
+        return Counter(words if case_sensitive else
+                       [word.lower() for word in words])
+    return count
+
+
+class TestResultCache(unittest.TestCase):
+    """Reuse results of chunks run before."""
+
+    def setUp(self):
+        RUNS.clear()
+
+    @async_test
+    async def test_overlapping_calls(self):
+        """Test that only chunks not seen before run."""
+        cache, runs = ResultCache(), RUNS
+        count = counted_words(cache)
+        words = ['a', 'b', 'c', 'd', 'A', 'b']
+        self.assertEqual(await count(words), Counter(a=2, b=2, c=1, d=1))
+        self.assertEqual((cache.hits, cache.misses), (0, 3))
+        runs.clear()
+        self.assertEqual(await count(words[:4] + ['e', 'f']),
+                         Counter('abcdef'))
+        self.assertEqual(runs, [['e', 'f']])
+        self.assertEqual((cache.hits, cache.misses), (2, 4))
+        # Other args make other keys
+        await count(words, case_sensitive=True)
+        self.assertEqual(cache.misses, 7)
+
+    @async_test
+    async def test_failures_not_cached(self):
+        """Test that failed chunks run again."""
+        cache, runs = ResultCache(), RUNS
+        count = counted_words(cache)
+        for _ in range(2):
+            with self.assertRaises(MappedException):
+                await count([1, 'a'])  # int has no lower()
+        self.assertEqual(len(runs), 2)
+        self.assertEqual(cache.hits, 0)
+
+    @async_test
+    async def test_results_isolated(self):
+        """Test that modifying a result doesn't change the cached one."""
+        cache = ResultCache()
+        count = counted_words(
+            cache, result_reducer=None,
+            result_combiner=lambda total, partial: total.update(
+                partial) or total)
+        self.assertEqual(await count(['a', 'b', 'a', 'c']),
+                         Counter(a=2, b=1, c=1))
+        self.assertEqual(await count(['a', 'b', 'a', 'c']),
+                         Counter(a=2, b=1, c=1))
+        self.assertEqual(cache.hits, 2)
+
+    @async_test
+    async def test_shared_args_hashed_once(self):
+        """Test that the other arguments are hashed once per call."""
+        cache, runs = ResultCache(), RUNS
+        count = counted_words(cache)
+        Pickled.count = 0
+        await count(['a', 'b', 'c', 'd', 'e', 'f'], shared=Pickled())
+        self.assertEqual(Pickled.count, 1)
+        self.assertEqual(len(runs), 3)
+        await count(['a', 'b', 'c', 'd', 'e', 'f'], shared=Pickled())
+        self.assertEqual(len(runs), 3)
+
+    def test_function_identity(self):
+        """Test that constants, names, defaults and closures are identified."""
+        def times_two(x):
+            return x * 2
+
+        def times_three(x):
+            return x * 3
+
+        def nested_two(x):
+            def scale():
+                return x * 2
+            return scale()
+
+        def nested_three(x):
+            def scale():
+                return x * 3
+            return scale()
+
+        def offset_one(x, offset=1):
+            return x + offset
+
+        def offset_two(x, offset=2):
+            return x + offset
+
+        for first, second in ((times_two, times_three),
+                              (nested_two, nested_three),
+                              (offset_one, offset_two)):
+            self.assertNotEqual(
+                function_identity(first).split(':')[1],
+                function_identity(second).split(':')[1])
+        self.assertEqual(function_identity(times_two),
+                         function_identity(times_two))
+
+        def scaler(factor):
+            def scale(x):
+                return x * factor
+            return scale
+
+        self.assertNotEqual(function_identity(scaler(2)),
+                            function_identity(scaler(3)))
+        self.assertEqual(function_identity(scaler(2)),
+                         function_identity(scaler(2)))
+
+    @async_test
+    async def test_closures(self):
+        """Test that the values closures captured are part of the keys."""
+        cache = ResultCache()
+
+        def make(factor):
+            @run_distributively(
+                'nums', lambda nums: [nums[:2], nums[2:]], sum, cache=cache)
+            async def scaled(nums):
+                return sum(num * factor for num in nums)
+            return scaled
+
+        self.assertEqual(await make(2)([1, 2, 3, 4]), 20)
+        self.assertEqual(await make(3)([1, 2, 3, 4]), 30)
+        self.assertEqual(await make(2)([1, 2, 3, 4]), 20)
+        self.assertEqual((cache.hits, cache.misses), (2, 4))
+
+    @async_test
+    async def test_unhashable_closure(self):
+        """Test that functions capturing unpicklable values aren't cached."""
+        cache, lock = ResultCache(), threading.Lock()
+
+        @run_distributively('nums', lambda nums: [nums], sum, cache=cache)
+        async def locked_sum(nums):
+            with lock:
+                return sum(nums)
+
+        self.assertIsNone(function_identity(locked_sum.__wrapped__))
+        for _ in range(2):
+            self.assertEqual(await locked_sum([1, 2]), 3)
+        self.assertEqual((cache.hits, cache.misses), (0, 0))
+
+    def test_lru_eviction(self):
+        """Test that the least recently used results are evicted."""
+        cache = ResultCache(max_entries=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertEqual(cache.get('b'), (False, None))
+        self.assertEqual(cache.get('a'), (True, 1))
+        self.assertEqual(cache.get('c'), (True, 3))
+
+    def test_ttl(self):
+        """Test that results expire."""
+        cache = ResultCache(ttl=0.05)
+        cache.put('a', 1)
+        self.assertEqual(cache.get('a'), (True, 1))
+        time.sleep(0.1)
+        self.assertEqual(cache.get('a'), (False, None))
+
+    def test_disk_tier(self):
+        """Test that results are kept on disk across caches."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'results.sqlite')
+            cache = ResultCache(path=path)
+            cache.put('a', {'x': 1})
+            cache.close()
+            cache = ResultCache(max_entries=1, path=path)
+            self.assertEqual(cache.get('a'), (True, {'x': 1}))
+            cache.put('b', 2)  # evicts 'a' from memory only
+            self.assertEqual(cache.get('a'), (True, {'x': 1}))
+            cache.clear()
+            self.assertEqual(cache.get('a'), (False, None))
+            cache.close()
+
+    def test_stable_keys(self):
+        """Test that keys don't depend on the iteration order."""
+        cache = ResultCache()
+
+        def func(*args, **kwargs):
+            return args, kwargs
+
+        self.assertEqual(
+            cache.key(func, ({'b', 'a', 'c'},), {'x': {1: 'a', 2: 'b'}}),
+            cache.key(func, ({'c', 'b', 'a'},), {'x': {2: 'b', 1: 'a'}}))
+        self.assertNotEqual(cache.key(func, ([1],), {}),
+                            cache.key(func, ((1,),), {}))
+        self.assertNotEqual(cache.key(func, ([1],), {}),
+                            cache.key(lambda *a: a, ([1],), {}))
+
+    @unittest.skipUnless(numpy, 'NumPy is not installed')
+    def test_ndarray_keys(self):
+        """Test that NumPy arrays are keyed by dtype, shape and content."""
+        cache = ResultCache()
+
+        def func(data):
+            return data
+
+        def key(data):
+            return cache.key(func, (data,), {})
+
+        data = numpy.arange(6, dtype=numpy.int32)
+        self.assertEqual(key(data), key(numpy.arange(6, dtype=numpy.int32)))
+        self.assertEqual(key(data[::2]), key(numpy.array([0, 2, 4],
+                                                         dtype=numpy.int32)))
+        self.assertNotEqual(key(data), key(data.reshape(2, 3)))
+        self.assertNotEqual(key(data), key(data.astype(numpy.int64)))
+        changed = data.copy()
+        changed[0] = 1
+        self.assertNotEqual(key(data), key(changed))
+
+
+if __name__ == '__main__':
+    unittest.main()
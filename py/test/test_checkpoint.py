@@ -0,0 +1,96 @@
+"""Test checkpointed runs."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from helpers import async_test
+
+from asynctd.checkpoint import CheckpointStore
+from asynctd.task_distributor import (
+    MappedException, SuccessPolicy, run_distributively)
+
+
+# Values squared, and values failing, by the backend of squares()
+# (not captured: run ids depend on the values closures capture)
+BACKEND = {'runs': [], 'failing': set()}
+
+
+def squared_sum(checkpoint, **kwargs):
+    """Decorate a sum of squares failing on the failing values."""
+    @run_distributively(
+        'values', lambda values: [[value] for value in values],
+        result_reducer=sum, checkpoint=checkpoint, **kwargs)
+    async def squares(values):
+        BACKEND['runs'].extend(values)
+        if values[0] in BACKEND['failing']:
+            raise ValueError(values[0])
+        return values[0] ** 2
+    return squares
+
+
+class TestCheckpoint(unittest.TestCase):
+    """Resume runs from their checkpoint."""
+
+    def setUp(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        self.path = os.path.join(tmp_dir, 'run.sqlite')
+        BACKEND['runs'], BACKEND['failing'] = [], {3}
+
+    @async_test
+    async def test_resume(self):
+        """Test that only missing and failed chunks run again."""
+        checkpoint = CheckpointStore(self.path)
+        squares = squared_sum(checkpoint)
+        with self.assertRaises(MappedException):
+            await squares([1, 2, 3, 4])
+        checkpoint.close()
+        # Restarted process: new store on the same file, backend fixed
+        BACKEND['runs'], BACKEND['failing'] = [], set()
+        checkpoint = CheckpointStore(self.path)
+        squares = squared_sum(checkpoint)
+        self.assertEqual(await squares([1, 2, 3, 4]), 30)
+        self.assertEqual(BACKEND['runs'], [3])
+        # Discarded once the call succeeded
+        run_id = checkpoint.run_id_for(squares.__wrapped__, ([1, 2, 3, 4],),
+                                       {})
+        self.assertEqual(checkpoint.load(run_id), {})
+        checkpoint.close()
+
+    @async_test
+    async def test_run_ids(self):
+        """Test that calls with other args don't share checkpoints."""
+        checkpoint = CheckpointStore(self.path)
+        squares = squared_sum(checkpoint)
+        for values in ([1, 2, 3], [2, 3, 4]):
+            with self.assertRaises(MappedException):
+                await squares(values)
+        self.assertEqual(BACKEND['runs'], [1, 2, 3, 2, 3, 4])
+        # An explicit run id is shared by all calls
+        BACKEND['failing'] = set()
+        fixed = CheckpointStore(self.path, run_id='nightly')
+        squares = squared_sum(fixed, success_policy=SuccessPolicy.SUPER_LAX)
+        self.assertEqual(await squares([1, 2]), 5)
+        self.assertEqual(fixed.run_id_for(squares, ([5],), {}), 'nightly')
+        checkpoint.close()
+        fixed.close()
+
+    def test_store(self):
+        """Test saving, loading and discarding chunk results."""
+        checkpoint = CheckpointStore(self.path)
+        checkpoint.save('a', 0, {'x': 1})
+        checkpoint.save('a', 2, [2])
+        checkpoint.save('a', 2, [3])
+        checkpoint.save('b', 0, 'other')
+        checkpoint.save('a', 1, lambda: None)  # not picklable, skipped
+        self.assertEqual(checkpoint.load('a'), {0: {'x': 1}, 2: [3]})
+        checkpoint.discard('a')
+        self.assertEqual(checkpoint.load('a'), {})
+        self.assertEqual(checkpoint.load('b'), {0: 'other'})
+        checkpoint.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
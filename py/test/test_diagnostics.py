@@ -0,0 +1,89 @@
+"""Test the event loop blocking detector and the chunk profiler."""
+
+import asyncio
+import os
+import pstats
+import tempfile
+import time
+import unittest
+
+from helpers import async_test
+
+from asynctd.diagnostics import Diagnostics
+from asynctd.task_distributor import MappedException, run_distributively
+
+
+async def never_suspends(delay):
+    """Busy wait, awaited without ever yielding to the loop."""
+    end = time.perf_counter() + delay
+    while time.perf_counter() < end:
+        pass
+
+
+def delayed(diagnostics, **kwargs):
+    """Decorate a function blocking or sleeping per chunk of one delay."""
+    @run_distributively(
+        'delays', lambda delays: [[delay] for delay in delays],
+        result_reducer=sum, diagnostics=diagnostics, **kwargs)
+    async def wait(delays, blocking=True):
+        if delays[0] < 0:
+            raise ValueError(delays[0])
+        if blocking:
+            await never_suspends(delays[0])
+        else:
+            await asyncio.sleep(delays[0])
+            await asyncio.sleep(delays[0])
+        return delays[0]
+    return wait
+
+
+class TestDiagnostics(unittest.TestCase):
+    """Flag blocking chunks, profile a sample of chunks."""
+
+    @async_test
+    async def test_blocking_chunks(self):
+        """Test that only the chunks holding the loop are flagged."""
+        diagnostics = Diagnostics(block_threshold=0.03)
+        wait = delayed(diagnostics)
+        with self.assertLogs(level='WARNING') as logs:
+            self.assertEqual(await wait([0, 0.05, 0]), 0.05)
+        self.assertEqual(
+            [(chunk.function, chunk.index) for chunk in diagnostics.blocking],
+            [('wait', 1)])
+        self.assertGreaterEqual(diagnostics.blocking[0].duration, 0.05)
+        self.assertIn('Chunk 1 of wait held the event loop', logs.output[0])
+        # Suspending chunks don't block, however long they take
+        diagnostics.blocking.clear()
+        self.assertEqual(await wait([0.05, 0.05], blocking=False), 0.1)
+        self.assertEqual(diagnostics.blocking, [])
+
+    @async_test
+    async def test_results_and_failures(self):
+        """Test that watched chunks behave as unwatched ones."""
+        wait = delayed(Diagnostics(), fail_fast=True)
+        with self.assertRaises(MappedException) as raised:
+            await wait([0.5, -1, 0.5], blocking=False)
+        self.assertEqual(raised.exception.num_cancelled, 2)
+        self.assertEqual(await wait([0.01, 0.02], blocking=False), 0.03)
+
+    @async_test
+    async def test_profile(self):
+        """Test that sampled chunk profiles are merged."""
+        diagnostics = Diagnostics(profile_sample=1.0)
+        wait = delayed(diagnostics)
+        await wait([0.001, 0.001, 0.001])
+        self.assertEqual(diagnostics.num_profiled, 3)
+        profiled = {func[2]: stats[0] for func, stats in
+                    diagnostics.profile.stats.items()}
+        self.assertEqual(profiled['never_suspends'], 3)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'chunks.prof')
+            diagnostics.dump_profile(path)
+            self.assertEqual(pstats.Stats(path).total_calls,
+                             diagnostics.profile.total_calls)
+        with self.assertRaises(ValueError):
+            Diagnostics().dump_profile('unused')
+
+
+if __name__ == '__main__':
+    unittest.main()
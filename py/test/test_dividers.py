@@ -0,0 +1,189 @@
+"""Test built-in arg value dividers."""
+
+import array
+import asyncio
+import pickle
+import unittest
+
+try:
+    import numpy
+except ImportError:  # optional
+    numpy = None
+
+from helpers import async_test
+
+from asynctd.dividers import AdaptiveDivider, SequenceDivider, SliceView
+from asynctd.reducers import concat_reducer, sum_reducer
+from asynctd.task_distributor import ExecutionBackend, run_distributively
+
+
+class TestAdaptiveDivider(unittest.TestCase):
+    """Size chunks from measured chunk run times."""
+
+    def test_grows_toward_target(self):
+        """Test that fast chunks make the following ones bigger."""
+        chunks = AdaptiveDivider(
+            target_duration=0.1, parallelism=1)(range(10000))
+        self.assertEqual(len(next(chunks)), 1)
+        chunks.chunk_done(0, 0.001)
+        self.assertEqual(len(next(chunks)), 2)  # growth is limited
+        chunks.chunk_done(1, 0.002)
+        self.assertEqual(len(next(chunks)), 4)
+
+    def test_shrinks_toward_target(self):
+        """Test that slow chunks make the following ones smaller."""
+        chunks = AdaptiveDivider(
+            target_duration=0.1, initial_size=64, parallelism=1)(
+                range(10000))
+        self.assertEqual(len(next(chunks)), 64)
+        chunks.chunk_done(0, 64.0)
+        self.assertEqual(len(next(chunks)), 32)
+
+    def test_bounds(self):
+        """Test that min_size and max_size are respected."""
+        chunks = AdaptiveDivider(
+            target_duration=1, max_size=3, parallelism=1)(range(100))
+        next(chunks)
+        chunks.chunk_done(0, 0.0001)
+        next(chunks)
+        chunks.chunk_done(1, 0.0001)
+        self.assertEqual(len(next(chunks)), 3)
+        chunks = AdaptiveDivider(min_size=5)(range(100))
+        self.assertEqual(len(next(chunks)), 5)
+
+    def test_load_balance(self):
+        """Test that the tail of a sequence is spread over parallelism."""
+        chunks = AdaptiveDivider(initial_size=1000, parallelism=4)(
+            range(100))
+        self.assertEqual([len(chunk) for chunk in chunks],
+                         [25, 19, 14, 11, 8, 6, 5, 3, 3, 2, 1, 1, 1, 1])
+
+    def test_iterable(self):
+        """Test dividing an iterable that isn't a sequence."""
+        chunks = AdaptiveDivider(initial_size=3)(iter(range(10)))
+        self.assertEqual(list(chunks), [[0, 1, 2], [3, 4, 5], [6, 7, 8], [9]])
+
+    @async_test
+    async def test_distributed(self):
+        """Test that the chunk size adapts in a distributed run."""
+        @run_distributively(
+            'nums', AdaptiveDivider(target_duration=0.01, parallelism=1),
+            lambda partials: partials, max_workers=1)
+        async def sleep_per_item(nums):
+            await asyncio.sleep(0.0001 * len(nums))
+            return len(nums)
+
+        result = await sleep_per_item(range(5000))
+        self.assertEqual(sum(result), 5000)
+        self.assertLess(len(result), 100)
+        self.assertGreater(max(result), 32)
+
+
+def chunk_sum(nums):
+    """Sum a chunk in a worker process."""
+    return sum(nums)
+
+
+class TestSequenceDivider(unittest.TestCase):
+    """Divide sequences into views."""
+
+    def test_ranges(self):
+        """Test that ranges are divided into balanced sub-ranges."""
+        chunks = SequenceDivider(num_chunks=3)(range(10))
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(list(chunks), [range(3), range(3, 6), range(6, 10)])
+        self.assertEqual(
+            [len(c) for c in SequenceDivider(chunk_size=4)(range(10))],
+            [3, 3, 4])
+
+    def test_strings(self):
+        """Test that strings are divided into substrings."""
+        chunks = SequenceDivider(chunk_size=3)('abcdefg')
+        self.assertEqual(list(chunks), ['ab', 'cd', 'efg'])
+        self.assertEqual(chunks[0].upper(), 'AB')
+
+    def test_buffers(self):
+        """Test that buffers are divided into memoryview slices."""
+        data = bytearray(b'abcdefgh')
+        chunks = list(SequenceDivider(num_chunks=2)(data))
+        self.assertIsInstance(chunks[0], memoryview)
+        data[0] = ord('z')
+        self.assertEqual(chunks[0].tobytes(), b'zbcd')
+        numbers = array.array('d', [1.5, 2.5, 3.5])
+        self.assertEqual(
+            [c.tolist() for c in SequenceDivider(chunk_size=2)(numbers)],
+            [[1.5], [2.5, 3.5]])
+
+    @unittest.skipUnless(numpy, 'NumPy is not installed')
+    def test_ndarrays(self):
+        """Test that NumPy arrays are divided into views by array_split."""
+        data = numpy.arange(10)
+        chunks = SequenceDivider(num_chunks=3)(data)
+        self.assertEqual([len(c) for c in chunks], [4, 3, 3])
+        self.assertTrue(all(c.base is data for c in chunks))
+        data[4] = -1
+        self.assertEqual(chunks[1].tolist(), [-1, 5, 6])
+
+    def test_lists(self):
+        """Test that lists are divided into lazy slice views."""
+        items = list(range(10))
+        chunks = SequenceDivider(num_chunks=20)(items)
+        self.assertEqual(len(chunks), 10)
+        view = SequenceDivider(num_chunks=2)(items)[1]
+        self.assertIsInstance(view, SliceView)
+        items[5] = 'changed'
+        self.assertEqual(view, ['changed', 6, 7, 8, 9])
+        self.assertEqual(view[1:3], [6, 7])
+        self.assertEqual(view[-1], 9)
+        self.assertEqual(view[::2], ['changed', 7, 9])
+        with self.assertRaises(IndexError):
+            view[5]  # pylint: disable=W0104
+        self.assertEqual(pickle.loads(pickle.dumps(view)),
+                         ['changed', 6, 7, 8, 9])
+
+    def test_iterables(self):
+        """Test that other iterables are batched lazily."""
+        self.assertEqual(
+            list(SequenceDivider(chunk_size=2)(iter(range(5)))),
+            [[0, 1], [2, 3], [4]])
+        with self.assertRaises(TypeError):
+            SequenceDivider(num_chunks=2)(iter(range(5)))
+
+    def test_validation(self):
+        """Test that exactly one positive setting is required."""
+        for kwargs in ({}, {'num_chunks': 2, 'chunk_size': 2},
+                       {'num_chunks': 0}):
+            with self.assertRaises(ValueError):
+                SequenceDivider(**kwargs)
+
+    @async_test
+    async def test_run(self):
+        """Test views divided in calls, shipped to processes."""
+        run = run_distributively(
+            'nums', SequenceDivider(num_chunks=4), sum_reducer)(chunk_sum)
+        self.assertEqual(await run(list(range(100))), 4950)
+        self.assertEqual(await run(range(100)), 4950)
+        run = run_distributively(
+            'nums', SequenceDivider(chunk_size=7), sum_reducer,
+            backend=ExecutionBackend.PROCESS, max_workers=2)(chunk_sum)
+        self.assertEqual(await run(list(range(100))), 4950)
+        # memoryviews can't be pickled, they go through shared memory
+        run = run_distributively(
+            'nums', SequenceDivider(chunk_size=7), sum_reducer,
+            backend=ExecutionBackend.PROCESS, max_workers=2,
+            shared_memory=True)(chunk_sum)
+        self.assertEqual(await run(array.array('i', range(100))), 4950)
+
+    @async_test
+    async def test_concat(self):
+        """Test that chunk results are concatenated in order."""
+        @run_distributively(
+            'items', SequenceDivider(chunk_size=3), concat_reducer)
+        async def doubled(items):
+            return [2 * item for item in items]
+        self.assertEqual(await doubled(list(range(10))),
+                         [2 * i for i in range(10)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,248 @@
+"""Test limiters of the chunk dispatch."""
+
+import asyncio
+import time
+import unittest
+
+from helpers import async_test
+
+from asynctd.limiters import (
+    ConcurrencyLimiter, Flow, TokenBucket, named_limiter, scheduled)
+from asynctd.task_distributor import SuccessPolicy, run_distributively
+
+
+def start_times(rate_limit):
+    """Decorate a function reporting when its chunks started."""
+    @run_distributively(
+        'nums', lambda nums: ([n] for n in nums),
+        sorted, rate_limit=rate_limit)
+    async def started(nums):  # pylint: disable=W0613
+        return time.monotonic()
+    return started
+
+
+class TestTokenBucket(unittest.TestCase):
+    """Limit the rate chunks start at."""
+
+    def test_reserve(self):
+        """Test that a burst is free, then tokens come at the rate."""
+        bucket = TokenBucket(rate=10, burst=2)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertAlmostEqual(bucket.reserve(), 0.1, delta=0.01)
+        self.assertAlmostEqual(bucket.reserve(), 0.2, delta=0.01)
+        bucket.release()
+        self.assertAlmostEqual(bucket.reserve(), 0.2, delta=0.01)
+
+    def test_validation(self):
+        """Test that invalid rates and bursts are rejected."""
+        with self.assertRaises(ValueError):
+            TokenBucket(rate=0)
+        with self.assertRaises(ValueError):
+            TokenBucket(rate=1, burst=0)
+
+    @async_test
+    async def test_rate_limited_run(self):
+        """Test that chunks start no faster than the rate."""
+        started = start_times(TokenBucket(rate=200, burst=5))
+        times = await started(range(25))
+        self.assertEqual(len(times), 25)
+        # The burst starts at once, the other 20 chunks at 200 per second
+        self.assertGreaterEqual(times[-1] - times[0], 0.09)
+        self.assertLess(times[5] - times[0], times[-1] - times[0])
+
+    @async_test
+    async def test_shared_bucket(self):
+        """Test that a bucket shared by functions limits them together."""
+        bucket = TokenBucket(rate=200, burst=1)
+        first, second = start_times(bucket), start_times(bucket)
+        times = sorted(sum(await asyncio.gather(
+            first(range(10)), second(range(10))), []))
+        self.assertGreaterEqual(times[-1] - times[0], 0.09)
+
+
+def tracked(limiter, load, nested=None):
+    """Decorate a function recording the peak number of running chunks."""
+    @run_distributively(
+        'nums', lambda nums: ([n] for n in nums),
+        sum, limiter=limiter)
+    async def run(nums):
+        load['running'] += 1
+        load['peak'] = max(load['peak'], load['running'])
+        await asyncio.sleep(0.01)
+        load['running'] -= 1
+        if nested:
+            return await nested(range(3))
+        return sum(nums)
+    return run
+
+
+class TestConcurrencyLimiter(unittest.TestCase):
+    """Limit concurrency across functions and calls."""
+
+    @async_test
+    async def test_shared_limiter(self):
+        """Test that a limiter shared by functions bounds them together."""
+        load = {'running': 0, 'peak': 0}
+        limiter = ConcurrencyLimiter(3)
+        first, second = tracked(limiter, load), tracked(limiter, load)
+        results = await asyncio.gather(
+            first(range(10)), second(range(10)), first(range(5)))
+        self.assertEqual(results, [45, 45, 10])
+        self.assertEqual(load['peak'], 3)
+        self.assertEqual(limiter.active, 0)
+
+    @async_test
+    async def test_nested_calls(self):
+        """Test that nested calls borrow the caller's slot."""
+        load = {'running': 0, 'peak': 0}
+        limiter = ConcurrencyLimiter(2)
+        inner = tracked(limiter, load)
+        outer = tracked(limiter, load, nested=inner)
+        # All slots are held by outer chunks waiting on inner calls
+        result = await asyncio.wait_for(outer(range(4)), 5)
+        self.assertEqual(result, 12)
+        self.assertLessEqual(load['peak'], 2)
+        self.assertEqual(limiter.active, 0)
+
+    @async_test
+    async def test_cancelled_waiter(self):
+        """Test that a cancelled waiter doesn't leak a slot."""
+        limiter = ConcurrencyLimiter(1)
+        await limiter.acquire()
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        limiter.release()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiter
+        await asyncio.sleep(0)
+        self.assertEqual(limiter.active, 0)
+
+    @async_test
+    async def test_rate_limit_holds_no_slot(self):
+        """Test that waiting for a rate limit token doesn't hold a slot
+        a function without a rate limit needs."""
+        limiter = ConcurrencyLimiter(2)
+
+        def timed(**kwargs):
+            @run_distributively(
+                'nums', lambda nums: ([n] for n in nums),
+                sum, limiter=limiter, **kwargs)
+            async def run(nums):
+                await asyncio.sleep(0.001)
+                return sum(nums)
+            return run
+
+        limited = asyncio.ensure_future(
+            timed(rate_limit=TokenBucket(rate=20, burst=1))(range(10)))
+        await asyncio.sleep(0.01)
+        start = time.monotonic()
+        self.assertEqual(await timed()(range(10)), 45)
+        self.assertLess(time.monotonic() - start, 0.2)
+        self.assertEqual(await limited, 45)
+        self.assertEqual(limiter.active, 0)
+
+    @async_test
+    async def test_cancelled_calls(self):
+        """Test that the flows of cancelled waiters aren't kept."""
+        limiter = ConcurrencyLimiter(1)
+
+        @run_distributively(
+            'nums', lambda nums: ([n] for n in nums), lambda partials: partials,
+            limiter=limiter, success_policy=SuccessPolicy.FIRST_SUCCESS)
+        async def first(nums):
+            await asyncio.sleep(0.001)
+            return nums
+
+        for _ in range(50):
+            self.assertEqual(await first(range(5)), [[0]])
+        self.assertEqual(limiter.finish_times, {})
+        self.assertEqual(limiter.active, 0)
+
+    def test_across_loops(self):
+        """Test that a limiter can be used by consecutive event loops."""
+        load = {'running': 0, 'peak': 0}
+        run = tracked(ConcurrencyLimiter(2), load)
+        self.assertEqual(asyncio.run(run(range(6))), 15)
+        self.assertEqual(asyncio.run(run(range(6))), 15)
+        self.assertEqual(load['peak'], 2)
+
+    @async_test
+    async def test_named_limiter(self):
+        """Test that named limiters are shared by name."""
+        limiter = named_limiter('test_named_limiter', 2)
+        self.assertIs(named_limiter('test_named_limiter'), limiter)
+        with self.assertRaises(ValueError):
+            named_limiter('test_named_limiter', 3)
+        with self.assertRaises(KeyError):
+            named_limiter('test_missing_limiter')
+        load = {'running': 0, 'peak': 0}
+        run = tracked('test_named_limiter', load)
+        self.assertEqual(await run(range(6)), 15)
+        self.assertEqual(load['peak'], 2)
+
+
+def ordered_runs(limiter, order, **kwargs):
+    """Decorate a function recording the order its chunks ran in."""
+    @run_distributively(
+        'tags', lambda tags: ([tag] for tag in tags),
+        lambda partials: None, limiter=limiter, **kwargs)
+    async def run(tags):
+        order.append(tags[0])
+        await asyncio.sleep(0.001)
+    return run
+
+
+class TestScheduling(unittest.TestCase):
+    """Share limiters between calls by priority and weight."""
+
+    @async_test
+    async def test_small_call_not_starved(self):
+        """Test that a small call isn't queued behind a bulk one."""
+        order = []
+        run = ordered_runs(ConcurrencyLimiter(1), order)
+        bulk = asyncio.ensure_future(run(['bulk'] * 30))
+        await asyncio.sleep(0.005)
+        await asyncio.gather(run(['small'] * 2), bulk)
+        self.assertEqual(len(order), 32)
+        self.assertLess(order.index('small'), 10)
+
+    @async_test
+    async def test_priority(self):
+        """Test that calls of higher priority are served first."""
+        order = []
+        limiter = ConcurrencyLimiter(1)
+        low = ordered_runs(limiter, order)
+        high = ordered_runs(limiter, order, priority=1)
+        low_call = asyncio.ensure_future(low(['low'] * 10))
+        await asyncio.sleep(0.003)
+        await asyncio.gather(high(['high'] * 5), low_call)
+        # The high chunks ran back to back, before most low ones
+        first = order.index('high')
+        self.assertLess(first, 6)
+        self.assertEqual(order[first:first + 5], ['high'] * 5)
+
+    @async_test
+    async def test_weights(self):
+        """Test that slots are shared in proportion to the weights."""
+        order = []
+        limiter = ConcurrencyLimiter(1)
+        run = ordered_runs(limiter, order)
+        await limiter.acquire()
+        with scheduled(weight=3):
+            heavy = asyncio.ensure_future(run(['heavy'] * 20))
+        light = asyncio.ensure_future(run(['light'] * 20))
+        await asyncio.sleep(0.01)
+        limiter.release()
+        await asyncio.gather(heavy, light)
+        self.assertEqual(order[:16].count('heavy'), 12)
+
+    def test_validation(self):
+        """Test that non-positive weights are rejected."""
+        with self.assertRaises(ValueError):
+            Flow(weight=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
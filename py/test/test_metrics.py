@@ -0,0 +1,124 @@
+"""Test the metrics of distributed runs."""
+
+import asyncio
+import unittest
+
+from helpers import async_test
+
+from asynctd.limiters import ConcurrencyLimiter
+from asynctd.metrics import MetricsHook, collect_stats
+from asynctd.task_distributor import (
+    MappedException, SuccessPolicy, run_distributively)
+
+
+class RecordingHook(MetricsHook):
+    """Hook recording the events it gets."""
+
+    def __init__(self):
+        self.events = []
+
+    def call_started(self, stats):
+        self.events.append(('started', stats.name))
+
+    def chunk_done(self, stats, index, succeeded, wait, run_time):
+        self.events.append(('chunk', index, succeeded))
+
+    def call_done(self, stats):
+        self.events.append(('done', stats.num_chunks))
+
+
+def sleepers(**kwargs):
+    """Decorate a function sleeping on chunks of one delay."""
+    kwargs.setdefault('result_reducer', sum)
+
+    @run_distributively(
+        'delays', lambda delays: [[delay] for delay in delays], **kwargs)
+    async def sleep(delays):
+        if delays[0] < 0:
+            raise ValueError(delays[0])
+        await asyncio.sleep(delays[0])
+        return delays[0]
+    return sleep
+
+
+class TestMetrics(unittest.TestCase):
+    """Measure the stages of calls."""
+
+    @async_test
+    async def test_call_stats(self):
+        """Test waits, run times, concurrency and counts."""
+        sleep = sleepers(max_workers=2,
+                         success_policy=SuccessPolicy.SUPER_LAX)
+        with collect_stats() as collected:
+            await sleep([0.05, 0.05, 0.05, 0.05, -1])
+        self.assertEqual(len(collected), 1)
+        stats = collected[0]
+        self.assertEqual(stats.name, 'sleep')
+        self.assertEqual((stats.num_chunks, stats.num_succeeded,
+                          stats.num_failed), (5, 4, 1))
+        self.assertEqual(stats.max_running, 2)
+        self.assertEqual(stats.running, 0)
+        self.assertGreaterEqual(stats.run_time, 0.19)
+        self.assertGreaterEqual(stats.max_run_time, 0.049)
+        self.assertGreaterEqual(stats.elapsed, 0.1)
+        self.assertGreaterEqual(stats.chunking_time, 0)
+        self.assertGreaterEqual(stats.reduce_time, 0)
+        self.assertEqual(stats.as_dict()['max_workers'], 2)
+        self.assertAlmostEqual(stats.as_dict()['mean_run_time'],
+                               stats.run_time / 5)
+
+    @async_test
+    async def test_limiter_wait(self):
+        """Test that chunks waiting for a shared limiter are seen."""
+        sleep = sleepers(max_workers=2, limiter=ConcurrencyLimiter(1))
+        with collect_stats() as collected:
+            await sleep([0.05, 0.05])
+        self.assertEqual(len(collected), 1)
+        stats = collected[0]
+        self.assertEqual(stats.max_running, 1)
+        self.assertGreaterEqual(stats.max_wait_time, 0.04)
+        self.assertAlmostEqual(stats.wait_time, stats.max_wait_time,
+                               delta=0.01)
+
+    @async_test
+    async def test_hook(self):
+        """Test that the hook gets every chunk and failed calls too."""
+        hook = RecordingHook()
+        sleep = sleepers(metrics=hook)
+        with self.assertRaises(MappedException):
+            await sleep([0, -1])
+        self.assertEqual(hook.events[0], ('started', 'sleep'))
+        self.assertCountEqual(hook.events[1:3],
+                              [('chunk', 0, True), ('chunk', 1, False)])
+        self.assertEqual(hook.events[3], ('done', 2))
+        hook.events.clear()
+        async for _ in sleep.stream([0, 0, 0]):
+            pass
+        self.assertEqual(hook.events[-1], ('done', 3))
+
+    @async_test
+    async def test_reduce_time(self):
+        """Test that the reducer run time is measured."""
+        async def slow_reducer(partials):
+            await asyncio.sleep(0.05)
+            return sum(partials)
+
+        sleep = sleepers(result_reducer=slow_reducer)
+        with collect_stats() as outer, collect_stats() as inner:
+            self.assertEqual(await sleep([0, 0]), 0)
+        self.assertIs(outer[0], inner[0])
+        self.assertGreaterEqual(outer[0].reduce_time, 0.04)
+
+    @async_test
+    async def test_not_measured(self):
+        """Test that calls nobody looks at aren't measured."""
+        sleep = sleepers()
+        self.assertEqual(await sleep([0, 0]), 0)
+        with collect_stats() as collected:
+            pass
+        await sleep([0])
+        self.assertEqual(collected, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+"""Test the persistent worker pools."""
+
+import os
+import threading
+import time
+import unittest
+from concurrent.futures import BrokenExecutor
+
+from helpers import async_test
+
+from asynctd.pools import WorkerPool
+from asynctd.task_distributor import run_distributively
+
+_STATE = {}
+
+
+def load_vocabulary(words, started):
+    """Initializer preloading the vocabulary of the worker."""
+    _STATE['vocabulary'] = set(words)
+    started.append(threading.get_ident())
+
+
+def load_vocabulary_in_process(words):
+    """Initializer preloading the vocabulary of a worker process."""
+    _STATE['vocabulary'] = set(words)
+
+
+def known(words):
+    """Return the known words, and who found them."""
+    return {'known': [word for word in words
+                      if word in _STATE['vocabulary']],
+            'workers': {(os.getpid(), threading.get_ident())}}
+
+
+def merge(partials):
+    """Merge the partials of known()."""
+    return {'known': sorted(word for partial in partials
+                            for word in partial['known']),
+            'workers': set().union(*(partial['workers']
+                                     for partial in partials))}
+
+
+def distributed_known(pool):
+    """Decorate known() to run on the pool."""
+    return run_distributively(
+        'words', lambda words: [words[i:i + 2]
+                                for i in range(0, len(words), 2)],
+        merge, executor=pool)(known)
+
+
+class TestWorkerPool(unittest.TestCase):
+    """Reuse warm workers across calls."""
+
+    @async_test
+    async def test_threads(self):
+        """Test that initialized threads are started once and reused."""
+        started = []
+        with WorkerPool(3, initializer=load_vocabulary,
+                        initargs=(['a', 'b'], started)) as pool:
+            self.assertEqual(len(started), 3)  # warmed up
+            find = distributed_known(pool)
+            workers = set()
+            for _ in range(3):
+                result = await find(['a', 'x', 'b', 'y', 'a', 'z'])
+                self.assertEqual(result['known'], ['a', 'a', 'b'])
+                workers |= result['workers']
+            self.assertLessEqual(
+                {ident for _, ident in workers}, set(started))
+            self.assertEqual(len(started), 3)
+
+    @async_test
+    async def test_processes(self):
+        """Test that worker processes are initialized and reused."""
+        with WorkerPool(2, processes=True,
+                        initializer=load_vocabulary_in_process,
+                        initargs=(['a'],)) as pool:
+            find = distributed_known(pool)
+            first = await find(['a', 'b', 'a', 'c'])
+            second = await find(['b', 'a'])
+            self.assertEqual(first['known'], ['a', 'a'])
+            self.assertEqual(second['known'], ['a'])
+            pids = {pid for pid, _ in first['workers'] | second['workers']}
+            self.assertNotIn(os.getpid(), pids)
+            self.assertLessEqual(len(pids), 2)
+
+    def test_drain(self):
+        """Test that draining finishes calls in flight, refuses new ones."""
+        pool = WorkerPool(1, warm_up=False)
+        future = pool.submit(time.sleep, 0.2)
+        self.assertEqual(pool.num_in_flight, 1)
+        self.assertFalse(pool.drain(timeout=0.01))
+        with self.assertRaises(RuntimeError):
+            pool.submit(time.sleep, 0)
+        self.assertTrue(pool.drain())
+        self.assertTrue(future.done())
+        self.assertEqual(pool.num_in_flight, 0)
+        pool.shutdown()
+
+    def test_failing_initializer(self):
+        """Test that warming up reports initializer failures."""
+        def fail():
+            raise ValueError('no vocabulary')
+
+        with self.assertRaises(BrokenExecutor), \
+                self.assertLogs('concurrent.futures', level='CRITICAL'):
+            WorkerPool(1, initializer=fail)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+"""Test built-in result reducers."""
+
+import threading
+import unittest
+from collections import Counter
+
+try:
+    import numpy
+except ImportError:  # optional
+    numpy = None
+
+from helpers import async_test
+
+from asynctd.reducers import concat_reducer, merge_reducer, sum_reducer
+from asynctd.task_distributor import run_distributively
+
+
+class TestReducers(unittest.TestCase):
+    """Combine partial results."""
+
+    def test_sum(self):
+        """Test that numbers are summed."""
+        self.assertEqual(sum_reducer([1, 2, 3]), 6)
+        self.assertEqual(sum_reducer(iter([0.5, 0.25])), 0.75)
+        self.assertEqual(sum_reducer([]), 0)
+
+    def test_concat(self):
+        """Test that partials are concatenated by type."""
+        self.assertEqual(concat_reducer([[1, 2], (3,), range(4, 6)]),
+                         [1, 2, 3, 4, 5])
+        self.assertEqual(concat_reducer(['ab', 'c']), 'abc')
+        self.assertEqual(concat_reducer([b'ab', bytearray(b'c')]), b'abc')
+        self.assertEqual(concat_reducer([]), [])
+
+    @unittest.skipUnless(numpy, 'NumPy is not installed')
+    def test_ndarrays(self):
+        """Test that NumPy arrays are summed in place in a new array and
+        concatenated by numpy.concatenate."""
+        partials = [numpy.ones(3), numpy.arange(3.0), numpy.full(3, 2.0)]
+        total = sum_reducer(partials)
+        self.assertEqual(total.tolist(), [3.0, 4.0, 5.0])
+        self.assertFalse(any(numpy.shares_memory(total, partial)
+                             for partial in partials))
+        self.assertEqual(partials[0].tolist(), [1.0, 1.0, 1.0])
+        joined = concat_reducer([numpy.arange(2), numpy.arange(2, 5)])
+        self.assertIsInstance(joined, numpy.ndarray)
+        self.assertEqual(joined.tolist(), [0, 1, 2, 3, 4])
+
+    def test_merge(self):
+        """Test that mappings are merged, counters added up."""
+        self.assertEqual(merge_reducer([{'a': 1}, {'a': 2, 'b': 3}]),
+                         {'a': 2, 'b': 3})
+        partials = [Counter('abb'), Counter('bc')]
+        self.assertEqual(merge_reducer(partials), Counter('abbbc'))
+        self.assertEqual(partials[0], Counter('abb'))  # not modified
+        self.assertEqual(merge_reducer([]), {})
+        with self.assertRaises(TypeError):
+            merge_reducer([[1]])
+
+
+class TestTreeReduction(unittest.TestCase):
+    """Reduce partials of associative reducers in a tree."""
+
+    @async_test
+    async def test_order_kept(self):
+        """Test that partials are reduced in chunk order."""
+        reducer_threads = set()
+
+        def concat(partials):
+            reducer_threads.add(threading.get_ident())
+            return ''.join(partials)
+
+        @run_distributively('text', list, concat, associative_reducer=True)
+        async def upper(text):
+            return text.upper()
+
+        text = 'abcdefghijklmnopqrstuvwxyz' * 10
+        self.assertEqual(await upper(text), text.upper())
+        self.assertNotIn(threading.get_ident(), reducer_threads)
+
+    @async_test
+    async def test_backend_pool(self):
+        """Test that partials of sync chunks are reduced in their pool."""
+        chunk_threads, reducer_threads = set(), set()
+
+        def concat(partials):
+            reducer_threads.add(threading.current_thread().name)
+            return ''.join(partials)
+
+        @run_distributively(
+            'text', lambda text: [text[i:i + 2]
+                                  for i in range(0, len(text), 2)],
+            concat, max_workers=2, associative_reducer=True)
+        def upper(text):
+            chunk_threads.add(threading.current_thread().name)
+            return text.upper()
+
+        text = 'abcdefghijklmnopqrstuvwxyz' * 4
+        self.assertEqual(await upper(text), text.upper())
+        self.assertTrue(reducer_threads)
+        # Threads of the call's pool, not of the loop's default one
+        self.assertLessEqual(reducer_threads, chunk_threads)
+
+    @async_test
+    async def test_async_reducer(self):
+        """Test that coroutine reducers are applied in a tree too."""
+        group_sizes = []
+
+        async def total(partials):
+            group_sizes.append(len(partials))
+            return sum(partials)
+
+        @run_distributively(
+            'nums', lambda nums: [[n] for n in nums], total,
+            associative_reducer=True)
+        async def identity(nums):
+            return nums[0]
+
+        self.assertEqual(await identity(list(range(1, 101))), 5050)
+        self.assertLessEqual(max(group_sizes), 8)
+        self.assertEqual(len(group_sizes), 13 + 2 + 1)
+
+    @async_test
+    async def test_single_and_no_partials(self):
+        """Test that the reducer is applied to one or no partials."""
+        @run_distributively(
+            'nums', lambda nums: [nums], lambda partials: sorted(
+                sum(partials, [])), associative_reducer=True)
+        async def reverse(nums):
+            return nums[::-1]
+
+        self.assertEqual(await reverse([3, 1, 2]), [1, 2, 3])
+        self.assertEqual(await reverse([]), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,195 @@
+"""Test remote execution of chunks on worker daemons."""
+
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client
+
+from helpers import async_test
+
+from asynctd.remote import (
+    Coordinator, LocalCluster, RemoteTraceback, WorkerLost)
+from asynctd.task_distributor import (
+    MappedException, SuccessPolicy, run_distributively)
+
+
+def chunk_per_num(nums):
+    """Divide nums into one chunk per number."""
+    return [[num] for num in nums]
+
+
+def worker_pids(nums):
+    """Return the pid of the process running each number."""
+    time.sleep(0.05)
+    return {num: os.getpid() for num in nums}
+
+
+def merge(partials):
+    """Merge dict partials."""
+    merged = {}
+    for partial in partials:
+        merged.update(partial)
+    return merged
+
+
+def slow_square_sum(nums):
+    """Sum squares of nums, slowly."""
+    time.sleep(0.2)
+    return sum(num * num for num in nums)
+
+
+async def async_square_sum(nums):
+    """Sum squares of nums, as a coroutine function."""
+    await asyncio.sleep(0.01)
+    return sum(num * num for num in nums)
+
+
+def failing(nums):
+    """Fail on odd numbers."""
+    if nums[0] % 2:
+        raise ValueError(f'odd {nums[0]}')
+    return nums[0]
+
+
+def crashing(nums):  # pylint: disable=W0613
+    """Kill the worker running it."""
+    os._exit(1)  # pylint: disable=W0212
+
+
+class TestRemote(unittest.TestCase):
+    """Run chunks on worker daemons connected over sockets."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Start a local cluster shared by the tests."""
+        cls.cluster = LocalCluster(num_workers=2, max_workers=2)
+        assert cls.cluster.wait_for_workers(2, timeout=10)
+
+    @classmethod
+    def tearDownClass(cls):
+        """Stop the cluster."""
+        cls.cluster.shutdown()
+
+    @async_test
+    async def test_distributed_over_workers(self):
+        """Test that chunks are spread over the worker processes."""
+        run = run_distributively(
+            'nums', chunk_per_num, merge,
+            executor=self.cluster)(worker_pids)
+        pids = await run(range(8))
+        self.assertEqual(sorted(pids), list(range(8)))
+        self.assertEqual(
+            set(pids.values()),
+            {process.pid for process in self.cluster.processes})
+
+    @async_test
+    async def test_coroutine_function(self):
+        """Test that coroutine functions run in the workers' loops."""
+        run = run_distributively(
+            'nums', chunk_per_num, sum,
+            executor=self.cluster)(async_square_sum)
+        self.assertEqual(await run(range(5)), 30)
+
+    @async_test
+    async def test_remote_exceptions(self):
+        """Test that worker exceptions come back with their traceback."""
+        run = run_distributively(
+            'nums', chunk_per_num, sum, executor=self.cluster,
+            success_policy=SuccessPolicy.EXPECT_ALL)(failing)
+        with self.assertRaises(MappedException) as context:
+            await run(range(4))
+        self.assertEqual(context.exception.num_exceptions, 2)
+        ex_desc = context.exception.ex_descriptors[0]
+        self.assertEqual(ex_desc['type'], str(ValueError))
+        ex = self.cluster.submit(failing, [1]).exception(timeout=10)
+        self.assertIsInstance(ex.__cause__, RemoteTraceback)
+        self.assertIn("raise ValueError(f'odd", str(ex.__cause__))
+
+
+class TestWorkerLoss(unittest.TestCase):
+    """Reassign the chunks of lost workers."""
+
+    @async_test
+    async def test_reassigned(self):
+        """Test that the chunks of a killed worker run elsewhere."""
+        with LocalCluster(num_workers=2) as cluster:
+            self.assertTrue(cluster.wait_for_workers(2, timeout=10))
+            run = run_distributively(
+                'nums', chunk_per_num, sum,
+                executor=cluster)(slow_square_sum)
+            call = asyncio.ensure_future(run(range(6)))
+            await asyncio.sleep(0.1)
+            cluster.processes[0].kill()
+            self.assertEqual(await call, 55)
+            self.assertEqual(cluster.num_workers, 1)
+
+    @async_test
+    async def test_max_assignments(self):
+        """Test that a call losing every worker it runs on fails."""
+        with LocalCluster(num_workers=3, max_assignments=2) as cluster:
+            self.assertTrue(cluster.wait_for_workers(3, timeout=10))
+            run = run_distributively(
+                'nums', chunk_per_num, sum, executor=cluster)(crashing)
+            with self.assertRaises(MappedException) as context:
+                await run([1])
+            self.assertEqual(
+                context.exception.ex_descriptors[0]['type'], str(WorkerLost))
+            self.assertEqual(cluster.num_workers, 1)
+
+    def test_unix_socket(self):
+        """Test that workers can connect over a Unix socket."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            address = os.path.join(tmp_dir, 'coordinator.sock')
+            with LocalCluster(num_workers=1, address=address) as cluster:
+                self.assertTrue(cluster.wait_for_workers(1, timeout=10))
+                self.assertEqual(
+                    cluster.submit(sum, [1, 2, 3]).result(timeout=10), 6)
+
+    def test_authentication(self):
+        """Test that workers must authenticate, by default with a random key."""
+        coordinator = Coordinator()
+        try:
+            self.assertEqual(len(coordinator.authkey), 64)
+            with Client(coordinator.address) as conn:
+                conn.send(('hello', 1, 'intruder'))
+                self.assertFalse(coordinator.wait_for_workers(1, timeout=0.2))
+            with self.assertRaises(AuthenticationError):
+                Client(coordinator.address, authkey=b'guessed')
+            self.assertEqual(coordinator.num_workers, 0)
+        finally:
+            coordinator.shutdown()
+
+    def test_daemon_authkey(self):
+        """Test that a daemon started from the command line authenticates
+        with the default key of the coordinator."""
+        coordinator = Coordinator()
+        env = dict(os.environ, ASYNCTD_AUTHKEY=coordinator.authkey.decode(),
+                   PYTHONPATH=os.pathsep.join(sys.path))
+        host, port = coordinator.address
+        with subprocess.Popen(
+                [sys.executable, '-m', 'asynctd.remote', f'{host}:{port}'],
+                env=env) as daemon:
+            try:
+                self.assertTrue(coordinator.wait_for_workers(1, timeout=10))
+                self.assertEqual(
+                    coordinator.submit(sum, [1, 2, 3]).result(timeout=10), 6)
+            finally:
+                coordinator.shutdown()
+                daemon.wait(timeout=10)
+
+    def test_submit_after_shutdown(self):
+        """Test that the coordinator rejects calls after shutdown."""
+        cluster = LocalCluster(num_workers=1)
+        cluster.shutdown()
+        with self.assertRaises(RuntimeError):
+            cluster.submit(sum, [1])
+        self.assertFalse(any(p.is_alive() for p in cluster.processes))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+"""Test the shared memory transport of chunks."""
+
+import array
+import unittest
+from multiprocessing.shared_memory import SharedMemory
+
+try:
+    import numpy
+except ImportError:  # optional
+    numpy = None
+
+from helpers import async_test
+
+from asynctd import transport
+from asynctd.task_distributor import ExecutionBackend, run_distributively
+
+
+def halves(data):
+    """Divide a sequence in two views."""
+    middle = len(data) // 2
+    return [data[:middle], data[middle:]]
+
+
+def describe(data, table=b''):
+    """Describe a chunk as seen by the worker."""
+    return [(type(data).__name__, data.readonly, sum(data), len(table))]
+
+
+def lookup_sum(data, table):
+    """Sum the bytes of table at the positions in data."""
+    return sum(table[i % len(table)] for i in data)
+
+
+class TestSharedMemoryTransport(unittest.TestCase):
+    """Ship chunks through shared memory."""
+
+    def test_views_shipped_as_references(self):
+        """Test that views of a shared buffer aren't copied."""
+        data = bytes(range(256)) * 4096
+        with transport.SharedMemoryTransport() as shared:
+            view = shared.share(data)
+            self.assertIsInstance(view, memoryview)
+            payload, buffer_refs = shared.dumps(((view[1000:],), {}))
+            self.assertLess(len(payload), 200)
+            self.assertEqual(buffer_refs, [])
+            attached = {}
+            (chunk,), _ = transport.loads(payload, buffer_refs, attached)
+            self.assertTrue(chunk.readonly)
+            self.assertEqual(chunk.tobytes(), data[1000:])
+            del chunk
+            transport.release(attached)
+            name = shared.segments[0].shm.name
+            del view
+        with self.assertRaises(FileNotFoundError):
+            SharedMemory(name)
+
+    def test_typed_views(self):
+        """Test that typed buffers keep their format."""
+        numbers = array.array('d', [0.5 * i for i in range(1000)])
+        with transport.SharedMemoryTransport() as shared:
+            view = shared.share(numbers)
+            self.assertEqual(view.format, 'd')
+            attached = {}
+            chunk = transport.loads(
+                *shared.dumps(view[10:20]), attached)
+            self.assertEqual(chunk.tolist(), numbers[10:20].tolist())
+            del chunk, view
+            transport.release(attached)
+
+    def test_other_values(self):
+        """Test that values other than buffers aren't shared."""
+        with transport.SharedMemoryTransport() as shared:
+            values = [1, 2, 3]
+            self.assertIs(shared.share(values), values)
+            self.assertEqual(shared.share(b''), b'')
+            self.assertEqual(shared.segments, [])
+            payload, _ = shared.dumps((values, {'key': b'small'}))
+            self.assertEqual(
+                transport.loads(payload, [], {}), (values, {'key': b'small'}))
+
+    def test_large_arguments_shared_once(self):
+        """Test that large buffers of other args are copied once."""
+        table = bytearray(range(256)) * 1024
+        with transport.SharedMemoryTransport() as shared:
+            first, _ = shared.dumps(((1,), {'table': table}))
+            second, _ = shared.dumps(((2,), {'table': table}))
+            self.assertLess(len(first) + len(second), 400)
+            self.assertEqual(len(shared.segments), 1)
+            attached = {}
+            _, kwargs = transport.loads(second, [], attached)
+            self.assertEqual(kwargs['table'], table)
+            self.assertIsInstance(kwargs['table'], bytearray)
+            transport.release(attached)
+
+    @unittest.skipUnless(numpy, 'NumPy is not installed')
+    def test_ndarrays(self):
+        """Test that shared NumPy arrays are shipped as references and
+        other large arrays out-of-band through shared memory."""
+        data = numpy.arange(100000, dtype=numpy.int64)
+        table = numpy.linspace(0, 1, 100000)
+        with transport.SharedMemoryTransport() as shared:
+            view = shared.share(data)
+            self.assertIsInstance(view, numpy.ndarray)
+            payload, buffer_refs = shared.dumps(((view[10:20],), {}))
+            self.assertLess(len(payload), 300)
+            self.assertEqual(buffer_refs, [])
+            payload, buffer_refs = shared.dumps(((1,), {'table': table}))
+            self.assertLess(len(payload), 300)
+            self.assertEqual(len(buffer_refs), 1)
+            self.assertEqual(len(shared.segments), 2)
+            attached = {}
+            (chunk,), _ = transport.loads(*shared.dumps(
+                ((view[10:20],), {})), attached)
+            self.assertFalse(chunk.flags.writeable)
+            self.assertEqual(chunk.tolist(), list(range(10, 20)))
+            _, kwargs = transport.loads(payload, buffer_refs, attached)
+            self.assertTrue(numpy.array_equal(kwargs['table'], table))
+            del chunk, kwargs, view
+            transport.release(attached)
+
+    @async_test
+    async def test_process_backend(self):
+        """Test that process workers get read-only shared views."""
+        run = run_distributively(
+            'data', halves, lambda partials: sorted(sum(partials, [])),
+            backend=ExecutionBackend.PROCESS, max_workers=2,
+            shared_memory=True)(describe)
+        data = bytes(range(100)) * 1000
+        table = bytes(100000)
+        self.assertEqual(await run(data, table), [
+            ('memoryview', True, sum(data) // 2, 100000)] * 2)
+
+    @async_test
+    async def test_same_results(self):
+        """Test that the transport doesn't change the results."""
+        data = array.array('i', range(10000))
+        table = bytes(range(256)) * 512
+        results = []
+        for shared_memory in (False, True):
+            run = run_distributively(
+                'data', halves, sum, backend=ExecutionBackend.PROCESS,
+                max_workers=2, shared_memory=shared_memory)(lookup_sum)
+            results.append(await run(data, table))
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[0], lookup_sum(data, table))
+
+
+if __name__ == '__main__':
+    unittest.main()